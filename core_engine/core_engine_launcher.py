@@ -12,9 +12,10 @@ import threading
 import time
 from queue import Queue, Empty
 
-from core_engine.events import apply_event, remove_old_events
+from core_engine.events import EventLog, apply_event, remove_old_events
 from core_engine.parking_state import ParkingState
 from core_engine.rules import RulesManager
+from core_engine.timers import Timers
 from utils.mosquitto_utils import start_messages_consumption
 from utils.thread_utils import StopEvent
 
@@ -31,10 +32,14 @@ def get_file_configuration():
 
     file_options.setdefault('mq_host', 'mosquitto')
     file_options.setdefault('mq_port', 1883)
+    file_options.setdefault('mq_qos', 0)
     file_options.setdefault('video_plugin_topics', ['/plugins/video'])
     file_options.setdefault('gate_plugin_topic', '/plugins/gate')
     file_options.setdefault('output_topic', '/engine')
     file_options.setdefault('static_metadata', {})
+    file_options.setdefault('health_check_interval', 5.0)
+    file_options.setdefault('publish_interval', None)
+    file_options.setdefault('batch', {})
 
     return file_options
 
@@ -49,8 +54,134 @@ def get_reservations():
         return json.load(json_reservation_file)
 
 
+class CoreEngine:
+    """ State of the Core Engine and the work done on messages and timers.
+    """
+    def __init__(self, options, rules_manager):
+        """
+        :param options: dict of configuration values
+        :param rules_manager: RulesManager object
+        """
+        self.options = options
+        self.rules_manager = rules_manager
+        self.parking_state = None
+        self.events = EventLog()
+        self.reservations = {}
+
+    def refresh_reservations(self):
+        """ Reload reservations (used by the parking state created next).
+        """
+        self.reservations = get_reservations()
+
+    def handle(self, message):
+        """ Apply a message and publish the new state.
+
+        :param message: MQ message
+        """
+        if self.apply(message):
+            logger.debug('Removing old event')
+            self.expire_events()
+            logger.debug('Calculating and sending new event')
+            self.publish()
+            logger.debug('Finished processing event')
+
+    def handle_batch(self, message, messages, max_size, max_latency):
+        """ Apply a message and messages queued after it in order, then
+        publish a single state for all of them.
+
+        :param message: MQ message
+        :param messages: Queue of MQ messages
+        :param max_size: maximum number of messages in a batch
+        :param max_latency: maximum time spent on a batch before the state
+            is published, in seconds
+        :return: number of messages applied
+        """
+        deadline = time.time() + max_latency
+        applied = False
+        count = 0
+        while True:
+            applied = self.apply(message) or applied
+            messages.task_done()
+            count += 1
+            if count >= max_size or time.time() >= deadline:
+                break
+            try:
+                message = messages.get_nowait()
+            except Empty:
+                break
+
+        if applied:
+            self.expire_events()
+            self.publish()
+        logger.debug('Applied a batch of %s messages', count)
+        return count
+
+    def apply(self, message):
+        """ Apply a message to the parking state and events.
+
+        :param message: MQ message
+        :return: True if the message was applied
+        """
+        try:
+            logger.debug('Received a message from MQ: %s', message.payload)
+            data = json.loads(message.payload)
+
+            if (not self.parking_state and
+                    message.topic in self.options['video_plugin_topics']):
+                logger.info('Initialising parking state')
+                self.parking_state = ParkingState(data, self.reservations,
+                                                  self.options['windowing'])
+            if self.parking_state:
+                logger.debug('Applying event')
+                apply_event(self.events, data, message.topic,
+                            self.parking_state, self.options)
+                return True
+        except ValueError as exc:
+            logger.warning('Received an invalid message format from MQ. '
+                           'Topic: %s, message: %s, error: %s, %s',
+                           message.topic, message.payload, type(exc), exc)
+        return False
+
+    def expire_events(self):
+        """ Remove events older than the TTL.
+
+        :return: number of removed events
+        """
+        return remove_old_events(self.events, self.options['event_ttl'])
+
+    def expire_and_publish(self):
+        """ Remove events older than the TTL and publish the state if any
+        were removed: expired events change the state without a message.
+        """
+        if self.expire_events():
+            self.publish()
+
+    def expiry_timeout(self, now):
+        """ Time left until the oldest event expires.
+
+        :param now: current time, in seconds
+        :return: seconds or None if there are no events
+        """
+        oldest = self.events.oldest()
+        if oldest is None:
+            return None
+        return max(oldest.time + self.options['event_ttl'] - now, 0)
+
+    def publish(self):
+        """ Publish the current state, if there is one.
+        """
+        if self.parking_state:
+            self.rules_manager.calculate_and_send_state(self.events,
+                                                        self.parking_state)
+
+
 def main():
     """ Entry point.
+
+    Waits for messages, blocking until one arrives or timer-driven work
+    (reservations refresh, events expiry, health check and optional
+    periodic publishing) is due.  In batch mode messages queued up during
+    a burst are applied together and a single state is published for them.
     """
     options = get_file_configuration()
     messages = Queue(maxsize=0)
@@ -73,53 +204,10 @@ def main():
         host=options['mq_host'],
         port=options['mq_port'])
     stop_event = threading.Event()
-    rules_manager = RulesManager(options)
-
-    parking_state = None
-    events = []  # sorted by time, first element of list should be the newest
-    reservations = {}
-    reservations_refresh_time = 0
-
-    while True:
-        start_time = time.time()
-        if (start_time - reservations_refresh_time >
-                options['reservations_refresh_duration']):
-            reservations = get_reservations()
-            reservations_refresh_time = start_time
-
-        try:
-            logger.debug('Trying to get a message from MQ')
-            message = messages.get_nowait()
-
-            try:
-                logger.debug('Received a message from MQ: %s', message.payload)
-                data = json.loads(message.payload)
-
-                if (not parking_state and
-                        message.topic in options['video_plugin_topics']):
-                    logger.info('Initialising parking state')
-                    parking_state = ParkingState(data, reservations,
-                                                 options['windowing'])
-                if parking_state:
-                    logger.debug('Applying event')
-                    apply_event(events, data, message.topic, parking_state,
-                                options)
-                    logger.debug('Removing old event')
-                    remove_old_events(events, options['event_ttl'])
-                    logger.debug('Calculating and sending new event')
-                    rules_manager.calculate_and_send_state(events,
-                                                           parking_state)
-                    logger.debug('Finished processing event')
-            except ValueError as exc:
-                logger.warning('Received an invalid message format from MQ. '
-                               'Topic: %s, message: %s, error: %s, %s',
-                               message.topic, message.payload, type(exc), exc)
-
-            messages.task_done()
-        except Empty:
-            logger.debug('MQ is empty, sleeping')
-            time.sleep(options['sleep_duration'])
+    engine = CoreEngine(options, RulesManager(options))
+    batch_options = options['batch']
 
+    def check_workers():
         if (not video_plugin_worker.is_alive() or
                 not gate_plugin_worker.is_alive()):
             raise RuntimeError('One or more MQ client threads are dead. '
@@ -127,10 +215,38 @@ def main():
                                .format(video_plugin_worker.is_alive(),
                                        gate_plugin_worker.is_alive()))
 
-        if stop_event.is_set():
-            gate_plugin_workers_events.put(StopEvent())
-            video_plugin_workers_events.put(StopEvent())
-            break
+    start_time = time.time()
+    timers = Timers()
+    timers.every(options['reservations_refresh_duration'],
+                 engine.refresh_reservations, start_time)
+    timers.every(options['health_check_interval'], check_workers, start_time)
+    if options['publish_interval']:
+        timers.every(options['publish_interval'], engine.publish,
+                     start_time + options['publish_interval'])
+
+    while not stop_event.is_set():
+        now = time.time()
+        timers.run_due(now)
+        engine.expire_and_publish()
+
+        timeouts = [timeout for timeout in (timers.timeout(now),
+                                            engine.expiry_timeout(now))
+                    if timeout is not None]
+        try:
+            message = messages.get(timeout=min(timeouts))
+        except Empty:
+            continue
+
+        if batch_options.get('enabled', False):
+            engine.handle_batch(message, messages,
+                                batch_options.get('max_size', 100),
+                                batch_options.get('max_latency', 0.5))
+        else:
+            engine.handle(message)
+            messages.task_done()
+
+    gate_plugin_workers_events.put(StopEvent())
+    video_plugin_workers_events.put(StopEvent())
 
 
 if __name__ == '__main__':
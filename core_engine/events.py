@@ -2,6 +2,7 @@
 """
 import logging
 import time
+from collections import deque
 
 from core_engine.parking_state import GATE_ENTERED_STATUS, PLACE_STATUS
 
@@ -13,6 +14,7 @@ class Event:
     """
     def __init__(self):
         self.time = time.time()
+        self.removed = False
 
 
 class GateEvent(Event):
@@ -53,10 +55,99 @@ class ExitedParkingPlace(PlaceEvent):
     """
 
 
+class EventLog:
+    """ Parking events ordered by time.
+
+    Events live in a deque, the oldest one first.  Counters of events of
+    each type are kept on append and removal.  Events which can pair an
+    expiring event (see `remove_oldest`) are indexed in a deque of their
+    own, so the pair is found without a scan.  Paired events are only
+    marked as removed and dropped when they reach the front of the deques,
+    which keeps every operation amortized O(1).
+    """
+    # The oldest of these events removes a paired event with it
+    PAIRED = (EnteredThroughGate, ExitedParkingPlace)
+    PAIRS = (ExitedThroughGate, EnteredParkingPlace)
+
+    def __init__(self):
+        self.events = deque()
+        self.pairs = deque()
+        self.counts = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """ Iterate over events, the newest one first.
+        """
+        return (event for event in reversed(self.events) if not event.removed)
+
+    def append(self, event):
+        """ Add the newest event.
+
+        :param event: Event object
+        """
+        self.events.append(event)
+        if isinstance(event, self.PAIRS):
+            self.pairs.append(event)
+        self.counts[type(event)] = self.counts.get(type(event), 0) + 1
+        self.size += 1
+
+    def count(self, event_type):
+        """ Number of events of a type.
+
+        :param event_type: Event subclass
+        :return: number of events
+        """
+        return self.counts.get(event_type, 0)
+
+    def oldest(self):
+        """ The oldest event.
+
+        :return: Event object or None if there are no events
+        """
+        self._drop_removed(self.events)
+        return self.events[0] if self.events else None
+
+    def remove_oldest(self):
+        """ Remove the oldest event.  If it is a car entering through the
+        gate or exiting a parking place, the oldest car exiting through
+        the gate or entering a parking place is removed with it, unless
+        that is the newest event.
+        """
+        latest = self.oldest()
+        self.events.popleft()
+        self._remove(latest)
+
+        if isinstance(latest, self.PAIRED):
+            self._drop_removed(self.pairs)
+            if self.pairs and self.pairs[0] is not self.events[-1]:
+                self._remove(self.pairs[0])
+
+    def _remove(self, event):
+        """ Mark an event as removed and count it out.
+
+        :param event: Event object
+        """
+        event.removed = True
+        self.counts[type(event)] -= 1
+        self.size -= 1
+
+    @staticmethod
+    def _drop_removed(events):
+        """ Drop removed events from the front of a deque.
+
+        :param events: deque of events
+        """
+        while events and events[0].removed:
+            events.popleft()
+
+
 def apply_event(events, data, topic, parking_state, options):
     """ Apply parking events and update the parking state.
 
-    :param events: list of parking events
+    :param events: EventLog object
     :param data: content of the message
     :param topic: topic name
     :param parking_state: parking state object
@@ -64,24 +155,21 @@ def apply_event(events, data, topic, parking_state, options):
     """
     if topic == options['gate_plugin_topic']:
         if data['entered'] == GATE_ENTERED_STATUS['ENTERED']:
-            events.insert(0, EnteredThroughGate())
+            events.append(EnteredThroughGate())
         elif data['entered'] == GATE_ENTERED_STATUS['EXITED']:
-            events.insert(0, ExitedThroughGate())
+            events.append(ExitedThroughGate())
         else:
             raise RuntimeError('Unsupported barrier "entered" value. MQ event - {}'.format(data))
     elif topic in options['video_plugin_topics']:
-        state_diff = parking_state.state_diff(data['parking_places'])
-
-        if state_diff:
-            for place_id in state_diff:
-                if parking_state.state[place_id].reservation_state is not None:
-                    continue
-                elif parking_state.state[place_id].state == PLACE_STATUS['FREE']:
-                    events.insert(0, EnteredParkingPlace(place_id))
-                else:
-                    events.insert(0, ExitedParkingPlace(place_id))
-
-        parking_state.set_parking_new_state(data)
+        state_diff = parking_state.set_parking_new_state(data)
+
+        for place_id, previous_state in state_diff.items():
+            if parking_state.state[place_id].reservation_state is not None:
+                continue
+            elif previous_state == PLACE_STATUS['FREE']:
+                events.append(EnteredParkingPlace(place_id))
+            else:
+                events.append(ExitedParkingPlace(place_id))
     else:
         raise RuntimeError('Received a message from unknown topic: {}'.format(topic))
 
@@ -89,33 +177,22 @@ def apply_event(events, data, topic, parking_state, options):
 def remove_last_event(events):
     """ Remove last event from the list.
 
-    :param events: list of parking events
+    :param events: EventLog object
     """
-    latest = events[-1]
-    pair_event_index = None
-    if isinstance(latest, (EnteredThroughGate, ExitedParkingPlace)):
-        for i, event in reversed(list(enumerate(events))):
-            if isinstance(event, (ExitedThroughGate, EnteredParkingPlace)):
-                pair_event_index = i
-                break
-
-    del events[-1]
-    if pair_event_index:
-        del events[pair_event_index]
+    events.remove_oldest()
 
 
 def remove_old_events(events, event_ttl):
     """ Remove all events from the list older than a TTL value.
 
-    :param events: list of parking events
+    :param events: EventLog object
     :param event_ttl: TTL value (in seconds)
+    :return: number of removed events
     """
-    if events:
-        latest = events[-1]
-        threshold = time.time() - event_ttl
-        while latest.time < threshold:
-            remove_last_event(events)
-            if events:
-                latest = events[-1]
-            else:
-                break
+    count = len(events)
+    threshold = time.time() - event_ttl
+    latest = events.oldest()
+    while latest is not None and latest.time < threshold:
+        events.remove_oldest()
+        latest = events.oldest()
+    return count - len(events)
@@ -4,7 +4,9 @@
 import time
 import logging
 
-from core_engine.windowing import create_windowing_manager
+import numpy as np
+
+from core_engine.windowing import WindowingEngine
 
 PLACE_STATUS = {
     'FREE': 0,
@@ -25,34 +27,23 @@ logger = logging.getLogger('core_engine')
 class ParkingPlace:
     """ Individual parking place.
     """
-    def __init__(self, state, sigmoid, windowing_options,
-                 reservation_state=None):
+    def __init__(self, state, sigmoid, reservation_state=None):
         """
         :param state: parking state (0 or 1 - see PLACE_STATUS values)
         :param sigmoid: occupied probability in range 0..1
-        :param windowing_options: dict of windowing configuration
         :param reservation_state: reservation state (2, 3 or 4 - see
             PLACE_STATUS values) or None
         """
         self.state = state
-        self.windowing_strategy = create_windowing_manager(windowing_options)
         self.reservation_state = reservation_state
         self.sigmoid_value = sigmoid
 
-    def set_new_state(self, state, sigmoid, reservation_state=None):
+    def set_new_state(self, fixed_state):
         """ Set new parking state.
 
-        :param state: parking state (0 or 1 - see PLACE_STATUS values)
-        :param sigmoid: occupied probability in range 0..1
-        :param reservation_state: reservation state (2, 3 or 4 - see
-            PLACE_STATUS values) or None
+        :param fixed_state: windowed class of the place: 1 - free,
+            2 - occupied, 0 - undefined (see windowing.py)
         """
-        self.state = state
-        if reservation_state:
-            self.reservation_state = reservation_state
-
-        fixed_state = self.windowing_strategy.apply(sigmoid)
-
         if fixed_state == 1:
             self.sigmoid_value = 0.0
         elif fixed_state == 2:
@@ -68,6 +59,10 @@ class ParkingPlace:
 
 class ParkingState:
     """ Overall parking state.
+
+    Places are updated incrementally: only places whose windowed class
+    changed are touched, and counters of free, occupied and free reserved
+    places follow their state changes, so aggregates are read in O(1).
     """
     def __init__(self, data, reservations, windowing_options):
         """
@@ -75,60 +70,87 @@ class ParkingState:
         :param reservations: dict of reservations
         :param windowing_options: dict of windowing configuration
         """
-        self.video_plugin_data = data
         self.reservations = reservations
-        self.windowing_options = windowing_options
-        self.update_time = time.time()
+        self.windowing = WindowingEngine(windowing_options)
+        # Windowed classes by windowing rows, -1 before the first one
+        self.fixed_states = np.full(0, -1, dtype=np.int64)
         self.state = {}
-        self.__init_parking_state(data['parking_places'].copy())
-
-    def __init_parking_state(self, video_plugin_parking_places):
-        start_time = time.time()
         self.general_purpose_places = 0
-        for place_id in video_plugin_parking_places:
-            if place_id in self.reservations:
-                reservation_state = self.reservations[place_id]
-                state = video_plugin_parking_places[place_id][0]
-                prob = video_plugin_parking_places[place_id][1]
-                self.update_or_create_parking_place(place_id, state, prob, reservation_state)
-            else:
-                model_state = video_plugin_parking_places[place_id][0]
-                model_prob = video_plugin_parking_places[place_id][1]
-                self.update_or_create_parking_place(place_id, model_state, model_prob)
-                self.general_purpose_places += 1
-        logger.info('Parking state and Windows calculation took %f sec', time.time() - start_time)
+        self.free = 0
+        self.occupied = 0
+        self.reserved_free = 0
+        self.set_parking_new_state(data)
 
     def set_parking_new_state(self, data):
         """ Set new parking state.
 
         :param data: content of the message from Model Engine
+        :return: dict of IDs of known parking places whose state in the
+            message differs from their current state, mapped to the current
+            state
         """
+        start_time = time.time()
         self.video_plugin_data = data
-        self.update_time = time.time()
-        self.__init_parking_state(data['parking_places'].copy())
+        self.update_time = start_time
+        diff = {}
+        updated_places = []
+        updated_probs = []
+        for place_id, status in data['parking_places'].items():
+            place = self.state.get(place_id)
+            if place is None:
+                self._add_place(place_id, status[0], status[1])
+                continue
+
+            if status[0] != place.state:
+                diff[place_id] = place.state
+            updated_places.append(place_id)
+            updated_probs.append(float(status[1]))
+
+        # Windows of all updated places are updated at once, places are
+        # touched only if their windowed class changed
+        if updated_places:
+            rows = self.windowing.rows(updated_places)
+            fixed_states = self.windowing.apply(rows, updated_probs)
+            if len(self.fixed_states) < len(self.windowing.samples):
+                self.fixed_states = np.concatenate([
+                    self.fixed_states,
+                    np.full(len(self.windowing.samples) -
+                            len(self.fixed_states), -1, dtype=np.int64)])
+            changed = np.flatnonzero(self.fixed_states[rows] != fixed_states)
+            self.fixed_states[rows] = fixed_states
+            for index in changed:
+                place_id = updated_places[index]
+                place = self.state[place_id]
+                self._count(place_id, place.state, -1)
+                place.set_new_state(fixed_states[index])
+                self._count(place_id, place.state, 1)
+        logger.info('Parking state and Windows calculation took %f sec', time.time() - start_time)
+        return diff
 
-    def update_or_create_parking_place(self, place_id, state, prob, reservation_state=None):
-        """ Update or create new parking place.
+    def _add_place(self, place_id, state, prob):
+        """ Add a new parking place.
 
         :param place_id: parking place ID
-        :param state: new parking state (0 or 1 - see PLACE_STATUS values)
+        :param state: parking state (0 or 1 - see PLACE_STATUS values)
         :param prob: occupied probability in range 0..1
-        :param reservation_state: reservation state (2, 3 or 4 - see
-            PLACE_STATUS values) or None
         """
-        if place_id in self.state:
-            self.state[place_id].set_new_state(state, prob, reservation_state)
-        else:
-            self.state[place_id] = ParkingPlace(state,
-                                                prob,
-                                                self.windowing_options,
-                                                reservation_state)
+        reservation_state = self.reservations.get(place_id)
+        if reservation_state is None:
+            self.general_purpose_places += 1
+        self.state[place_id] = ParkingPlace(state, prob, reservation_state)
+        self._count(place_id, state, 1)
 
-    def state_diff(self, new_state):
-        """ Analyze differences between old and new states.
+    def _count(self, place_id, state, delta):
+        """ Update counters for a parking place entering (delta 1) or
+        leaving (delta -1) a state.
 
-        :param new_state: dict of new parking states
-        :return: set of parking place IDs where parking state changed
+        :param place_id: parking place ID
+        :param state: parking state (see PLACE_STATUS values)
+        :param delta: 1 or -1
         """
-        return set(k for k in new_state if k in self.state
-                   and new_state[k][0] != self.state[k].state)
+        if state == PLACE_STATUS['FREE']:
+            self.free += delta
+            if place_id in self.reservations:
+                self.reserved_free += delta
+        else:
+            self.occupied += delta
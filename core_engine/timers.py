@@ -0,0 +1,50 @@
+""" Timer-driven work of the Core Engine main loop.
+"""
+import heapq
+import itertools
+
+
+class Timers:
+    """ Periodic tasks run between blocking waits for messages.
+
+    The main loop waits for a message at most `timeout` seconds and calls
+    `run_due` after every wake-up, so tasks run on time without checking
+    each of them on every pass.
+    """
+    def __init__(self):
+        self._tasks = []
+        self._order = itertools.count()
+
+    def every(self, interval, callback, start):
+        """ Schedule a periodic task.
+
+        :param interval: interval between runs, in seconds
+        :param callback: function without arguments
+        :param start: time of the first run, in seconds
+        """
+        heapq.heappush(self._tasks,
+                       (start, next(self._order), interval, callback))
+
+    def timeout(self, now):
+        """ Time left until the next task.
+
+        :param now: current time, in seconds
+        :return: seconds (0 if a task is due) or None if there are no tasks
+        """
+        if not self._tasks:
+            return None
+        return max(self._tasks[0][0] - now, 0)
+
+    def run_due(self, now):
+        """ Run tasks which are due and schedule their next runs.  A task
+        late by more than its interval runs once, not once per missed run.
+
+        :param now: current time, in seconds
+        """
+        while self._tasks and self._tasks[0][0] <= now:
+            due, order, interval, callback = heapq.heappop(self._tasks)
+            due += interval
+            if due <= now:
+                due = now + interval
+            heapq.heappush(self._tasks, (due, order, interval, callback))
+            callback()
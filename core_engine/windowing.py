@@ -1,97 +1,169 @@
 """ Helper classes and functions for windowing functionality.
+
+WindowingEngine keeps windows of all parking places in ring buffers
+(places x window size) and applies a message to all of its places with
+a few numpy operations.  WindowingManager subclasses are windows of
+a single place on top of it.
 """
 import logging
 import numpy as np
 
 logger = logging.getLogger('core_engine')
 
+STRATEGIES = ('most_freq', 'most_freq_of_max', 'none')
+# Class values: 1 - place is free, 2 - place is occupied,
+# 0 - place is undefined, -1 marks empty window entries
+CLASSES = 3
+EMPTY = -1
+
+
+def check_strategy(strategy):
+    if strategy not in STRATEGIES:
+        raise ValueError(
+            'Wrong windowing strategy "{}" in "windowing.strategy" option '
+            'from config file. Should be one of values: "most_freq", '
+            '"most_freq_of_max", "none"'.format(strategy))
+
 
 def create_windowing_manager(windowing_options):
+    check_strategy(windowing_options['strategy'])
     if windowing_options['strategy'] == 'most_freq':
         return MostFreqStrategy(windowing_options)
 
     if windowing_options['strategy'] == 'most_freq_of_max':
         return MostFreqOfMaxStrategy(windowing_options)
 
-    if windowing_options['strategy'] == 'none':
-        return NoneStrategy(windowing_options)
+    return NoneStrategy(windowing_options)
 
-    raise ValueError(
-        'Wrong windowing strategy "{}" in "windowing.strategy" option from '
-        'config file. Should be one of values: "most_freq", '
-        '"most_freq_of_max", "none"'.format(windowing_options['strategy']))
 
+class WindowingEngine:
+    """ Windows of all parking places.
 
-class WindowingManager:
-    def __init__(self, options):
+    Every place has a row in ring buffers of sigmoids, classes of their
+    medians and maximum classes, the column of the next sample
+    is the number of samples applied modulo the window size.
+    """
+    def __init__(self, options, capacity=64):
+        """
+        :param options: dict of windowing configuration
+        :param capacity: initial number of rows, grows when needed
+        :raise ValueError: in case the strategy is unknown
+        """
+        check_strategy(options['strategy'])
+        self.strategy = options['strategy']
         self.window_size = options['window_size']
         self.defined_min = options['defined_min']
         self.defined_max = options['defined_max']
-        self.sigmoid_list = []
-        self.medians = []
-        self.batch_class = []
-
-    def apply(self, sigmoid):
-        if len(self.sigmoid_list) < self.window_size:
-            self.sigmoid_list = np.append(self.sigmoid_list, float(sigmoid))
-        else:
-            self.sigmoid_list = np.insert(self.sigmoid_list[1:],
-                                          len(self.sigmoid_list) - 1,
-                                          float(sigmoid))
-
-        self._modify_medians()
-        self._modify_batch_class()
+        self.place_rows = {}
+        shape = (capacity, self.window_size)
+        self.sigmoids = np.full(shape, np.nan)
+        self.classes = np.full(shape, EMPTY, dtype=np.int8)
+        self.max_classes = np.full(shape, EMPTY, dtype=np.int8)
+        self.samples = np.zeros(capacity, dtype=np.int64)
+
+    def rows(self, place_ids):
+        """ Find rows of parking places, adding rows of new places.
+
+        :param place_ids: iterable of parking place IDs
+        :return: numpy array of row indexes
+        """
+        rows = np.array([self.place_rows.setdefault(place_id,
+                                                    len(self.place_rows))
+                         for place_id in place_ids], dtype=np.intp)
+        if len(self.place_rows) > len(self.samples):
+            self._grow(len(self.place_rows))
+        return rows
 
-        return self._apply_strategy()
+    def _grow(self, size):
+        """ Make room for at least `size` rows.
 
-    def _apply_strategy(self):
-        """Called after apply, should be implemented in subclasses"""
+        :param size: number of rows needed
+        """
+        capacity = max(size, 2 * len(self.samples))
+        extra = capacity - len(self.samples)
+        shape = (extra, self.window_size)
+        self.sigmoids = np.vstack([self.sigmoids, np.full(shape, np.nan)])
+        self.classes = np.vstack([self.classes,
+                                  np.full(shape, EMPTY, dtype=np.int8)])
+        self.max_classes = np.vstack([self.max_classes,
+                                      np.full(shape, EMPTY, dtype=np.int8)])
+        self.samples = np.concatenate([self.samples,
+                                       np.zeros(extra, dtype=np.int64)])
+
+    def classify(self, values):
+        """ Classes of values: 1 below `defined_min`, 2 above `defined_max`,
+        0 in between.
+
+        :param values: numpy array of sigmoids or medians
+        :return: int8 numpy array of classes
+        """
+        return np.where(values < self.defined_min, 1,
+                        np.where(values > self.defined_max, 2,
+                                 0)).astype(np.int8)
 
-    def _modify_medians(self):
-        median = np.median(self.sigmoid_list)
-        if len(self.medians) < self.window_size:
-            self.medians = np.append(self.medians, median)
-        else:
-            self.medians = np.insert(self.medians[1:], len(self.medians) - 1, median)
+    def apply(self, rows, sigmoids):
+        """ Add a sample to windows of parking places.
 
-    def _modify_batch_class(self):
+        :param rows: numpy array of distinct row indexes (see `rows`)
+        :param sigmoids: occupied probabilities of the places in range 0..1
+        :return: numpy array of windowed classes of the places
         """
-        Define classes, class values: 1 - place is free, 2 - place is occupied,
-        0 - place is undefined
+        sigmoids = np.asarray(sigmoids, dtype=np.float64)
+        if self.strategy == 'none':
+            return self.classify(sigmoids)
+
+        columns = self.samples[rows] % self.window_size
+        self.samples[rows] += 1
+        self.sigmoids[rows, columns] = sigmoids
+
+        # Empty entries (NaN) are sorted last, the median is the middle
+        # one of filled entries or the mean of the two middle ones
+        window = np.sort(self.sigmoids[rows], axis=1)
+        filled = np.minimum(self.samples[rows], self.window_size)
+        lower = np.take_along_axis(window, ((filled - 1) // 2)[:, None], 1)
+        upper = np.take_along_axis(window, (filled // 2)[:, None], 1)
+        medians = ((lower + upper) / 2)[:, 0]
+        self.classes[rows, columns] = self.classify(medians)
+
+        if self.strategy == 'most_freq':
+            return self._most_frequent(self.classes[rows])
+
+        self.max_classes[rows, columns] = self.classes[rows].max(axis=1)
+        return self._most_frequent(self.max_classes[rows])
+
+    @staticmethod
+    def _most_frequent(classes):
+        """ Most frequent class of each row, the lowest one of equally
+        frequent classes.
+
+        :param classes: numpy array of classes, EMPTY for empty entries
+        :return: numpy array of classes
         """
-        self.batch_class = \
-            [1 if x < self.defined_min else (2 if x > self.defined_max else 0)
-             for x in self.medians]
-
+        counts = (classes[:, :, None] == np.arange(CLASSES)).sum(axis=1)
+        return counts.argmax(axis=1)
 
-class MostFreqStrategy(WindowingManager):
-    def _apply_strategy(self):
-        return np.argmax(np.bincount(self.batch_class))
 
+class WindowingManager:
+    """ Window of a single parking place.
+    """
+    strategy = None
 
-class MostFreqOfMaxStrategy(WindowingManager):
     def __init__(self, options):
-        super(MostFreqOfMaxStrategy, self).__init__(options)
-        self.batch_class_max = np.array([]).astype(int)
+        self.engine = WindowingEngine(dict(options, strategy=self.strategy),
+                                      capacity=1)
+        self.row = self.engine.rows([None])
+
+    def apply(self, sigmoid):
+        return int(self.engine.apply(self.row, [float(sigmoid)])[0])
 
-    def _apply_strategy(self):
-        max_v = np.max(self.batch_class)
-        if np.size(self.batch_class_max) < self.window_size:
-            self.batch_class_max = np.append(self.batch_class_max, max_v)
-        else:
-            self.batch_class_max = np.insert(self.batch_class_max[1:],
-                                             len(self.batch_class_max) - 1,
-                                             max_v)
 
-        return np.argmax(np.bincount(self.batch_class_max))
+class MostFreqStrategy(WindowingManager):
+    strategy = 'most_freq'
 
 
-class NoneStrategy(WindowingManager):
-    def apply(self, sigmoid):
-        if sigmoid < self.defined_min:
-            return 1
+class MostFreqOfMaxStrategy(WindowingManager):
+    strategy = 'most_freq_of_max'
 
-        if sigmoid > self.defined_max:
-            return 2
 
-        return 0
+class NoneStrategy(WindowingManager):
+    strategy = 'none'
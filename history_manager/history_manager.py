@@ -3,6 +3,12 @@ History manager.
 
 Sends old images to Archive Store and removes them from Operational Store.
 
+Frames read by the model from the frame ring (see utils/frame_ring.py) are
+not stored as files, the ones to archive are read from the ring and saved
+as PNG files, the ring itself overwrites old frames.  Frames of the frame
+store (see utils/frame_store.py) are archived as other images, but old ones
+are removed by the store.
+
 Run: python history_manager.py <configuration_file.json>
 """
 import re
@@ -19,6 +25,7 @@ import os
 import sys
 import time
 
+from utils.frame_ring import FrameRing, write_png
 from utils.logging_utils import create_logger
 from utils.mosquitto_utils import start_messages_consumption
 from utils.thread_utils import StopEvent
@@ -33,6 +40,7 @@ STRATEGIES = {
 DayRange = namedtuple('DayRange', ['start_m', 'end_m'])
 
 skipped = 0
+frame_ring = None
 
 
 def get_cli_configuration():
@@ -75,6 +83,12 @@ def get_cli_configuration():
     parser.add_argument('-p', '--port', dest='mq_port',
                         type=int, required=False, default=1883,
                         help='MQ port')
+    parser.add_argument('-rf', '--ring-file', dest='ring_file',
+                        required=False, default='frame_ring.bin',
+                        help='Frame ring file name in the input directory')
+    parser.add_argument('-sd', '--store-dir', dest='store_dir',
+                        required=False, default='frames',
+                        help='Frame store directory name in the input directory')
 
     return vars(parser.parse_args())
 
@@ -96,6 +110,8 @@ def get_file_configuration():
     file_options.setdefault('save_each', 1)
     file_options.setdefault('exclude_time', None)
     file_options.setdefault('mq_topic', '/plugins/video')
+    file_options.setdefault('ring_file', 'frame_ring.bin')
+    file_options.setdefault('store_dir', 'frames')
 
     return file_options
 
@@ -112,19 +128,42 @@ def copy_to_archive(options, data):
     if not os.path.exists(options['output_dir']):
         os.makedirs(options['output_dir'])
 
-    src = os.path.join(options['images_root_directory'],
-                       data['metadata']['source_folder'],
-                       data['metadata']['source_file'])
-
     dst = os.path.join(options['output_dir'],
                        output_file_name + image_extension)
-    shutil.copyfile(src, dst)
+    if 'frame_sequence' in data['metadata']:
+        ring = get_frame_ring(options)
+        frame = ring.read(data['metadata']['frame_sequence'])
+        if frame is None:
+            logger.warning('Frame %s was overwritten in the frame ring, '
+                           'skipping it', data['metadata']['frame_sequence'])
+            return
+        write_png(dst, frame[0], ring.width, ring.height)
+    else:
+        src = os.path.join(options['images_root_directory'],
+                           data['metadata']['source_folder'],
+                           data['metadata']['source_file'])
+        shutil.copyfile(src, dst)
 
     metadata_file_name = os.path.join(options['output_dir'], output_file_name + '.json')
     with open(metadata_file_name, 'w') as metadata_file:
         json.dump(data, metadata_file)
 
 
+def get_frame_ring(options):
+    """ Get the frame ring, (re)opening it if needed.
+
+    :param options: dict of configuration values
+    :return: FrameRing object
+    """
+    global frame_ring
+    if frame_ring is None or frame_ring.replaced():
+        if frame_ring is not None:
+            frame_ring.close()
+        frame_ring = FrameRing.open(os.path.join(
+            options['images_root_directory'], options['ring_file']))
+    return frame_ring
+
+
 def is_valid_day_time(exclude_time_list):
     """ Check whether current time should be accepted or not.
 
@@ -175,7 +214,8 @@ def remove_old_dirs(options, data):
 
     for directory in os.listdir(options['images_root_directory']):
         path = os.path.join(root_path, directory)
-        if os.path.getmtime(path) < input_dir_mtime and directory != '.DS_Store':
+        if (os.path.isdir(path) and os.path.getmtime(path) < input_dir_mtime
+                and directory != '.DS_Store'):
             shutil.rmtree(path)
 
 
@@ -217,7 +257,8 @@ def process(options, data):
     :param options: dict of configuration values
     :param data: json of metadata
     """
-    if file_is_present(options, data):
+    ring_frame = 'frame_sequence' in data['metadata']
+    if ring_frame or file_is_present(options, data):
         if options['strategy'] == STRATEGIES['SAVE_TO_FS']:
             save_to_fs(options, data)
         elif options['strategy'] == STRATEGIES['REMOVE']:
@@ -225,8 +266,11 @@ def process(options, data):
         else:
             raise RuntimeError('Unknown strategy - {}'.format(options['strategy']))
 
-        remove_old_dirs(options, data)
-        remove_old_files(options, data)
+        # Old frames of the ring and of the store are recycled by them
+        if (not ring_frame and
+                data['metadata']['source_folder'] != options['store_dir']):
+            remove_old_dirs(options, data)
+            remove_old_files(options, data)
 
 
 def stop_worker(worker, events, message):
@@ -0,0 +1,202 @@
+""" Two-stage classification cascade.
+
+A tiny logistic model over cheap image statistics (colour moments,
+a brightness histogram and edge density) classifies slots first.  Slots it
+is confident about (probability of being occupied outside of the
+uncertain band between `low` and `high`) get its result, only the rest are
+passed to the model.  Empty asphalt and clearly parked cars are common,
+so most slots usually skip the model.
+
+A cascade is trained per model (see train_cascade.py) and saved as
+cascade.npz in the model folder.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+from logistic import sigmoid, train_logistic
+
+logger = logging.getLogger('model')
+
+CASCADE_FILE = 'cascade.npz'
+# Crops are subsampled with this step before calculating features
+FEATURE_STEP = 4
+HISTOGRAM_BINS = 8
+# Range of normalized values (see crop_helpers.INPUT_SCALE)
+HISTOGRAM_RANGE = (-2.2, 2.7)
+EDGE_THRESHOLD = 0.5
+
+
+def cascade_features(batch):
+    """ Calculate cheap features of slot images.
+
+    :param batch: float32 numpy array of normalized slot images,
+        shape (N, H, W, 3) (see crop_helpers.SlotBatch)
+    :return: float32 numpy array of features, shape (N, 17)
+    """
+    small = batch[:, ::FEATURE_STEP, ::FEATURE_STEP]
+    num = len(small)
+    means = small.mean(axis=(1, 2))
+    stds = small.std(axis=(1, 2))
+
+    gray = small.mean(axis=3)
+    low, high = HISTOGRAM_RANGE
+    bins = np.clip(((gray - low) * (HISTOGRAM_BINS / (high - low))).astype(
+        np.intp), 0, HISTOGRAM_BINS - 1).reshape(num, -1)
+    offsets = np.arange(num)[:, np.newaxis] * HISTOGRAM_BINS
+    histograms = np.bincount((bins + offsets).ravel(),
+                             minlength=num * HISTOGRAM_BINS).reshape(
+                                 num, HISTOGRAM_BINS) / bins.shape[1]
+
+    gradient_x = np.abs(np.diff(gray, axis=2))
+    gradient_y = np.abs(np.diff(gray, axis=1))
+    edges = gradient_x[:, :-1] + gradient_y[:, :, :-1]
+    edge_features = np.stack([
+        gradient_x.mean(axis=(1, 2)), gradient_y.mean(axis=(1, 2)),
+        (edges > EDGE_THRESHOLD).mean(axis=(1, 2))], axis=1)
+
+    return np.concatenate([means, stds, histograms, edge_features],
+                          axis=1).astype(np.float32)
+
+
+class Cascade:
+    """ First stage of the cascade of a single model.
+
+    Counts slots decided by each stage, see `hit_rates`.
+    """
+    def __init__(self, weights, bias, mean, std, low=0.1, high=0.9):
+        """
+        :param weights: float32 numpy array, one weight per feature
+        :param bias: bias of the logistic regression
+        :param mean: numpy array of feature means, to standardize them
+        :param std: numpy array of feature standard deviations
+        :param low: slots with lower probability of being occupied
+            are free
+        :param high: slots with higher probability of being occupied
+            are occupied
+        """
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.float32(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.low = float(low)
+        self.high = float(high)
+        self.slots = 0
+        self.first_stage = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fit(cls, features, labels, low=0.1, high=0.9):
+        """ Train the first stage.
+
+        :param features: numpy array of features (see `cascade_features`)
+        :param labels: numpy array of states, 0 (free) or 1 (occupied)
+        :param low: lower bound of the uncertain band
+        :param high: upper bound of the uncertain band
+        :return: Cascade object
+        """
+        mean = features.mean(axis=0)
+        std = np.maximum(features.std(axis=0), 1e-6)
+        weights, bias = train_logistic((features - mean) / std, labels,
+                                       epochs=1000, learning_rate=1.0)
+        return cls(weights, bias, mean, std, low, high)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a cascade saved with `save`.
+
+        :param path: path to the .npz file
+        :return: Cascade object
+        """
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], data['mean'],
+                       data['std'], data['low'], data['high'])
+
+    def save(self, path):
+        """ Save the cascade.
+
+        :param path: path to the output .npz file
+        """
+        with open(path, 'wb') as f_out:
+            np.savez(f_out, weights=self.weights, bias=self.bias,
+                     mean=self.mean, std=self.std, low=self.low,
+                     high=self.high)
+
+    def predict(self, batch):
+        """ Run the first stage.
+
+        :param batch: float32 numpy array of normalized slot images
+        :return: float32 numpy array of probabilities of being occupied,
+            shape (N,)
+        """
+        features = (cascade_features(batch) - self.mean) / self.std
+        return sigmoid(features.dot(self.weights) + self.bias)
+
+    def confident(self, probabilities):
+        """ Find slots decided by the first stage.
+
+        :param probabilities: numpy array of first stage outputs
+        :return: boolean numpy array
+        """
+        return (probabilities < self.low) | (probabilities > self.high)
+
+    def split(self, batch):
+        """ Run the first stage and count slots decided by it.
+
+        :param batch: float32 numpy array of normalized slot images
+        :return: (numpy array of probabilities of being occupied,
+                  boolean numpy array, True for slots decided by the first
+                  stage)
+        """
+        probabilities = self.predict(batch)
+        confident = self.confident(probabilities)
+        with self._lock:
+            self.slots += len(batch)
+            self.first_stage += int(confident.sum())
+        return probabilities, confident
+
+    def hit_rates(self, reset=False):
+        """ Shares of slots decided by each stage since the last reset.
+
+        :param reset: reset counters
+        :return: dict with "slots", "first_stage" and "second_stage"
+        """
+        with self._lock:
+            slots, first_stage = self.slots, self.first_stage
+            if reset:
+                self.slots = self.first_stage = 0
+        if not slots:
+            return {'slots': 0, 'first_stage': 0.0, 'second_stage': 0.0}
+        return {'slots': slots,
+                'first_stage': first_stage / slots,
+                'second_stage': (slots - first_stage) / slots}
+
+
+def load_cascades(models_path, model_names, options=None):
+    """ Load cascades of models.
+
+    :param models_path: path to models folder
+    :param model_names: iterable of model names
+    :param options: dict of "cascade" model config options, "low" and
+        "high" override thresholds saved with cascades
+    :return: dict of model names mapped to Cascade objects, models without
+        a trained cascade are left out
+    """
+    options = options or {}
+    cascades = {}
+    for name in model_names:
+        path = os.path.join(models_path, name, CASCADE_FILE)
+        if not os.path.exists(path):
+            logger.warning('Model %s has no cascade, all its slots are '
+                           'classified by the model', name)
+            continue
+
+        cascade = Cascade.load(path)
+        if options.get('low') is not None:
+            cascade.low = options['low']
+        if options.get('high') is not None:
+            cascade.high = options['high']
+        cascades[name] = cascade
+    return cascades
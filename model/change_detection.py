@@ -0,0 +1,216 @@
+""" Change detection helpers for skipping inference on unchanged slots.
+"""
+import cv2
+import numpy as np
+
+
+class SlotChangeDetector:
+    """ Keeps a small grayscale signature per slot and reports slots whose
+    look changed since they were classified last time.
+
+    Every slot is also refreshed after a given number of frames, refreshes
+    are staggered, so they do not happen for all slots on the same frame.
+    """
+    def __init__(self, threshold, refresh_frames, signature_size=16):
+        """
+        :param threshold: mean absolute difference of signatures (in gray
+            levels, 0..255) to treat a slot as changed
+        :param refresh_frames: classify a slot at least once per this number
+            of frames
+        :param signature_size: side of a signature in pixels
+        """
+        self.threshold = threshold
+        self.refresh_frames = refresh_frames
+        self.signature_size = signature_size
+        self.signatures = None
+        self.frames_since_refresh = None
+
+    @classmethod
+    def from_options(cls, options):
+        """ Create a detector from "change_detection" model config options.
+
+        :param options: dict of change detection options
+        :return: SlotChangeDetector object or None if it is disabled
+        """
+        if not options.get('enabled', False):
+            return None
+
+        return cls(options.get('threshold', 6.0),
+                   options.get('refresh_frames', 30),
+                   options.get('signature_size', 16))
+
+    def signature(self, crops):
+        """ Calculate signatures of slot crops.
+
+        :param crops: uint8 numpy array of crops, shape (N, H, W, 3)
+        :return: float32 numpy array of signatures, shape (N, S, S)
+        """
+        num, height, width, channels = crops.shape
+        size = self.signature_size
+        cell_height, cell_width = height // size, width // size
+        cells = crops[:, :size * cell_height, :size * cell_width].reshape(
+            num, size, cell_height, size, cell_width, channels)
+        sums = cells.sum(axis=(2, 4, 5), dtype=np.uint32)
+        return sums.astype(np.float32) / (cell_height * cell_width * channels)
+
+    def select(self, crops, rows=None):
+        """ Find slots which should be classified on the current frame and
+        remember their signatures.
+
+        :param crops: uint8 numpy array of crops, shape (N, H, W, 3)
+        :param rows: boolean numpy array of slots cropped on the current
+            frame or None if all of them were cropped
+        :return: boolean numpy array, True for slots to classify
+        """
+        if rows is None:
+            rows = np.ones(len(crops), dtype=bool)
+
+        if self.signatures is None:
+            size = self.signature_size
+            self.signatures = np.full((len(crops), size, size), np.nan,
+                                      dtype=np.float32)
+            self.frames_since_refresh = (np.arange(len(crops)) %
+                                         max(self.refresh_frames, 1))
+        else:
+            self.frames_since_refresh += 1
+
+        signatures = self.signature(crops[rows])
+        diff = np.abs(signatures - self.signatures[rows]).mean(axis=(1, 2))
+        unknown = np.isnan(diff)
+        changed_rows = (unknown | (diff > self.threshold) |
+                        (self.frames_since_refresh[rows] >=
+                         self.refresh_frames))
+
+        changed = np.zeros(len(crops), dtype=bool)
+        changed[rows] = changed_rows
+        self.signatures[changed] = signatures[changed_rows]
+        refreshed = changed.copy()
+        refreshed[rows] &= ~unknown
+        self.frames_since_refresh[refreshed] = 0
+        return changed
+
+
+class FrameMotionGate:
+    """ Compares a frame with the previous ones at low resolution and finds
+    slots touched by changed regions.
+
+    The frame is split into a grid of cells, a cell is changed if its mean
+    difference from the reference exceeds a threshold.  Reference is kept
+    per cell and updated only when the cell changes, so slow changes add
+    up until they are noticed.  Slots touched by changed cells are looked
+    up via a grid index built from slot polygons.
+    """
+    def __init__(self, parking_map, width, cell_size, threshold,
+                 refresh_frames):
+        """
+        :param parking_map: ParkingMap object
+        :param width: width of the low resolution frame in pixels
+        :param cell_size: side of a grid cell in low resolution pixels
+        :param threshold: mean absolute difference of a cell (in gray
+            levels, 0..255) to treat it as changed
+        :param refresh_frames: treat all slots as touched once per this
+            number of frames
+        """
+        self.parking_map = parking_map
+        self.width = width
+        self.cell_size = cell_size
+        self.threshold = threshold
+        self.refresh_frames = refresh_frames
+        self.frame_shape = None
+        self.grid_shape = None
+        self.cells_to_slots = None
+        self.reference = None
+        self.forced_cells = None
+        self.frames_since_refresh = 0
+
+    @classmethod
+    def from_options(cls, parking_map, options):
+        """ Create a gate from "motion_gating" model config options.
+
+        :param parking_map: ParkingMap object
+        :param options: dict of motion gating options
+        :return: FrameMotionGate object or None if it is disabled
+        """
+        if not options.get('enabled', False):
+            return None
+
+        return cls(parking_map, options.get('width', 320),
+                   options.get('cell_size', 8),
+                   options.get('threshold', 10.0),
+                   options.get('refresh_frames', 300))
+
+    def _build_index(self, frame_shape):
+        height, width = frame_shape[:2]
+        grid_width = max(1, int(round(self.width / self.cell_size)))
+        grid_height = max(1, int(round(grid_width * height / width)))
+        scale_x = grid_width / width
+        scale_y = grid_height / height
+
+        points = self.parking_map.points[self.parking_map.batch_order]
+        cells_to_slots = np.zeros((grid_height, grid_width, len(points)),
+                                  dtype=bool)
+        for row, slot_points in enumerate(points):
+            x_min, y_min = slot_points.min(axis=0)
+            x_max, y_max = slot_points.max(axis=0)
+            left = int(np.clip(np.floor(x_min * scale_x), 0, grid_width - 1))
+            right = int(np.clip(np.floor(x_max * scale_x), 0, grid_width - 1))
+            top = int(np.clip(np.floor(y_min * scale_y), 0, grid_height - 1))
+            bottom = int(np.clip(np.floor(y_max * scale_y), 0,
+                                 grid_height - 1))
+            cells_to_slots[top:bottom + 1, left:right + 1, row] = True
+
+        self.frame_shape = frame_shape
+        self.grid_shape = (grid_height, grid_width)
+        self.cells_to_slots = cells_to_slots.reshape(-1, len(points))
+        self.reference = None
+        self.forced_cells = np.zeros((grid_height, grid_width), dtype=bool)
+
+    def invalidate(self, rows):
+        """ Treat cells touching given slots as changed on the next frame,
+        e.g. because the frame where they changed was not processed.
+
+        :param rows: boolean numpy array, one value per batch row
+        """
+        if self.forced_cells is not None:
+            self.forced_cells |= self.cells_to_slots[:, rows].any(
+                axis=1).reshape(self.grid_shape)
+
+    def _low_resolution(self, img):
+        grid_height, grid_width = self.grid_shape
+        # Converting the downscaled frame is cheaper than the full one
+        small = cv2.resize(img, (grid_width * self.cell_size,
+                                 grid_height * self.cell_size),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def select(self, img):
+        """ Find slots touched by changes on the frame.
+
+        :param img: BGR frame
+        :return: boolean numpy array, one value per batch row
+            (rows follow ParkingMap.batch_order)
+        """
+        if self.frame_shape != img.shape:
+            self._build_index(img.shape)
+
+        small = self._low_resolution(img)
+        self.frames_since_refresh += 1
+        if (self.reference is None or
+                self.frames_since_refresh >= self.refresh_frames):
+            self.reference = small
+            self.frames_since_refresh = 0
+            return np.ones(self.cells_to_slots.shape[1], dtype=bool)
+
+        grid_height, grid_width = self.grid_shape
+        size = self.cell_size
+        diff = np.abs(small - self.reference).reshape(
+            grid_height, size, grid_width, size).mean(axis=(1, 3))
+        changed_cells = (diff > self.threshold) | self.forced_cells
+        self.forced_cells[:] = False
+        if not changed_cells.any():
+            return np.zeros(self.cells_to_slots.shape[1], dtype=bool)
+
+        changed_pixels = np.repeat(np.repeat(changed_cells, size, axis=0),
+                                   size, axis=1)
+        self.reference[changed_pixels] = small[changed_pixels]
+        return self.cells_to_slots[changed_cells.ravel()].any(axis=0)
@@ -0,0 +1,67 @@
+""" Script to convert the model to TFLite.
+
+usage: convert_model.py [-h] --model-folder MODEL_FOLDER
+                        [--quantization {float32,float16,int8}]
+                        [--calibration-folder CALIBRATION_FOLDER]
+                        [--test-folder TEST_FOLDER]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --model-folder MODEL_FOLDER, -m MODEL_FOLDER
+                        model folder
+  --quantization {float32,float16,int8}, -q {float32,float16,int8}
+                        post-training quantization (int8 by default)
+  --calibration-folder CALIBRATION_FOLDER, -c CALIBRATION_FOLDER
+                        folder with classified images to calibrate int8
+                        quantization on (e.g. the training set)
+  --test-folder TEST_FOLDER, -t TEST_FOLDER
+                        folder with classified images to compare the
+                        converted model with the original one on
+"""
+
+import argparse
+
+from inference_backends import TFLITE_QUANTIZATIONS
+from model_core import convert_to_tflite, compare_backends
+
+
+def main():
+    """ Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-folder', '-m', dest='model_folder',
+                        help='model folder', required=True)
+    parser.add_argument('--quantization', '-q', dest='quantization',
+                        choices=TFLITE_QUANTIZATIONS, default='int8',
+                        help='post-training quantization (int8 by default)')
+    parser.add_argument('--calibration-folder', '-c',
+                        dest='calibration_folder',
+                        help='folder with classified images to calibrate '
+                             'int8 quantization on (e.g. the training set)',
+                        required=False)
+    parser.add_argument('--test-folder', '-t', dest='test_folder',
+                        help='folder with classified images to compare the '
+                             'converted model with the original one on',
+                        required=False)
+    args = parser.parse_args()
+
+    output_path = convert_to_tflite(args.model_folder, args.quantization,
+                                    args.calibration_folder)
+    print('Saved {}'.format(output_path))
+
+    if args.test_folder:
+        backends_options = [
+            {'backend': 'keras'},
+            {'backend': 'tflite', 'quantization': args.quantization}]
+        for options, result in zip(
+                backends_options,
+                compare_backends(args.model_folder, args.test_folder,
+                                 backends_options)):
+            print('{}: accuracy {:.4f}, agreement with keras {:.4f}, '
+                  '{:.1f} images/s'.format(
+                      ' '.join(options.values()), result['accuracy'],
+                      result['agreement'], result['images_per_second']))
+
+
+if __name__ == '__main__':
+    main()
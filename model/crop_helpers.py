@@ -3,14 +3,28 @@
 import os
 import cv2
 import shutil
+import threading
 import numpy as np
 
+from parking_map import ParkingMap
 
-clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+# CLAHE objects keep internal buffers, so each thread gets its own ones
+_clahes = threading.local()
 MEANS = [0.485, 0.456, 0.406]
 STDS = [0.229, 0.224, 0.225]
 WIDTH = 128
 HEIGHT = 128
+READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+INPUT_SCALE = (1 / (255 * np.array(STDS))).astype(np.float32)
+INPUT_OFFSET = (np.array(MEANS) / np.array(STDS)).astype(np.float32)
 
 
 def verify_conf(conf):
@@ -19,31 +33,16 @@ def verify_conf(conf):
     :param conf: parking configuration json
     :raise ValueError: in case parking configuration is incorrect
     """
-    slot_ids = [a['id'] for a in conf[0]['annotations']]
-    seen = set()
-    duplicates = [i for i in slot_ids if i in seen or seen.add(i)]
-    if duplicates:
-        raise ValueError(
-            'Parking configuration contains duplicate slot ID(s): {}'
-            .format(', '.join(duplicates)))
-
-    for polygon in conf[0]['annotations']:
-        slot_id = int(polygon['id'])
-        points = _get_points(polygon['xn'], polygon['yn'])
-        if points.shape[0] != 4 or points.shape[1] != 2:
-            raise ValueError(
-                'Polygon shape for slot ID {} should be (4, 2), '
-                'but actually is: {}'.format(slot_id, points.shape))
-
-
-def create_output_folder(output_folder, conf):
+    ParkingMap.from_conf(conf)
+
+
+def create_output_folder(output_folder, parking_map):
     """ Create output folder including subfolders for each model.
 
     :param output_folder: path to the output folder
-    :param conf: parking configuration json
+    :param parking_map: ParkingMap object
     """
-    models = {a['model'] for a in conf[0]['annotations']}
-    for model in models:
+    for model in parking_map.models_to_indices:
         os.makedirs(os.path.join(output_folder, model.replace(' ', '_')),
                     exist_ok=True)
 
@@ -57,46 +56,26 @@ def remove_output_folder(output_folder):
         shutil.rmtree(output_folder)
 
 
-def map_models_to_ids(conf):
-    """ Links models and parking lot ids
-
-    :param conf: parking configuration json
-    :return: models_to_ids: dict of model names and appropriate ids
-    """
-    models_to_ids = {}
-
-    for a in conf[0]['annotations']:
-        model_name = a['model']
-
-        if model_name not in models_to_ids:
-            models_to_ids[model_name] = []
-
-        models_to_ids[model_name].append(a['id'])
-
-    return models_to_ids
-
-
-def extract_and_save(input_file, output_folder, conf, keep_file_name=True):
+def extract_and_save(input_file, output_folder, parking_map,
+                     keep_file_name=True):
     """ Extract and save cropped images.
     :param input_file: path to input image file
     :param output_folder: path to the output folder
-    :param conf: parking configuration json
+    :param parking_map: ParkingMap object
     :param keep_file_name: keep original file name for cropped images
     """
     img = cv2.imread(input_file)
     img = _apply_clahe(img)
 
-    for polygon in conf[0]['annotations']:
-        slot_id = int(polygon['id'])
-        model = polygon['model'].replace(' ', '_')
-        points = _get_points(polygon['xn'], polygon['yn'])
-        warped_img = _four_points_transform(img, points)
+    for index, slot_id in enumerate(parking_map.slot_ids):
+        model = parking_map.models[index].replace(' ', '_')
+        warped_img = parking_map.warp(img, index)
         if keep_file_name:
             output_file = '{}_{}.png'.format(
                 '.'.join(os.path.basename(input_file).split('.')[:-1]),
-                slot_id)
+                int(slot_id))
         else:
-            output_file = '{}.png'.format(slot_id)
+            output_file = '{}.png'.format(int(slot_id))
         cv2.imwrite(
             os.path.join(
                 output_folder,
@@ -105,40 +84,155 @@ def extract_and_save(input_file, output_folder, conf, keep_file_name=True):
             warped_img)
 
 
-def preprocess_input(img):
-    img = cv2.resize(img, (WIDTH, HEIGHT))
-    img_norm = img / 255
-    img_norm = (img_norm - MEANS) / STDS
-
-    return np.expand_dims(img_norm, axis=0)
+class SlotBatch:
+    """ Reusable model input buffers for all slots of a parking map.
 
-
-def collect_input(input_file, conf):
-    """ Collects images for a specific model
+    Slots are warped straight to the model input size into a uint8 buffer
+    and normalized into a float32 NHWC tensor in one vectorized step.
+    Inputs of each model are views of that tensor, so they are overwritten
+    by the next call of `extract`.
+    """
+    def __init__(self, parking_map, width=WIDTH, height=HEIGHT):
+        """
+        :param parking_map: ParkingMap object
+        :param width: model input width
+        :param height: model input height
+        """
+        self.parking_map = parking_map
+        self.width = width
+        self.height = height
+        self.matrices = parking_map.input_matrices(width, height)
+        self._shifted_matrices = {(0, 0): self.matrices}
+        self.crops = np.zeros((len(parking_map), height, width, 3),
+                              dtype=np.uint8)
+        self.tensor = np.zeros(self.crops.shape, dtype=np.float32)
+        self.inputs = {model_name: self.tensor[s] for model_name, s
+                       in parking_map.models_to_slices.items()}
+
+    def extract(self, img, rows=None, offset=(0, 0)):
+        """ Crop slots from a frame and prepare model inputs.
+
+        :param img: CLAHE-normalized RGB frame or its region
+        :param rows: boolean numpy array of batch rows to crop or None
+            to crop all slots (rows follow ParkingMap.batch_order)
+        :param offset: (x, y) position of the region in the frame
+        :return: dict of model names mapped to corresponding tensors
+        """
+        matrices = self._get_matrices(offset)
+        for row, index in enumerate(self.parking_map.batch_order):
+            if rows is not None and not rows[row]:
+                continue
+            cv2.warpPerspective(img, matrices[index],
+                                (self.width, self.height),
+                                dst=self.crops[row])
+
+        if rows is None:
+            np.multiply(self.crops, INPUT_SCALE, out=self.tensor)
+            np.subtract(self.tensor, INPUT_OFFSET, out=self.tensor)
+        else:
+            self.tensor[rows] = self.crops[rows] * INPUT_SCALE - INPUT_OFFSET
+        return self.inputs
+
+    def _get_matrices(self, offset):
+        if offset not in self._shifted_matrices:
+            shift = np.eye(3)
+            shift[0, 2], shift[1, 2] = offset
+            self._shifted_matrices[offset] = np.matmul(self.matrices, shift)
+        return self._shifted_matrices[offset]
+
+    def select(self, rows):
+        """ Get model inputs for a subset of slots.
+
+        :param rows: boolean numpy array, one value per batch row
+            (rows follow ParkingMap.batch_order)
+        :return: (dict of model names mapped to tensors,
+                  dict of model names mapped to slot ids)
+        """
+        inputs = {}
+        models_to_ids = {}
+        for model_name, rows_slice in self.parking_map.models_to_slices.items():
+            model_rows = rows[rows_slice]
+            if not model_rows.any():
+                continue
+
+            inputs[model_name] = self.inputs[model_name][model_rows]
+            models_to_ids[model_name] = [
+                slot_id for slot_id, selected
+                in zip(self.parking_map.models_to_ids[model_name], model_rows)
+                if selected]
+
+        return inputs, models_to_ids
+
+
+def read_frame(input_file, scale=1):
+    """ Read a camera frame.
 
     :param input_file: path to input image file
-    :param conf: parking configuration json
-    :param models_to_tensors: dict of model names mapped to corresponding tensors
+    :param scale: downscale factor (1, 2, 4 or 8), JPEG frames are
+        downscaled while decoding, which is much faster than full decode
+    :return: BGR image
     """
-    models_to_tensors = {}
-    img = cv2.imread(input_file)
-    img = _apply_clahe(img)
+    return cv2.imread(input_file, READ_FLAGS[scale])
 
-    for polygon in conf[0]['annotations']:
-        model_name = polygon['model']
-        points = _get_points(polygon['xn'], polygon['yn'])
-        warped_img = _four_points_transform(img, points)
 
-        if model_name not in models_to_tensors:
-            models_to_tensors[model_name] = preprocess_input(warped_img)
-        else:
-            models_to_tensors[model_name] = np.vstack((models_to_tensors[model_name],
-                                                       preprocess_input(warped_img)))
+def read_crops(paths, width=WIDTH, height=HEIGHT):
+    """ Read slot images saved by `extract_and_save` as a model input.
+
+    :param paths: list of paths to slot images
+    :param width: model input width
+    :param height: model input height
+    :return: float32 numpy array, shape (N, height, width, 3), normalized
+        the same way as SlotBatch inputs
+    """
+    crops = np.zeros((len(paths), height, width, 3), dtype=np.uint8)
+    for index, path in enumerate(paths):
+        # Crops are saved as is, so reading them back gives RGB
+        cv2.resize(cv2.imread(path), (width, height), dst=crops[index])
+    return crops * INPUT_SCALE - INPUT_OFFSET
 
-    return models_to_tensors
 
+def collect_input(img, slot_batch, rows=None):
+    """ Collects images for a specific model
 
-def _apply_clahe(img):
+    :param img: BGR image (output of read_frame)
+    :param slot_batch: SlotBatch object to fill
+    :param rows: boolean numpy array of batch rows to crop or None
+        to crop all slots
+    :return: models_to_tensors: dict of model names mapped to corresponding tensors
+    """
+    region = slot_batch.parking_map.clahe_region(img.shape, CLAHE_TILE_GRID)
+    img = _apply_clahe(img, region)
+    return slot_batch.extract(img, rows, offset=(region.x, region.y))
+
+
+def collect_frame_input(img, parking_map, grid, scale=1.0):
+    """ Prepare the frame region covering all slots as a single model input,
+    for whole-frame inference (see roi_pooling.py).
+
+    :param img: BGR image (output of read_frame)
+    :param parking_map: ParkingMap object matching the image size
+    :param grid: (columns, rows) of points pooled per slot
+    :param scale: resize factor of the region
+    :return: (float32 numpy array of the region, shape (H, W, 3), normalized
+              the same way as SlotBatch inputs,
+              numpy array of (x, y) region coordinates of pooled points,
+              shape (N, rows, columns, 2), slots follow the configuration
+              order)
+    """
+    region = parking_map.clahe_region(img.shape, CLAHE_TILE_GRID)
+    rgb = _apply_clahe(img, region)
+    points = parking_map.roi_points(grid) - np.float32([region.x, region.y])
+    if scale != 1:
+        height, width = rgb.shape[:2]
+        rgb = cv2.resize(rgb, (max(1, int(round(width * scale))),
+                               max(1, int(round(height * scale)))),
+                         interpolation=cv2.INTER_AREA)
+        resize = np.float32([rgb.shape[1] / width, rgb.shape[0] / height])
+        points = (points + 0.5) * resize - 0.5
+    return rgb * INPUT_SCALE - INPUT_OFFSET, points
+
+
+def _apply_clahe(img, region=None):
     """
     Contrast Limited Adaptive Histogram Equalization is used here.
     In this, image is divided into small blocks called "tiles"
@@ -151,47 +245,36 @@ def _apply_clahe(img):
     applying histogram equalization.
     After equalization, to remove artifacts in tile borders, bilinear interpolation is applied.
 
+    With a region given (see ParkingMap.clahe_region), only that part of the image
+    is converted and equalized, the result matches the full image version inside slots.
+
     :param img: original BGR image (output of opencv.imread)
-    :return: normalized BGR image
+    :param region: Region object or None to process the full image
+    :return: normalized BGR image (of the region if it is given)
     """
+    tile_grid = CLAHE_TILE_GRID
+    if region is not None:
+        img = img[region.y:region.y + region.height,
+                  region.x:region.x + region.width]
+        if region.pad_x or region.pad_y:
+            img = cv2.copyMakeBorder(img, 0, region.pad_y, 0, region.pad_x,
+                                     cv2.BORDER_REFLECT_101)
+        tile_grid = region.tiles
+
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    lab_planes = cv2.split(lab)
-    lab_planes[0] = clahe.apply(lab_planes[0])
+    lab_planes = list(cv2.split(lab))
+    lab_planes[0] = _get_clahe(tile_grid).apply(lab_planes[0])
     lab = cv2.merge(lab_planes)
-    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-
-
-def _get_points(xn, yn):
-    xn = np.array(xn.split(';')).astype(np.float32)
-    yn = np.array(yn.split(';')).astype(np.float32)
-    points = np.stack((xn, yn), axis=-1)
-    return points
-
-
-def _four_points_transform(img, points):
-    (tl, tr, br, bl) = points
-
-    width_a = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
-    width_b = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
-    max_width = max(int(width_a), int(width_b))
-
-    height_a = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
-    height_b = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
-    max_height = max(int(height_a), int(height_b))
-
-    if max_height > max_width:
-        dst = np.array([
-            [0, 0],
-            [max_width - 1, 0],
-            [max_width - 1, max_height - 1],
-            [0, max_height - 1]], np.float32)
-    else:
-        dst = np.array([
-            [max_height - 1, 0],
-            [max_height - 1, max_width - 1],
-            [0, max_width - 1],
-            [0, 0]], np.float32)
-
-    matrix = cv2.getPerspectiveTransform(points, dst)
-    warped = cv2.warpPerspective(img, matrix, (max_width, max_height))
-    return warped
+    rgb = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+    if region is not None:
+        rgb = rgb[:region.height, :region.width]
+    return rgb
+
+
+def _get_clahe(tile_grid):
+    if not hasattr(_clahes, 'by_tile_grid'):
+        _clahes.by_tile_grid = {}
+    if tile_grid not in _clahes.by_tile_grid:
+        _clahes.by_tile_grid[tile_grid] = cv2.createCLAHE(
+            clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=tile_grid)
+    return _clahes.by_tile_grid[tile_grid]
@@ -0,0 +1,174 @@
+""" Event-driven frame discovery.
+
+Instead of looking for a new frame every `sleep_duration` seconds, frame
+discovery waits for inotify events of the images folder: a frame written
+(closed after writing) or renamed into a subfolder (see
+utils/frame_store.py).  All pending events are read at once, so a burst of
+frames wakes discovery up once with the newest of them.  Without events
+discovery still looks for frames every `timeout` seconds.
+
+inotify is used through ctypes (Linux only), other platforms fall back to
+polling with a fixed delay.
+"""
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+
+logger = logging.getLogger('model')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+ROOT_MASK = IN_CREATE | IN_MOVED_TO
+FOLDER_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+# wd, mask, cookie, length of the name which follows
+EVENT = struct.Struct('iIII')
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.bmp')
+
+
+class PollingWatcher:
+    """ Waits a fixed delay between looking for frames.
+    """
+    def __init__(self, delay, stop=None):
+        """
+        :param delay: delay in seconds
+        :param stop: threading.Event interrupting the wait or None
+        """
+        self.delay = delay
+        self.stop = stop or threading.Event()
+
+    def wait(self):
+        """ Wait the delay.
+
+        :return: None, the newest frame is not known
+        """
+        self.stop.wait(self.delay)
+        return None
+
+    def close(self):
+        """ Nothing to release.
+        """
+
+
+class InotifyWatcher:
+    """ Waits for frames written into subfolders of the images folder.
+    """
+    def __init__(self, path, timeout):
+        """
+        :param path: path to the images folder
+        :param timeout: longest wait for an event, in seconds
+        :raise OSError: in case inotify is not available
+        """
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'inotify is not supported')
+
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.timeout = timeout
+        self.folders = {}
+        self.root = self._watch(path, ROOT_MASK)
+        for name in os.listdir(path):
+            if os.path.isdir(os.path.join(path, name)):
+                self._watch(os.path.join(path, name), FOLDER_MASK)
+
+    def _watch(self, path, mask):
+        """ Start watching a folder.
+
+        :param path: path to the folder
+        :param mask: inotify events to watch
+        :return: watch descriptor or None if the folder is gone
+        :raise OSError: in case the folder cannot be watched
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                return None
+            raise OSError(error, 'inotify_add_watch failed', path)
+
+        self.folders[wd] = path
+        return wd
+
+    def wait(self):
+        """ Wait for new frames.
+
+        :return: path to the newest written frame or None if there were
+                 no events (or too many of them) before the timeout
+        """
+        if not select.select([self.fd], [], [], self.timeout)[0]:
+            return None
+
+        newest = None
+        for wd, mask, name in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                newest = None
+                logger.warning('Frame events overflowed, looking for the '
+                               'newest frame')
+            elif mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+            elif wd == self.root:
+                if mask & IN_ISDIR:
+                    self._watch(os.path.join(self.folders[wd], name),
+                                FOLDER_MASK)
+            elif (not mask & IN_ISDIR and wd in self.folders and
+                  name.endswith(IMAGE_EXTENSIONS)):
+                newest = os.path.join(self.folders[wd], name)
+        return newest
+
+    def _read_events(self):
+        """ Read all pending events.
+
+        :return: list of (watch descriptor, event mask, file name)
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self):
+        """ Stop watching.
+        """
+        os.close(self.fd)
+
+
+def create_watcher(path, options, delay, stop=None):
+    """ Create a watcher for "discovery" model config options.
+
+    :param path: path to the images folder
+    :param options: dict of "discovery" model config options
+    :param delay: delay between looking for frames when polling, in seconds
+    :param stop: threading.Event interrupting polling or None
+    :return: InotifyWatcher or PollingWatcher object
+    """
+    if options.get('mode', 'polling') == 'inotify':
+        try:
+            return InotifyWatcher(path, options.get('timeout', 10.0))
+        except OSError as error:
+            logger.warning('Cannot watch %s (%s), polling for frames', path,
+                           error)
+    return PollingWatcher(delay, stop)
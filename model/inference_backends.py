@@ -0,0 +1,278 @@
+""" Inference backends.
+
+A backend wraps a trained model of a particular runtime behind the same
+`predict` method: it takes a float32 NHWC batch of normalized slot images
+(see crop_helpers.SlotBatch) and returns a numpy array of model outputs.
+
+- "keras": model.json and weights.h5 loaded with Keras.
+- "tflite": model_<quantization>.tflite (see convert_model.py) run with the
+  TFLite interpreter only, either from the tflite_runtime package or from
+  TensorFlow.  Needs neither Keras nor full TensorFlow at run time.
+
+Runtime modules are imported only when a backend is loaded, so a container
+may ship just one of them.
+"""
+import os
+import threading
+
+import numpy as np
+
+KERAS_STRUCTURE_FILE = 'model.json'
+KERAS_WEIGHTS_FILE = 'weights.h5'
+TFLITE_QUANTIZATIONS = ('float32', 'float16', 'int8')
+
+
+class KerasBackend:
+    """ Keras model, run with a compiled backend function instead of
+    `model.predict`, which adds batching and callbacks overhead to each call.
+    """
+    name = 'keras'
+
+    def __init__(self, model):
+        """
+        :param model: Keras model
+        """
+        from keras import backend
+
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+        self.function = backend.function(model.inputs, model.outputs)
+
+    @staticmethod
+    def configure(threads=None, workers=1, **_options):
+        """ Configure the runtime before loading models.
+
+        :param threads: number of threads used by a single operation
+            or None for the TensorFlow default
+        :param workers: number of models run concurrently
+        """
+        if not threads and workers <= 1:
+            return
+
+        import tensorflow as tf
+
+        if hasattr(tf, 'Session'):
+            # TensorFlow 1.x with Keras 2.2 (model/requirements.txt)
+            from keras import backend
+
+            backend.set_session(tf.Session(config=tf.ConfigProto(
+                intra_op_parallelism_threads=threads or 0,
+                inter_op_parallelism_threads=workers)))
+        else:
+            # TensorFlow 2.x (model/requirements.convert.txt)
+            tf.config.threading.set_intra_op_parallelism_threads(threads or 0)
+            tf.config.threading.set_inter_op_parallelism_threads(workers)
+
+    @staticmethod
+    def model_files(model_path, **_options):
+        """ Files the model is loaded from.
+
+        :param model_path: path to the model folder
+        :return: list of paths
+        """
+        return [os.path.join(model_path, KERAS_STRUCTURE_FILE),
+                os.path.join(model_path, KERAS_WEIGHTS_FILE)]
+
+    @classmethod
+    def load(cls, model_path, **options):
+        """ Load a model.
+
+        :param model_path: path to the model folder
+        :return: KerasBackend object
+        """
+        from model_helpers import load_inference_model
+
+        return cls(load_inference_model(*cls.model_files(model_path,
+                                                         **options)))
+
+    def predict(self, batch):
+        """ Run the model.
+
+        :param batch: float32 numpy array, shape (N, H, W, 3)
+        :return: numpy array of model outputs, shape (N, K)
+        """
+        return self.function([batch])[0]
+
+
+class TFLiteBackend:
+    """ TFLite model, optionally quantized.
+
+    Quantized inputs and outputs (int8 or uint8) are converted from and to
+    float32 with the quantization parameters stored in the model.
+
+    Resizing interpreter tensors is expensive, so an interpreter is kept
+    per batch size.  An interpreter can not run on several threads at once,
+    so each one has a lock: threads share interpreters (and so the ones
+    warmed up on any thread), batches of different sizes still run
+    concurrently.
+    """
+    name = 'tflite'
+
+    def __init__(self, create_interpreter_fn):
+        """
+        :param create_interpreter_fn: function returning a new TFLite
+            Interpreter object of the model with allocated tensors
+        """
+        self.create_interpreter_fn = create_interpreter_fn
+        self._lock = threading.Lock()
+        interpreter = create_interpreter_fn()
+        self.input_shape = tuple(
+            interpreter.get_input_details()[0]['shape'][1:])
+        # Batch sizes mapped to (interpreter, lock)
+        self.interpreters = {
+            interpreter.get_input_details()[0]['shape'][0]: (
+                interpreter, threading.Lock())}
+
+    @staticmethod
+    def configure(**_options):
+        """ Configure the runtime before loading models.
+        """
+
+    @staticmethod
+    def model_files(model_path, quantization='int8', **_options):
+        """ Files the model is loaded from.
+
+        :param model_path: path to the model folder
+        :param quantization: one of TFLITE_QUANTIZATIONS
+        :return: list of paths
+        """
+        return [tflite_model_path(model_path, quantization)]
+
+    @classmethod
+    def load(cls, model_path, quantization='int8', threads=None, **_options):
+        """ Load a model converted with convert_model.py.
+
+        :param model_path: path to the model folder
+        :param quantization: one of TFLITE_QUANTIZATIONS
+        :param threads: number of interpreter threads or None for the
+            interpreter default
+        :return: TFLiteBackend object
+        """
+        with open(tflite_model_path(model_path, quantization), 'rb') as f_in:
+            content = f_in.read()
+        return cls(lambda: create_interpreter(content, threads))
+
+    def _get_interpreter(self, batch_size):
+        with self._lock:
+            if batch_size not in self.interpreters:
+                interpreter = self.create_interpreter_fn()
+                input_details = interpreter.get_input_details()[0]
+                interpreter.resize_tensor_input(
+                    input_details['index'],
+                    [batch_size] + list(input_details['shape'][1:]))
+                interpreter.allocate_tensors()
+                self.interpreters[batch_size] = (interpreter,
+                                                 threading.Lock())
+            return self.interpreters[batch_size]
+
+    def predict(self, batch):
+        """ Run the model.
+
+        :param batch: float32 numpy array, shape (N, H, W, 3)
+        :return: float32 numpy array of model outputs, shape (N, K)
+        """
+        interpreter, lock = self._get_interpreter(len(batch))
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        inputs = quantize(batch, input_details['dtype'],
+                          input_details['quantization'])
+        with lock:
+            interpreter.set_tensor(input_details['index'], inputs)
+            interpreter.invoke()
+            outputs = interpreter.get_tensor(output_details['index'])
+        return dequantize(outputs, output_details['quantization'])
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend,
+                                                  TFLiteBackend)}
+
+
+def get_backend(options=None):
+    """ Get the backend selected in model config options.
+
+    :param options: dict of "inference" model config options or None
+        to use Keras
+    :return: (backend class, dict of its options)
+    :raise ValueError: in case the backend is unknown
+    """
+    options = dict(options or {})
+    name = options.pop('backend', KerasBackend.name)
+    if name not in BACKENDS:
+        raise ValueError('Unknown inference backend {}, expected one of: {}'
+                         .format(name, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[name], options
+
+
+def load_backend(model_path, options=None):
+    """ Load a model with the backend selected in model config options.
+
+    :param model_path: path to the model folder
+    :param options: dict of "inference" model config options or None
+        to use Keras
+    :return: backend object
+    :raise ValueError: in case the backend is unknown
+    """
+    backend, backend_options = get_backend(options)
+    return backend.load(model_path, **backend_options)
+
+
+def tflite_model_path(model_path, quantization):
+    """ Path of a converted TFLite model.
+
+    :param model_path: path to the model folder
+    :param quantization: one of TFLITE_QUANTIZATIONS
+    :return: path to the .tflite file
+    :raise ValueError: in case the quantization is unknown
+    """
+    if quantization not in TFLITE_QUANTIZATIONS:
+        raise ValueError('Unknown quantization {}, expected one of: {}'
+                         .format(quantization, ', '.join(TFLITE_QUANTIZATIONS)))
+    return os.path.join(model_path, 'model_{}.tflite'.format(quantization))
+
+
+def create_interpreter(content, threads=None):
+    """ Create a TFLite interpreter using the lightest available runtime.
+
+    :param content: bytes of the .tflite file
+    :param threads: number of interpreter threads or None for the default
+    :return: TFLite Interpreter object with allocated tensors
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+
+    interpreter = Interpreter(model_content=content, num_threads=threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def quantize(batch, dtype, quantization):
+    """ Convert a float batch to the input type of a model.
+
+    :param batch: float32 numpy array
+    :param dtype: numpy type of the model input
+    :param quantization: (scale, zero point) of the model input
+    :return: numpy array of the given type
+    """
+    if not np.issubdtype(dtype, np.integer):
+        return batch.astype(dtype, copy=False)
+
+    scale, zero_point = quantization
+    info = np.iinfo(dtype)
+    quantized = np.round(batch / scale) + zero_point
+    return np.clip(quantized, info.min, info.max).astype(dtype)
+
+
+def dequantize(output, quantization):
+    """ Convert a model output to float32.
+
+    :param output: numpy array of model outputs
+    :param quantization: (scale, zero point) of the model output
+    :return: float32 numpy array
+    """
+    if not np.issubdtype(output.dtype, np.integer):
+        return output.astype(np.float32, copy=False)
+
+    scale, zero_point = quantization
+    return (output.astype(np.float32) - zero_point) * scale
@@ -0,0 +1,42 @@
+""" Logistic regression helpers.
+
+Light classifiers over precomputed features, used by the ROI pooling head
+(see roi_pooling.py) and the first stage of the cascade (see cascade.py).
+"""
+import numpy as np
+
+
+def train_logistic(features, labels, epochs=300, learning_rate=0.1,
+                   l2=1e-4):
+    """ Fit a logistic regression with full batch gradient descent.
+
+    :param features: numpy array of features, shape (N, ...), e.g. pooled
+        features of shape (N, rows, columns, C)
+    :param labels: numpy array of states, 0 (free) or 1 (occupied)
+    :param epochs: number of gradient steps
+    :param learning_rate: step size
+    :param l2: weight of L2 regularization
+    :return: (weights, bias)
+    """
+    inputs = features.reshape(len(features), -1).astype(np.float32)
+    labels = np.asarray(labels, dtype=np.float32)
+    # Features are scaled, so a single step size suits any backbone
+    scale = np.float32(max(np.abs(inputs).max(), 1e-6))
+    inputs = inputs / scale
+    weights = np.zeros(inputs.shape[1], dtype=np.float32)
+    bias = np.float32(0)
+    for _ in range(epochs):
+        error = sigmoid(inputs.dot(weights) + bias) - labels
+        weights -= learning_rate * (inputs.T.dot(error) / len(inputs) +
+                                    l2 * weights)
+        bias -= learning_rate * error.mean()
+    return weights / scale, bias
+
+
+def sigmoid(logits):
+    """ Logistic function.
+
+    :param logits: numpy array
+    :return: float32 numpy array of probabilities
+    """
+    return (1 / (1 + np.exp(-np.clip(logits, -50, 50)))).astype(np.float32)
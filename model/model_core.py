@@ -1,48 +1,272 @@
 """ Core model module.
 """
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from shutil import copyfile
 
+import cv2
 import numpy as np
-from keras.applications.mobilenet_v2 import preprocess_input
-from keras.callbacks import EarlyStopping, TensorBoard, ModelCheckpoint
-from keras.models import load_model
-from keras.optimizers import Adam
-from keras.preprocessing.image import load_img, img_to_array
-
-from model_helpers import (load_inference_model, save_model, count_images,
-                           get_generators, get_initial_model)
-
 
+from cascade import Cascade, cascade_features, CASCADE_FILE
+from crop_helpers import read_crops
+from inference_backends import (load_backend, tflite_model_path,
+                                KERAS_STRUCTURE_FILE, KERAS_WEIGHTS_FILE)
+from parking_map import grid_points
+from logistic import train_logistic
+from roi_pooling import RoiHead, roi_align, ROI_GRID, ROI_HEAD_FILE
+
+try:
+    from keras.applications.mobilenet_v2 import preprocess_input
+    from keras.callbacks import EarlyStopping, TensorBoard, ModelCheckpoint
+    from keras.models import load_model
+    from keras.optimizers import Adam
+    from keras.preprocessing.image import load_img, img_to_array
+
+    from model_helpers import (load_inference_model, save_model,
+                               count_images, get_generators,
+                               get_initial_model, get_multi_head_model,
+                               get_student_model, get_backbone_model, get_test_generator,
+                               distill_generator, resize_batch)
+    KERAS_AVAILABLE = True
+    _keras_import_error = None
+except ImportError as error:
+    # Inference-only installation (e.g. TFLite backend), training and
+    # folder-based prediction raise the error when called.
+    KERAS_AVAILABLE = False
+    _keras_import_error = error
+
+
+CALIBRATION_SIZE = 300
 EPOCHS = 50
 WIDTH = 128
 HEIGHT = 128
 BATCH_SIZE = 32
+INFERENCE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+HEADS_FILE = 'heads.json'
+# (MobileNetV2 alpha, input side in pixels) of student models to try
+STUDENT_CANDIDATES = ((0.35, 64), (0.35, 96), (0.5, 64), (0.5, 96))
+DISTILLATION_REPORT_FILE = 'distillation.json'
 
 models = {}
 
 
-def load_parking_model(model_path):
+class BucketedModel:
+    """ Model run only on a fixed set of batch sizes ("buckets").
+
+    A batch is padded up to the smallest bucket it fits into, batches
+    larger than the largest bucket are split.  So the underlying compiled
+    function (or interpreter) always sees one of a few known shapes and
+    never has to be retraced or reallocated for a new one, and all of them
+    can be warmed up in advance.
+
+    Images of a different size than the model input (e.g. of a distilled
+    model, see `distill_and_save`) are resized.
+
+    Padding buffers are shared by threads (see InferenceExecutor): a buffer
+    is taken from a pool of its bucket for a single run and returned after,
+    so there are only as many buffers as batches of a bucket ever run at
+    the same time.
+    """
+    def __init__(self, model, buckets=INFERENCE_BUCKETS):
+        """
+        :param model: backend object (see inference_backends.py)
+        :param buckets: batch sizes to run the model on
+        """
+        self.model = model
+        self.buckets = sorted(set(buckets))
+        self._buffers = {bucket: [] for bucket in self.buckets}
+        self._lock = threading.Lock()
+
+    def _take_buffer(self, bucket):
+        with self._lock:
+            if self._buffers[bucket]:
+                return self._buffers[bucket].pop()
+        return np.zeros((bucket,) + tuple(self.model.input_shape),
+                        dtype=np.float32)
+
+    def _return_buffer(self, bucket, buffer):
+        with self._lock:
+            self._buffers[bucket].append(buffer)
+
+    def warmup(self):
+        """ Run the model once on each bucket.
+
+        The model (e.g. TFLite interpreters) and padding buffers are shared
+        by threads, so the thread running the warmup does not matter.
+        """
+        for bucket in self.buckets:
+            buffer = self._take_buffer(bucket)
+            try:
+                self.model.predict(buffer)
+            finally:
+                self._return_buffer(bucket, buffer)
+
+    def predict(self, batch):
+        """ Run the model.
+
+        :param batch: float32 numpy array, shape (N, H, W, 3)
+        :return: numpy array of model outputs, shape (N, K)
+        """
+        largest = self.buckets[-1]
+        resize = batch.shape[1:] != tuple(self.model.input_shape)
+        outputs = []
+        for start in range(0, max(len(batch), 1), largest):
+            chunk = batch[start:start + largest]
+            bucket = next(b for b in self.buckets if b >= len(chunk))
+            if bucket == len(chunk) and not resize:
+                outputs.append(self.model.predict(chunk))
+                continue
+
+            buffer = self._take_buffer(bucket)
+            try:
+                if resize:
+                    height, width = self.model.input_shape[:2]
+                    for index, image in enumerate(chunk):
+                        cv2.resize(image, (width, height), dst=buffer[index],
+                                   interpolation=cv2.INTER_AREA)
+                else:
+                    buffer[:len(chunk)] = chunk
+                outputs.append(self.model.predict(buffer)[:len(chunk)])
+            finally:
+                self._return_buffer(bucket, buffer)
+
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+
+class ModelHead:
+    """ A head of a model with a shared backbone (see
+    model_helpers.get_multi_head_model), used in place of a separate model.
+
+    `batch_predict` runs batches of all heads of the same shared model
+    through it at once, `predict` of a single head is there for other uses.
+    """
+    def __init__(self, shared, index):
+        """
+        :param shared: loaded shared model (outputs a column per head)
+        :param index: index of the head
+        """
+        self.shared = shared
+        self.index = index
+
+    def predict(self, batch):
+        """ Run the shared model and take the output of the head.
+
+        :param batch: float32 numpy array, shape (N, H, W, 3)
+        :return: numpy array of head outputs, shape (N, 1)
+        """
+        return self.shared.predict(batch)[:, self.index:self.index + 1]
+
+
+def load_heads(model_path):
+    """ Load head names of a shared model.
+
+    :param model_path: path to the model folder
+    :return: list of head (model) names in the order of model outputs
+    """
+    with open(os.path.join(model_path, HEADS_FILE)) as f_heads:
+        return json.load(f_heads)['heads']
+
+
+def save_heads(model_path, heads):
+    """ Save head names of a shared model.
+
+    :param model_path: path to the model folder
+    :param heads: list of head (model) names in the order of model outputs
+    """
+    with open(os.path.join(model_path, HEADS_FILE), 'w') as f_heads:
+        json.dump({'heads': heads}, f_heads, indent=2)
+
+
+class InferenceExecutor:
+    """ Runs models on a pool of threads.
+
+    Batches of different models run concurrently, and a large batch of
+    a single model is split into parts run concurrently as well.  Both
+    TensorFlow and TFLite release the GIL while computing, so threads are
+    enough; the number of threads a single operation may use should be
+    limited accordingly (see "threads" inference option).
+    """
+    def __init__(self, workers, min_split=16):
+        """
+        :param workers: number of threads
+        :param min_split: minimal number of images in a part of a split batch
+        """
+        self.workers = workers
+        self.min_split = min_split
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='inference')
+
+    @classmethod
+    def from_options(cls, options):
+        """ Create an executor from "inference" model config options.
+
+        :param options: dict of inference options
+        :return: InferenceExecutor object or None if there should be
+                 a single worker
+        """
+        workers = options.get('workers', 1)
+        if workers <= 1:
+            return None
+
+        return cls(workers, options.get('min_split', 16))
+
+    def predict(self, parking_models, batches):
+        """ Run models on their batches.
+
+        :param parking_models: dict of model names mapped to loaded models
+        :param batches: dict of model names mapped to numpy tensors
+        :return: dict of model names mapped to numpy arrays of outputs
+        """
+        futures = {}
+        for model_name, batch in batches.items():
+            parts = max(1, min(self.workers, len(batch) // self.min_split))
+            bounds = np.linspace(0, len(batch), parts + 1).astype(int)
+            futures[model_name] = [
+                self._pool.submit(parking_models[model_name].predict,
+                                  batch[start:end])
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+        return {model_name: np.concatenate([f.result() for f in parts])
+                for model_name, parts in futures.items()}
+
+
+def _require_keras():
+    """ Check that training dependencies (Keras and model_helpers) are
+    imported.
+
+    :raise ImportError: in case they failed to import
+    """
+    if not KERAS_AVAILABLE:
+        raise ImportError('Keras and model_helpers are required, but failed '
+                          'to import: {}'.format(_keras_import_error)
+                          ) from _keras_import_error
+
+
+def load_parking_model(model_path, backend_options=None):
     """ Load a single model from the path.
 
     :param model_path: path to the model folder
+    :param backend_options: dict of "inference" model config options
+                            or None to use Keras
     """
     name = os.path.basename(os.path.normpath(model_path))
-    models[name] = load_inference_model(
-        os.path.join(model_path, 'model.json'),
-        os.path.join(model_path, 'weights.h5'))
+    models[name] = load_backend(model_path, backend_options)
 
 
-def load_all_parking_models(models_path):
+def load_all_parking_models(models_path, backend_options=None):
     """ Load all models from the path.
 
     :param models_path: path to models folder
+    :param backend_options: dict of "inference" model config options
+                            or None to use Keras
     """
     for entry in os.scandir(models_path):
         if entry.is_dir():
-            models[entry.name] = load_inference_model(
-                os.path.join(models_path, entry.name, 'model.json'),
-                os.path.join(models_path, entry.name, 'weights.h5'))
+            models[entry.name] = load_backend(entry.path, backend_options)
 
 
 def train_and_save(train_data_path, dev_data_path, save_to_path):
@@ -54,6 +278,7 @@ def train_and_save(train_data_path, dev_data_path, save_to_path):
     :param save_to_path: path to the model folder (where to save
                          model.json and weights.h5)
     """
+    _require_keras()
     model = get_initial_model(WIDTH, HEIGHT)
 
     checkpoint_path = os.path.join(save_to_path, 'weights.h5')
@@ -96,6 +321,7 @@ def retrain_and_save(source_model_path, train_data_path, dev_data_path,
     :param save_to_path: path to the new model folder (where to save
                          model.json and weights.h5)
     """
+    _require_keras()
     model = load_inference_model(os.path.join(source_model_path, 'model.json'),
                                  os.path.join(source_model_path, 'weights.h5'))
     adam = Adam(1e-4)
@@ -138,6 +364,309 @@ def retrain_and_save(source_model_path, train_data_path, dev_data_path,
     save_model(best_checkpoint, save_to_path)
 
 
+def train_multi_head_and_save(dataset_path, heads, save_to_path,
+                              source_model_paths=None, epochs=EPOCHS):
+    """
+    Train and save a model with a shared backbone and a head per model.
+
+    Heads are trained in turns, one epoch each, on datasets of their models,
+    the backbone is trained by all of them.
+
+    :param dataset_path: path to the dataset folder, with a subfolder per
+                         head, each having `training` and `validation`
+                         subfolders
+    :param heads: list of head (model) names
+    :param save_to_path: path to the model folder (where to save
+                         model.json, weights.h5 and heads.json)
+    :param source_model_paths: optional dict of head names mapped to paths
+                               of existing model folders to start from
+                               (the backbone is taken from the first head)
+    :param epochs: maximum number of epochs, 0 to only convert a single
+                   source model
+    :raise ValueError: in case several source models are converted without
+                       training: heads of all but the first one were trained
+                       on features of other backbones
+    """
+    _require_keras()
+    if not epochs and len(source_model_paths or {}) > 1:
+        raise ValueError('Heads of several source models need fine-tuning '
+                         'on the shared backbone, set epochs')
+
+    source_models = {
+        head: load_inference_model(os.path.join(path, 'model.json'),
+                                   os.path.join(path, 'weights.h5'))
+        for head, path in (source_model_paths or {}).items()}
+    model, head_models = get_multi_head_model(WIDTH, HEIGHT, heads,
+                                              source_models)
+
+    generators = {head: get_generators(
+        os.path.join(dataset_path, head, 'training'),
+        os.path.join(dataset_path, head, 'validation'),
+        WIDTH, HEIGHT, BATCH_SIZE) for head in heads} if epochs else {}
+    checkpoint_path = os.path.join(save_to_path, 'weights.h5')
+    best_loss = None
+    epochs_without_improvement = 0
+    for epoch in range(epochs):
+        val_loss = 0
+        for head in heads:
+            train_generator, validation_generator = generators[head]
+            train_path = os.path.join(dataset_path, head, 'training')
+            dev_path = os.path.join(dataset_path, head, 'validation')
+            history = head_models[head].fit_generator(
+                train_generator,
+                steps_per_epoch=count_images(train_path) // BATCH_SIZE,
+                initial_epoch=epoch,
+                epochs=epoch + 1,
+                validation_data=validation_generator,
+                validation_steps=count_images(dev_path) // BATCH_SIZE,
+                verbose=True,
+                shuffle=True
+            )
+            val_loss += history.history['val_loss'][-1]
+
+        if best_loss is None or val_loss < best_loss:
+            best_loss = val_loss
+            epochs_without_improvement = 0
+            model.save_weights(checkpoint_path)
+        else:
+            epochs_without_improvement += 1
+            if epochs_without_improvement >= 5:
+                break
+
+    if best_loss is not None:
+        model.load_weights(checkpoint_path)
+    save_model(model, save_to_path)
+    save_heads(save_to_path, heads)
+
+
+def distill_and_save(teacher_path, train_data_path, dev_data_path,
+                     save_to_path, max_accuracy_gap=0.01,
+                     candidates=STUDENT_CANDIDATES, teacher_weight=0.5):
+    """
+    Distill an existing model into compact students and save the fastest
+    one which is accurate enough.
+
+    Each student is trained on a mix of teacher outputs and true labels,
+    then evaluated on the validation set: accuracy, agreement with the
+    teacher and CPU throughput.  The report of all students is saved as
+    distillation.json.
+
+    :param teacher_path: path to the existing model folder
+    :param train_data_path: path to the training data folder
+    :param dev_data_path: path to the validation data folder
+    :param save_to_path: path to the model folder (where to save
+                         model.json and weights.h5 of the student)
+    :param max_accuracy_gap: maximum accuracy loss of a student compared
+                             to the teacher, on the validation set
+    :param candidates: list of (MobileNetV2 alpha, input side in pixels)
+                       of students to try
+    :param teacher_weight: weight of teacher outputs in training targets
+                           (0..1), the rest comes from true labels
+    :return: report, a dict with "teacher" and "students" results and
+             "exported" index of the saved student (None if none is
+             accurate enough)
+    """
+    _require_keras()
+    teacher = load_inference_model(
+        os.path.join(teacher_path, 'model.json'),
+        os.path.join(teacher_path, 'weights.h5'))
+    images, labels = _load_validation_set(dev_data_path)
+    teacher_states = get_states(teacher.predict(images,
+                                                batch_size=BATCH_SIZE))
+    report = {'teacher': _evaluate(teacher, images, labels, teacher_states),
+              'students': [],
+              'exported': None}
+
+    best_speed = None
+    for index, (alpha, side) in enumerate(candidates):
+        student = get_student_model(side, side, alpha)
+        checkpoint_path = os.path.join(
+            save_to_path, 'student_{}_{}.h5'.format(alpha, side))
+        train_generator, validation_generator = get_generators(
+            train_data_path, dev_data_path, WIDTH, HEIGHT, BATCH_SIZE)
+        student.fit_generator(
+            distill_generator(train_generator, teacher, side, side,
+                              teacher_weight),
+            steps_per_epoch=count_images(train_data_path) // BATCH_SIZE,
+            epochs=EPOCHS,
+            validation_data=distill_generator(validation_generator, teacher,
+                                              side, side, 0),
+            callbacks=[EarlyStopping(monitor='val_loss', min_delta=0,
+                                     patience=5, verbose=0, mode='auto'),
+                       ModelCheckpoint(checkpoint_path, monitor='val_loss',
+                                       save_best_only=True,
+                                       save_weights_only=True, mode='auto')],
+            validation_steps=count_images(dev_data_path) // BATCH_SIZE,
+            verbose=True
+        )
+        student.load_weights(checkpoint_path)
+        os.remove(checkpoint_path)
+
+        result = _evaluate(student, resize_batch(images, side, side), labels,
+                           teacher_states)
+        result.update({'alpha': alpha, 'side': side,
+                       'parameters': student.count_params()})
+        report['students'].append(result)
+        gap = report['teacher']['accuracy'] - result['accuracy']
+        if gap <= max_accuracy_gap and (
+                best_speed is None or result['crops_per_second'] > best_speed):
+            best_speed = result['crops_per_second']
+            report['exported'] = index
+            save_model(student, save_to_path)
+
+    with open(os.path.join(save_to_path, DISTILLATION_REPORT_FILE),
+              'w') as f_report:
+        json.dump(report, f_report, indent=2)
+    return report
+
+
+def train_roi_and_save(train_data_path, dev_data_path, save_to_path,
+                       source_model_path=None, grid=ROI_GRID):
+    """
+    Train a model for whole-frame inference with per-slot ROI pooling
+    (see roi_pooling.py) and save it.
+
+    The backbone is the convolutional part of an existing model (or
+    MobileNetV2 with ImageNet weights), only the logistic head is trained,
+    on features pooled from slot images the same way they are pooled
+    from a frame.
+
+    :param train_data_path: path to the training data folder
+    :param dev_data_path: path to the validation data folder
+    :param save_to_path: path to the model folder (where to save
+                         model.json, weights.h5 and roi_head.npz)
+    :param source_model_path: optional path to an existing model folder
+                              to take the backbone from
+    :param grid: (columns, rows) of points pooled per slot
+    :return: accuracy on the validation set
+    """
+    _require_keras()
+    source_model = None
+    if source_model_path:
+        source_model = load_inference_model(
+            os.path.join(source_model_path, 'model.json'),
+            os.path.join(source_model_path, 'weights.h5'))
+    backbone = get_backbone_model(source_model)
+    stride = WIDTH // backbone.predict(
+        np.zeros((1, HEIGHT, WIDTH, 3), dtype=np.float32)).shape[2]
+
+    def pool(folder):
+        images = list_labeled_images(folder)
+        points = grid_points(WIDTH, HEIGHT, grid)
+        pooled = []
+        for start in range(0, len(images), BATCH_SIZE):
+            batch = read_crops([path for path, _
+                                in images[start:start + BATCH_SIZE]])
+            pooled.extend(roi_align(features, points, stride)
+                          for features in backbone.predict(batch))
+        return (np.array(pooled, dtype=np.float32),
+                np.array([label for _, label in images]))
+
+    weights, bias = train_logistic(*pool(train_data_path))
+    head = RoiHead(weights, bias, grid, stride)
+    pooled, labels = pool(dev_data_path)
+    accuracy = float(np.mean(get_states(head.predict(pooled)) == labels))
+
+    save_model(backbone, save_to_path)
+    head.save(os.path.join(save_to_path, ROI_HEAD_FILE))
+    return accuracy
+
+
+def train_cascade_and_save(train_data_path, save_to_path, low=0.1,
+                           high=0.9):
+    """
+    Train the first stage of a two-stage cascade (see cascade.py)
+    and save it.
+
+    :param train_data_path: path to the training data folder
+    :param save_to_path: path to the model folder (where to save
+                         cascade.npz)
+    :param low: lower bound of the uncertain band
+    :param high: upper bound of the uncertain band
+    :return: Cascade object
+    """
+    features, labels = _cascade_features(train_data_path)
+    cascade = Cascade.fit(features, labels, low, high)
+    cascade.save(os.path.join(save_to_path, CASCADE_FILE))
+    return cascade
+
+
+def evaluate_cascade(model_path, cascade, test_folder, bands,
+                     backend_options=None):
+    """ Evaluate a cascade with different uncertain bands.
+
+    :param model_path: path to the model folder
+    :param cascade: Cascade object
+    :param test_folder: path to the classified images (`free` and
+                        `occupied` subfolders)
+    :param bands: list of (low, high) bounds of the uncertain band
+    :param backend_options: dict of "inference" model config options
+                            or None to use Keras
+    :return: list of dicts, one per band, with "low", "high",
+             "first_stage" (share of slots decided by the first stage),
+             "first_stage_accuracy" (on slots it decided), "model_accuracy"
+             (of the model alone) and "cascade_accuracy"
+    """
+    model = BucketedModel(load_backend(model_path, backend_options))
+    images = list_labeled_images(test_folder)
+    labels = np.array([label for _, label in images])
+    probabilities = []
+    model_states = []
+    for start in range(0, len(images), BATCH_SIZE):
+        batch = read_crops([path for path, _
+                            in images[start:start + BATCH_SIZE]])
+        probabilities.append(cascade.predict(batch))
+        model_states.append(get_states(model.predict(batch)))
+    probabilities = np.concatenate(probabilities)
+    model_states = np.concatenate(model_states)
+    first_stage_states = (probabilities > 0.5).astype(np.int64)
+
+    results = []
+    for low, high in bands:
+        confident = (probabilities < low) | (probabilities > high)
+        states = np.where(confident, first_stage_states, model_states)
+        results.append({
+            'low': low,
+            'high': high,
+            'first_stage': float(np.mean(confident)),
+            'first_stage_accuracy': float(np.mean(
+                first_stage_states[confident] == labels[confident])
+                                          if confident.any() else 1.0),
+            'model_accuracy': float(np.mean(model_states == labels)),
+            'cascade_accuracy': float(np.mean(states == labels))
+        })
+    return results
+
+
+def _cascade_features(folder):
+    images = list_labeled_images(folder)
+    features = []
+    for start in range(0, len(images), BATCH_SIZE):
+        features.append(cascade_features(read_crops(
+            [path for path, _ in images[start:start + BATCH_SIZE]])))
+    return (np.concatenate(features),
+            np.array([label for _, label in images]))
+
+
+def _load_validation_set(dev_data_path):
+    validation_generator = get_test_generator(dev_data_path, WIDTH, HEIGHT,
+                                              BATCH_SIZE)
+    batches = [validation_generator[i]
+               for i in range(len(validation_generator))]
+    return (np.concatenate([images for images, _ in batches]),
+            np.concatenate([labels for _, labels in batches]).astype(int))
+
+
+def _evaluate(model, images, labels, teacher_states):
+    model.predict(images[:BATCH_SIZE])  # warm up
+    start_time = time.time()
+    states = get_states(model.predict(images, batch_size=BATCH_SIZE))
+    elapsed = time.time() - start_time
+    return {'accuracy': float(np.mean(states == labels)),
+            'agreement': float(np.mean(states == teacher_states)),
+            'crops_per_second': len(images) / elapsed}
+
+
 def predict(folder):
     """ Predict state (free/occupied) for each image in the folder.
 
@@ -151,6 +680,7 @@ def predict(folder):
              <probability>: probability that the parking slot is occupied
                 (float in range [0..1])
     """
+    _require_keras()
     res = {}
     for dirpath, _, filenames in os.walk(folder):
         model_name = os.path.basename(dirpath)
@@ -174,12 +704,23 @@ def predict(folder):
     return res
 
 
-def batch_predict(batch_input, models_to_ids):
+def batch_predict(batch_input, models_to_ids, parking_models=None,
+                  executor=None, cascades=None):
     """ Predict state (free/occupied) for each image in a numpy tensor.
 
+    With cascades given, slots of a model with a cascade are classified by
+    its first stage, only uncertain ones are passed to the model.
+
     :param batch_input: dict of a model names mapped to
            numpy tensors of parking spots to recognize
     :param models_to_ids: dict of a model names mapped to ids
+    :param parking_models: dict of model names mapped to loaded models
+           (e.g. ModelRegistry.models) or None to use models loaded with
+           `load_all_parking_models`
+    :param executor: InferenceExecutor object to run models concurrently
+           or None to run them one after another
+    :param cascades: dict of model names mapped to cascade.Cascade objects
+           or None to run models on all slots
     :return: dict in the following format:
              {<slot id>: (<state>, <probability>), ...}
 
@@ -189,18 +730,81 @@ def batch_predict(batch_input, models_to_ids):
                 (float in range [0..1])
     """
     res = {}
+    if parking_models is None:
+        parking_models = models
 
+    batches = {}
+    remaining_ids = {}
     for model_name, ids in models_to_ids.items():
-        model = models[model_name]
-        predictions = model.predict(batch_input[model_name])
+        batch = batch_input[model_name]
+        cascade = cascades.get(model_name) if cascades else None
+        if cascade is not None:
+            probabilities, confident = cascade.split(batch)
+            for slot_id, probability, decided in zip(ids, probabilities,
+                                                     confident):
+                if decided:
+                    res[slot_id] = (int(probability > 0.5), str(probability))
+            if confident.all():
+                continue
+            if confident.any():
+                batch = batch[~confident]
+                ids = [slot_id for slot_id, decided in zip(ids, confident)
+                       if not decided]
+        batches[model_name] = batch
+        remaining_ids[model_name] = ids
+
+    outputs = _run_models(parking_models, batches, executor)
 
-        for slot_id, probabilities in enumerate(predictions):
-            pred_occupancy = np.argmax(probabilities)
-            res[ids[slot_id]] = (pred_occupancy.item(), str(probabilities[pred_occupancy]))
+    for model_name, ids in remaining_ids.items():
+        predictions = outputs[model_name]
+        states = get_states(predictions)
+
+        for slot_id, state, probabilities in zip(ids, states, predictions):
+            probability = (probabilities[0] if len(probabilities) == 1
+                           else probabilities[state])
+            res[slot_id] = (state.item(), str(probability))
 
     return res
 
 
+def _run_models(parking_models, batches, executor=None):
+    """ Run models on their batches.  Batches of heads of the same shared
+    model are concatenated and run through the model once.
+    """
+    jobs_models = {}
+    jobs_batches = {}
+    shared_jobs = {}
+    for model_name, batch in batches.items():
+        model = parking_models[model_name]
+        if isinstance(model, ModelHead):
+            # Tuple keys can not clash with model names
+            job = ('shared', id(model.shared))
+            jobs_models[job] = model.shared
+            shared_jobs.setdefault(job, []).append(model_name)
+        else:
+            jobs_models[model_name] = model
+            jobs_batches[model_name] = batch
+    for job, model_names in shared_jobs.items():
+        jobs_batches[job] = np.concatenate(
+            [batches[model_name] for model_name in model_names])
+
+    if executor is None:
+        outputs = {job: jobs_models[job].predict(batch)
+                   for job, batch in jobs_batches.items()}
+    else:
+        outputs = executor.predict(jobs_models, jobs_batches)
+
+    for job, model_names in shared_jobs.items():
+        shared_outputs = outputs.pop(job)
+        start = 0
+        for model_name in model_names:
+            end = start + len(batches[model_name])
+            index = parking_models[model_name].index
+            outputs[model_name] = shared_outputs[start:end, index:index + 1]
+            start = end
+    return outputs
+
+
 def classify(input_folder, output_folder, model_name):
     """ Classify images as free or occupied and copy them to the right folders.
 
@@ -208,6 +812,7 @@ def classify(input_folder, output_folder, model_name):
     :param output_folder: path to output folder with classified images
     :param model_name: model name
     """
+    _require_keras()
     free_folder = os.path.join(output_folder, 'free')
     occupied_folder = os.path.join(output_folder, 'occupied')
     for subdir, _, files in os.walk(input_folder):
@@ -236,14 +841,16 @@ def test_model(model_path, test_folder, misclassified_folder):
     :param test_folder: path to the classified images
     :param misclassified_folder: path to output folder with misclassified images
     """
+    _require_keras()
     model = load_inference_model(os.path.join(model_path, 'model.json'),
                                  os.path.join(model_path, 'weights.h5'))
+    target_size = tuple(model.input_shape[1:3])
     for subdir, _, files in os.walk(test_folder):
         for src_name in files:
             maybe_img = os.path.join(subdir, src_name)
 
             if maybe_img.endswith(('.png', '.jpg', '.bmp')):
-                x = img_to_array(load_img(maybe_img, target_size=(WIDTH, HEIGHT)))
+                x = img_to_array(load_img(maybe_img, target_size=target_size))
                 x = np.expand_dims(x, axis=0)
                 is_occupied = model.predict(preprocess_input(x)) > 0.5
                 is_occupied_gt = "occupied" in subdir
@@ -261,3 +868,131 @@ def test_model(model_path, test_folder, misclassified_folder):
                         os.makedirs(dest_folder, exist_ok=True)
                         dest_path = os.path.join(dest_folder, src_name)
                         copyfile(maybe_img, dest_path)
+
+
+def convert_to_tflite(model_path, quantization, calibration_folder=None,
+                      calibration_size=CALIBRATION_SIZE):
+    """ Convert a Keras model to TFLite with post-training quantization.
+
+    Requires TensorFlow 2.3 or newer, so it runs in the conversion
+    environment (model/requirements.convert.txt) rather than the training
+    one (TensorFlow 1.13).
+
+    :param model_path: path to the model folder (model.json and weights.h5),
+                       the converted model is saved there as well
+    :param quantization: "float32" (no quantization), "float16" (float16
+                         weights) or "int8" (int8 weights and activations)
+    :param calibration_folder: path to a folder with slot images to
+                               calibrate int8 activation ranges on
+                               (e.g. the training set of the model)
+    :param calibration_size: maximum number of calibration images
+    :return: path to the converted model
+    :raise RuntimeError: in case TensorFlow is older than 2.3
+    """
+    import tensorflow as tf
+
+    if tuple(int(part) for part in tf.__version__.split('.')[:2]) < (2, 3):
+        raise RuntimeError(
+            'TFLite conversion requires TensorFlow 2.3 or newer, found {}, '
+            'install model/requirements.convert.txt'.format(tf.__version__))
+
+    with open(os.path.join(model_path, KERAS_STRUCTURE_FILE)) as f_model:
+        model = tf.keras.models.model_from_json(f_model.read())
+    model.load_weights(os.path.join(model_path, KERAS_WEIGHTS_FILE))
+
+    output_path = tflite_model_path(model_path, quantization)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if not calibration_folder:
+            raise ValueError('int8 quantization needs calibration images')
+
+        paths = [path for path, _ in list_labeled_images(calibration_folder)]
+        random.shuffle(paths)
+        calibration = read_crops(paths[:calibration_size])
+
+        def representative_dataset():
+            for crop in calibration:
+                yield [crop[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    with open(output_path, 'wb') as f_out:
+        f_out.write(converter.convert())
+    return output_path
+
+
+def compare_backends(model_path, test_folder, backends_options,
+                     batch_size=BATCH_SIZE):
+    """ Compare accuracy and throughput of inference backends.
+
+    :param model_path: path to the model folder
+    :param test_folder: path to the classified images (`free` and
+                        `occupied` subfolders)
+    :param backends_options: list of "inference" model config options,
+                             one per backend to compare, the first one
+                             is the reference for agreement
+    :param batch_size: number of images per model call
+    :return: list of dicts with "accuracy", "agreement" (share of images
+             classified the same as by the reference) and "images_per_second",
+             one per backend
+    """
+    images = list_labeled_images(test_folder)
+    batch = read_crops([path for path, _ in images])
+    labels = np.array([label for _, label in images])
+
+    results = []
+    reference = None
+    for options in backends_options:
+        backend = load_backend(model_path, options)
+        backend.predict(batch[:batch_size])  # warm up
+        outputs = []
+        start_time = time.time()
+        for start in range(0, len(batch), batch_size):
+            outputs.append(backend.predict(batch[start:start + batch_size]))
+        elapsed = time.time() - start_time
+
+        states = get_states(np.concatenate(outputs))
+        if reference is None:
+            reference = states
+        results.append({
+            'accuracy': float(np.mean(states == labels)),
+            'agreement': float(np.mean(states == reference)),
+            'images_per_second': len(batch) / elapsed
+        })
+    return results
+
+
+def get_states(outputs):
+    """ Get slot states from model outputs.
+
+    :param outputs: numpy array of model outputs, shape (N, K), either
+                    probabilities of being occupied (K = 1) or class
+                    probabilities (K > 1)
+    :return: numpy array of states, 0 (free) or 1 (occupied)
+    """
+    if outputs.shape[1] == 1:
+        return (outputs[:, 0] > 0.5).astype(np.int64)
+    return np.argmax(outputs, axis=1)
+
+
+def list_labeled_images(folder):
+    """ List classified images.
+
+    :param folder: path to the folder with `free` and `occupied` subfolders
+    :return: list of (path, state) tuples, state is 0 (free) or 1 (occupied)
+    """
+    images = []
+    for state, subfolder in enumerate(('free', 'occupied')):
+        for subdir, _, files in os.walk(os.path.join(folder, subfolder)):
+            images.extend((os.path.join(subdir, filename), state)
+                          for filename in sorted(files)
+                          if filename.endswith(('.png', '.jpg', '.bmp')))
+    return images
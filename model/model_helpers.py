@@ -2,11 +2,13 @@
 """
 import os
 
+import cv2
 import numpy as np
 from keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
 from keras.backend import image_data_format
-from keras.layers import Dense, Dropout, Flatten
-from keras.models import Sequential, model_from_json
+from keras.layers import (Concatenate, Dense, Dropout, Flatten,
+                          GlobalAveragePooling2D, Input)
+from keras.models import Model, Sequential, model_from_json
 from keras.optimizers import Adam
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 
@@ -105,6 +107,28 @@ def get_generators(train_data_path, val_data_path, width, height, batch_size):
 
     return train_generator, validation_generator
 
+def get_test_generator(data_path, width, height, batch_size):
+    """ Get a generator of labeled images in a fixed order, without
+    augmentation.
+
+    :param data_path: path to dataset
+    :param width: width of images in pixels
+    :param height: height of images in pixels
+    :param batch_size: batch size
+    :return: generator
+    """
+    test_datagen = ImageDataGenerator(
+        preprocessing_function=preprocess_input
+    )
+
+    return test_datagen.flow_from_directory(
+        data_path,
+        target_size=(width, height),
+        batch_size=batch_size,
+        class_mode='binary',
+        shuffle=False
+    )
+
 def get_initial_model(width, height):
     """ Get initial model.
 
@@ -134,3 +158,138 @@ def get_initial_model(width, height):
                   metrics=['accuracy'])
 
     return model
+
+def get_multi_head_model(width, height, heads, source_models=None):
+    """ Get a model with a shared MobileNetV2 backbone and a head per
+    model name.
+
+    The output is a single tensor with a column per head (probability
+    of being occupied), in the order of `heads`.
+
+    :param width: width of images in pixels
+    :param height: height of images in pixels
+    :param heads: list of head (model) names
+    :param source_models: optional dict of head names mapped to existing
+                          models (see `get_initial_model`) to take weights
+                          from, the backbone is taken from the first head
+    :return: (Keras model with all heads,
+              dict of head names mapped to Keras models with a single head,
+              sharing layers with the first one)
+    """
+    if image_data_format() == 'channels_first':
+        input_shape = (3, width, height)
+    else:
+        input_shape = (width, height, 3)
+
+    source_models = source_models or {}
+    mobilenet = MobileNetV2(
+        weights=None if source_models else 'imagenet', include_top=False,
+        input_shape=input_shape)
+    if source_models:
+        mobilenet.set_weights(
+            source_models[heads[0]].layers[0].get_weights())
+    for layer in mobilenet.layers[:]:
+        layer.trainable = True
+
+    inputs = Input(shape=input_shape)
+    features = Flatten()(mobilenet(inputs))
+    outputs = []
+    for head in heads:
+        hidden = Dense(512, activation='relu',
+                       name='{}_hidden'.format(head))
+        output = Dense(1, activation='sigmoid',
+                       name='{}_output'.format(head))
+        outputs.append(output(Dropout(0.5)(hidden(features))))
+        if head in source_models:
+            hidden.set_weights(source_models[head].layers[2].get_weights())
+            output.set_weights(source_models[head].layers[4].get_weights())
+
+    head_models = {}
+    for head, output in zip(heads, outputs):
+        head_models[head] = Model(inputs=inputs, outputs=output)
+        head_models[head].compile(loss='binary_crossentropy',
+                                  optimizer=Adam(1e-4), metrics=['accuracy'])
+
+    model = Model(inputs=inputs, outputs=Concatenate()(outputs)
+                  if len(outputs) > 1 else outputs[0])
+    return model, head_models
+
+def get_student_model(width, height, alpha):
+    """ Get a compact model to distill a bigger one into.
+
+    :param width: width of images in pixels
+    :param height: height of images in pixels
+    :param alpha: width multiplier of MobileNetV2 (e.g. 0.35 or 0.5)
+    :return: Keras model
+    """
+    if image_data_format() == 'channels_first':
+        input_shape = (3, width, height)
+    else:
+        input_shape = (width, height, 3)
+
+    mobilenet = MobileNetV2(weights='imagenet', include_top=False,
+                            input_shape=input_shape, alpha=alpha)
+    model = Sequential()
+    model.add(mobilenet)
+    model.add(GlobalAveragePooling2D())
+    model.add(Dropout(0.2))
+    model.add(Dense(1, activation='sigmoid'))
+
+    model.compile(loss='binary_crossentropy', optimizer=Adam(1e-3),
+                  metrics=['accuracy'])
+
+    return model
+
+def get_backbone_model(source_model=None):
+    """ Get a fully convolutional MobileNetV2 backbone accepting images
+    of any size, for whole-frame inference (see roi_pooling.py).
+
+    :param source_model: optional existing model (see `get_initial_model`)
+                         to take backbone weights from, ImageNet weights
+                         are used otherwise
+    :return: Keras model
+    """
+    if image_data_format() == 'channels_first':
+        input_shape = (3, None, None)
+    else:
+        input_shape = (None, None, 3)
+
+    mobilenet = MobileNetV2(
+        weights=None if source_model else 'imagenet', include_top=False,
+        input_shape=input_shape)
+    if source_model:
+        mobilenet.set_weights(source_model.layers[0].get_weights())
+    return mobilenet
+
+def resize_batch(batch, width, height):
+    """ Resize a batch of images.
+
+    :param batch: numpy array of images, shape (N, H, W, C)
+    :param width: new width in pixels
+    :param height: new height in pixels
+    :return: numpy array of resized images, shape (N, height, width, C)
+    """
+    if batch.shape[1:3] == (height, width):
+        return batch
+    return np.stack([cv2.resize(image, (width, height),
+                                interpolation=cv2.INTER_AREA)
+                     for image in batch])
+
+def distill_generator(generator, teacher, width, height, teacher_weight):
+    """ Wrap a generator of labeled images to train a student on.
+
+    Targets are a mix of teacher outputs and true labels, images are
+    resized to the student input size.
+
+    :param generator: generator of (images, labels) batches at the teacher
+                      input size
+    :param teacher: Keras model
+    :param width: width of student input in pixels
+    :param height: height of student input in pixels
+    :param teacher_weight: weight of teacher outputs in targets (0..1)
+    :return: generator of (images, targets) batches
+    """
+    for images, labels in generator:
+        soft_labels = teacher.predict(images)[:, 0]
+        targets = teacher_weight * soft_labels + (1 - teacher_weight) * labels
+        yield resize_batch(images, width, height), targets
@@ -0,0 +1,258 @@
+""" Registry of loaded parking models.
+
+Only models used by the parking map are loaded.  Model files are
+fingerprinted by modification time, size and content hash, the hash is
+recalculated only when the modification time or size changes.  On refresh:
+
+- models the parking map needs, but which are not loaded yet, are loaded
+  right away (they are needed to classify the next frame);
+- models whose files changed are reloaded in a background thread, the old
+  ones keep serving until the new ones are ready;
+- models the parking map does not use any more are dropped;
+- other models are not touched.
+
+Models are wrapped into model_core.BucketedModel and warmed up on
+all batch sizes they will run on before they are used.
+
+With the cascade enabled, first stages of models (see cascade.py) are
+fingerprinted and (re)loaded together with their models, so a retrained
+model never keeps a stale first stage.  Cascades of heads of a shared model
+are loaded with the shared model.
+
+Loaded models are kept in a dict which is never modified, but replaced as
+a whole, so readers always see a consistent set of models.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from cascade import load_cascades, CASCADE_FILE
+from inference_backends import get_backend
+from model_core import (BucketedModel, ModelHead, load_heads,
+                        HEADS_FILE, INFERENCE_BUCKETS)
+
+logger = logging.getLogger('model')
+
+# Fingerprint of a single model file.
+FileFingerprint = namedtuple('FileFingerprint', ['mtime', 'size', 'digest'])
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class ModelRegistry:
+    """ Parking models loaded from the models folder.
+
+    With a shared model configured (see model_helpers.get_multi_head_model),
+    only its folder is loaded and models of the parking map are served by
+    its heads (model_core.ModelHead).
+    """
+    def __init__(self, models_path, backend_options=None,
+                 cascade_options=None):
+        """
+        :param models_path: path to models folder (a subfolder per model)
+        :param backend_options: dict of "inference" model config options
+                                or None to use Keras
+        :param cascade_options: dict of "cascade" model config options
+                                or None to load no cascades
+        """
+        self.models_path = models_path
+        self.backend, self.backend_options = get_backend(backend_options)
+        self.backend.configure(**self.backend_options)
+        self.shared_model = self.backend_options.get('shared_model')
+        self.cascade_options = cascade_options or {}
+        self.models = {}
+        self.cascades = ({} if self.cascade_options.get('enabled', False)
+                         else None)
+        self._model_names = set()
+        self._loaded = {}
+        self._heads = {}
+        self._cascades = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._reloading = None
+
+    def refresh(self, model_names):
+        """ Make models of the parking map available and reload changed ones.
+
+        :param model_names: iterable of model names used by the parking map
+        :raise ValueError: in case the shared model has no head for some
+                           of the models
+        """
+        model_names = set(model_names)
+        folders = {self.shared_model} if self.shared_model else model_names
+        with self._lock:
+            missing = folders - set(self._loaded)
+            if missing:
+                logger.info('Loading model(s): %s', ', '.join(sorted(missing)))
+                self._swap(self._load(missing), folders, model_names)
+            elif model_names != self._model_names:
+                self._swap({}, folders, model_names)
+
+        if self._reloading and self._reloading.is_alive():
+            return
+
+        self._reloading = threading.Thread(
+            target=self._reload_changed, args=(folders - missing,),
+            name='model-reloading')
+        self._reloading.daemon = True
+        self._reloading.start()
+
+    def wait(self):
+        """ Wait until background reloading finishes.
+        """
+        if self._reloading:
+            self._reloading.join()
+
+    def _reload_changed(self, folders):
+        try:
+            changed = self._find_changed(folders)
+            if not changed:
+                return
+
+            logger.info('Reloading changed model(s): %s',
+                        ', '.join(sorted(changed)))
+            loaded = self._load(changed)
+        except Exception:
+            logger.exception('Failed to reload model(s), keeping the old ones')
+            return
+
+        with self._lock:
+            # Models dropped from the parking map meanwhile stay dropped
+            try:
+                self._swap({name: model for name, model in loaded.items()
+                            if name in self._loaded}, set(self._loaded),
+                           self._model_names)
+            except ValueError:
+                logger.exception('Failed to reload model(s), keeping the '
+                                 'old ones')
+
+    def _find_changed(self, model_names):
+        changed = set()
+        for name in model_names:
+            known = self._fingerprints.get(name)
+            if known is None:
+                continue
+
+            fingerprint = self._fingerprint(name)
+            if _digests(fingerprint) != _digests(known):
+                changed.add(name)
+            elif fingerprint != known:
+                # Files were touched, but their content is the same
+                with self._lock:
+                    if name in self._fingerprints:
+                        self._fingerprints[name] = fingerprint
+        return changed
+
+    def _load(self, folders):
+        loaded = {}
+        for name in folders:
+            # Fingerprint first, so a file changed during loading is
+            # loaded once again on the next refresh.
+            fingerprint = self._fingerprint(name)
+            model_path = os.path.join(self.models_path, name)
+            model = BucketedModel(
+                self.backend.load(model_path, **self.backend_options),
+                self.backend_options.get('buckets', INFERENCE_BUCKETS))
+            # Models are warmed up before they are swapped in, so the first
+            # frame after (re)loading is classified as fast as other ones.
+            model.warmup()
+            heads = load_heads(model_path) if name == self.shared_model else None
+            cascades = (load_cascades(self.models_path, heads or [name],
+                                      self.cascade_options)
+                        if self.cascades is not None else None)
+            loaded[name] = (model, fingerprint, heads, cascades)
+        return loaded
+
+    def _swap(self, loaded, folders, model_names):
+        models = {name: model for name, model in self._loaded.items()
+                  if name in folders}
+        heads = {name: model_heads for name, model_heads
+                 in self._heads.items() if name in folders}
+        cascades = {name: model_cascades for name, model_cascades
+                    in self._cascades.items() if name in folders}
+        for name, (model, _, model_heads, model_cascades) in loaded.items():
+            models[name] = model
+            heads[name] = model_heads
+            cascades[name] = model_cascades
+
+        if self.shared_model:
+            shared_heads = heads[self.shared_model]
+            missing_heads = model_names - set(shared_heads)
+            if missing_heads:
+                raise ValueError(
+                    'Shared model {} has no head(s) for model(s): {}'.format(
+                        self.shared_model, ', '.join(sorted(missing_heads))))
+            self.models = {
+                name: ModelHead(models[self.shared_model],
+                                shared_heads.index(name))
+                for name in model_names}
+        else:
+            self.models = models
+
+        if self.cascades is not None:
+            self.cascades = {
+                model_name: cascade
+                for model_cascades in cascades.values()
+                for model_name, cascade in model_cascades.items()
+                if model_name in model_names}
+
+        for name, (_, fingerprint, _, _) in loaded.items():
+            self._fingerprints[name] = fingerprint
+        for name in set(self._fingerprints) - set(models):
+            del self._fingerprints[name]
+        self._loaded = models
+        self._heads = heads
+        self._cascades = cascades
+        self._model_names = model_names
+
+    def _fingerprint(self, name):
+        """ Digests of model files (including heads and cascades loaded with
+        the model), reusing known ones for files whose modification time and
+        size did not change.
+        """
+        model_path = os.path.join(self.models_path, name)
+        paths = list(self.backend.model_files(model_path,
+                                              **self.backend_options))
+        heads = None
+        if name == self.shared_model:
+            # Heads of a shared model are loaded with it
+            paths.append(os.path.join(model_path, HEADS_FILE))
+            heads = load_heads(model_path)
+        if self.cascades is not None:
+            for model_name in heads or [name]:
+                cascade_path = os.path.join(self.models_path, model_name,
+                                            CASCADE_FILE)
+                if os.path.exists(cascade_path):
+                    paths.append(cascade_path)
+        known = dict(self._fingerprints.get(name, ()))
+        fingerprint = []
+        for path in paths:
+            stat = os.stat(path)
+            previous = known.get(path)
+            if (previous is not None and previous.mtime == stat.st_mtime and
+                    previous.size == stat.st_size):
+                fingerprint.append((path, previous))
+            else:
+                fingerprint.append((path, FileFingerprint(
+                    stat.st_mtime, stat.st_size, file_digest(path))))
+        return tuple(fingerprint)
+
+
+def _digests(fingerprint):
+    return tuple(file_fingerprint.digest for _, file_fingerprint
+                 in fingerprint)
+
+
+def file_digest(path):
+    """ Calculate SHA-1 digest of a file.
+
+    :param path: path to the file
+    :return: hex digest
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f_in:
+        for chunk in iter(lambda: f_in.read(HASH_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
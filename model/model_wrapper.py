@@ -6,88 +6,477 @@ Here what it does:
    MQ host and port, delay in seconds between recognitions, etc.
 2. Looks for the latest file inside parking configurations folder (path was loaded at step 1),
    reads it. This is a json file, made via Sloth. We are going to use it as a grid to cut individual
-   parking spaces from camera frame.
-3. Using OpenCV, reads in the latest frame from camera.
+   parking spaces from camera frame. The grid is compiled once (see parking_map.py) and reused
+   until the file changes. Models used by the grid are loaded, changed ones are reloaded in
+   background (see model_registry.py).
+3. Using OpenCV, reads in the latest frame from camera. If all parking spaces are large enough,
+   the frame is decoded downscaled (with transforms of step 2 rescaled to match).
+   With "frame_source" set to "store", the latest image is found through the pointer of the
+   frame store (see utils/frame_store.py) instead of listing folders and files.
+   With "frame_source" set to "ring", the latest raw frame is taken from the frame ring written
+   by the video stream processor instead (see utils/frame_ring.py), nothing is decoded.
+   Ring frames may be scaled by the video stream processor, transforms of step 2 are rescaled
+   from the size of annotated images to the size of ring frames.
+   With motion gating enabled, compares it with the previous frames at low resolution.
+   If nothing moved, previous results are published again as a heartbeat and steps 4-5 are skipped.
+   With the refresh scheduler enabled, only slots whose refresh interval passed (and slots touched
+   by motion) are processed, up to a per-frame budget, see refresh_scheduler.py.
 4. Using config from step 2, crops, transforms and saves small images of individual parking spaces.
-5. Using trained models classifies all images from step 4 into free or occupied.
+5. Using trained models classifies all images from step 4 into free or occupied. With change
+   detection enabled, only slots which look different since their last classification (or were
+   not classified for a while) are passed to the models, others keep their previous results.
+   With the cascade enabled, a cheap first stage decides slots it is confident about and only
+   uncertain ones are passed to the models (see cascade.py).
+   With ROI pooling enabled, steps 4-5 are replaced with a single model run over the frame region
+   covering all slots, slots are classified from features pooled from it (see roi_pooling.py).
 6. Measures some additional information (like execution time), publishes it as a json to MQ topic.
+   With the refresh scheduler enabled, ages of slot results are published as well.
 7. Waits given in the config file delay before next execution loop. The loop is infinite.
+   With inotify discovery, waits for a new frame to be written instead (see frame_watcher.py).
+
+With pipeline enabled in the config, steps 3-6 run as concurrent stages (see pipeline.py).
 """
 import json
 import ntpath
 import os
 import os.path
+import threading
 import time
 from datetime import datetime
+from queue import Queue
+
+import numpy as np
 
-from paho.mqtt.publish import single
-from model_core import (load_all_parking_models,
-                        predict, batch_predict)
-from crop_helpers import (map_models_to_ids,
-                          collect_input)
+from model_core import batch_predict, get_states, InferenceExecutor
+from change_detection import SlotChangeDetector, FrameMotionGate
+from frame_watcher import create_watcher
+from crop_helpers import (collect_input, collect_frame_input, read_frame,
+                          SlotBatch, WIDTH, HEIGHT)
+from model_registry import ModelRegistry
+from parking_map import ParkingMap
+from pipeline import run_pipeline, get_batches_count
+from refresh_scheduler import RefreshScheduler
+from roi_pooling import RoiPoolingModel
+from utils.frame_ring import FrameRing
+from utils.frame_store import FrameStore
 from utils.logging_utils import create_logger
+from utils.mosquitto_utils import MqttPublisher
 
 logger = create_logger('model')
 
+# Size of images parking configurations are annotated on (see README)
+ANNOTATED_SIZE = (3840, 2160)
 
-def execute(config_json):
-    """ Execute full cycle in a loop. Single cycle ends with publishing result json.
 
-    :param config_json: model config json
+class FrameSetup:
+    """ Everything needed to process frames for a particular parking map.
     """
-    with open(config_json, 'r') as stream:
-        config = json.load(stream)
+    def __init__(self, parking_map, config, batches=1, frame_size=None):
+        """
+        :param parking_map: ParkingMap object
+        :param config: model config json
+        :param batches: number of SlotBatch buffers, i.e. how many frames
+            can be processed at the same time
+        :param frame_size: (width, height) of raw frames of the frame ring
+            or None for decoded frames
+        :raise ValueError: in case raw frames are not scaled uniformly from
+            annotated images
+        """
+        self.parking_map = parking_map
+        self.frame_size = frame_size
+        if frame_size is not None:
+            # Raw frames of the frame ring are not decoded, but may be
+            # scaled by the video stream processor
+            self.decode_scale = ring_scale(
+                config.get('annotated_size', ANNOTATED_SIZE), frame_size)
+        elif config.get('reduced_decode', True):
+            self.decode_scale = parking_map.decode_scale(min(WIDTH, HEIGHT))
+        else:
+            self.decode_scale = 1
+        self.frame_map = parking_map.scaled(self.decode_scale)
+        self.slot_batches = Queue()
+        for _ in range(batches):
+            self.slot_batches.put(SlotBatch(self.frame_map))
+        self.change_detector = SlotChangeDetector.from_options(
+            config.get('change_detection', {}))
+        self.scheduler = RefreshScheduler.from_options(
+            parking_map, config.get('scheduler', {}))
+        self.scheduler_lock = threading.Lock()
+        if config.get('roi_pooling', {}).get('enabled', False):
+            # Slots are not cropped, all of them are classified at once
+            if self.change_detector:
+                logger.warning('Change detection is not supported with ROI '
+                               'pooling, disabling it')
+                self.change_detector = None
+            if self.scheduler:
+                logger.warning('Refresh scheduler is not supported with ROI '
+                               'pooling, disabling it')
+                self.scheduler = None
+        self.motion_gate = FrameMotionGate.from_options(
+            self.frame_map, config.get('motion_gating', {}))
+        self.motion_gate_lock = threading.Lock()
+        self.pklot_map = {}
 
-    img_config_refresh_duration = config.get('camera_img_config_refresh_duration')
-    delay = config.get('sleep_duration')
-    client_id = config.get('client_id')
-    topic = config.get('mq_topic')
-    host = config.get('mq_host')
-    port = config.get('mq_port')
-    loop_counter = 0
-    last_modified = 0
-    img_config_refresh_time = 0
 
-    while True:
-        logger.debug('Iteration started')
-        start_time = time.time()
-        if start_time - img_config_refresh_time > img_config_refresh_duration:
-            logger.debug('Reloading parking configuration')
-            img_config = get_latest_config(os.environ['CAMERA_IMG_CONFIG_FOLDER'])
-            if not img_config:
-                logger.debug('Found no parking configuration file')
-                time.sleep(delay)
-                continue
-
-            img_config_refresh_time = start_time
-            models_to_ids = map_models_to_ids(img_config)
-            load_all_parking_models(os.environ['MODELS_PATH'])
+class Frame:
+    """ Camera frame passing through the processing steps.
+    """
+    def __init__(self, path, source_folder, modified, start_time,
+                 image=None, sequence=None):
+        """
+        :param path: path to the image
+        :param source_folder: path to its source folder
+        :param modified: image modification time
+        :param start_time: time when processing of the frame started
+        :param image: BGR image if it is already decoded (a frame of the
+            frame ring), None to read it from the path
+        :param sequence: sequence number of a frame of the frame ring
+        """
+        self.path = path
+        self.source_folder = source_folder
+        self.modified = modified
+        self.start_time = start_time
+        self.processing_start_time = datetime.utcnow().strftime(
+            '%Y-%m-%d %H:%M:%S.%f')[:-3]
+        self.image = image
+        self.sequence = sequence
+        self.setup = None
+        self.slot_batch = None
+        self.rows = None
+        self.roi_input = None
+        self.heartbeat = False
 
-        logger.debug('Looking for a new file')
-        processing_start_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
-        (current_img_path, source_folder, current_img_last_modified
-        ) = get_latest_img_and_folder(os.environ['SOURCE_IMG_FOLDER'])
+class ModelService:
+    """ Processing steps of the model service.
+
+    Steps are used either one after another (see `execute`) or as
+    stages of a pipeline (see pipeline.py).
+    """
+    def __init__(self, config, batches=1):
+        """
+        :param config: model config json
+        :param batches: number of frames which can be processed at the same
+            time
+        """
+        self.config = config
+        self.batches = batches
+        self.img_config_refresh_duration = config.get(
+            'camera_img_config_refresh_duration')
+        self.img_config_refresh_time = 0
+        self.setup = None
+        self.last_modified = 0
+        self.frame_source = config.get('frame_source', 'files')
+        self.ring_file = config.get('ring_file', 'frame_ring.bin')
+        self.frame_ring = None
+        self.rejected_ring = None
+        self.frame_store = FrameStore(os.path.join(
+            os.environ.get('SOURCE_IMG_FOLDER', ''),
+            config.get('store_dir', 'frames')))
+        self.last_sequence = 0
+        self.registry = ModelRegistry(os.environ['MODELS_PATH'],
+                                      config.get('inference'),
+                                      config.get('cascade'))
+        self.ready = False
+        self.executor = InferenceExecutor.from_options(
+            config.get('inference', {}))
+        self.roi_options = config.get('roi_pooling', {})
+        self.roi_model = None
+        self.cascade_report_frames = config.get('cascade', {}).get(
+            'report_frames', 100)
+        self.classified_frames = 0
+        self.publisher = MqttPublisher(
+            config.get('client_id'), config.get('mq_host'),
+            config.get('mq_port'), qos=config.get('mq_qos', 0)).start()
+
+    def refresh(self):
+        """ Reload parking configuration and models if it is time to.
+
+        :return: False if there is no parking configuration yet
+                 and True otherwise
+        """
+        now = time.time()
+        if now - self.img_config_refresh_time <= self.img_config_refresh_duration:
+            return True
+
+        logger.debug('Reloading parking configuration')
+        parking_map = get_latest_config(
+            os.environ['CAMERA_IMG_CONFIG_FOLDER'],
+            self.setup.parking_map if self.setup else None)
+        if parking_map is None:
+            logger.debug('Found no parking configuration file')
+            return False
+
+        self.img_config_refresh_time = now
+        if self.setup is None or self.setup.parking_map is not parking_map:
+            self.setup = FrameSetup(parking_map, self.config, self.batches,
+                                    self.ring_frame_size())
+            logger.info('Decoding frames downscaled by %s',
+                        self.setup.decode_scale)
+        if not self.roi_options.get('enabled', False):
+            self.registry.refresh(parking_map.models_to_indices)
+        elif self.roi_model is None:
+            logger.info('Loading ROI model %s', self.roi_options['model'])
+            self.roi_model = RoiPoolingModel.load(os.path.join(
+                os.environ['MODELS_PATH'], self.roi_options['model']))
+        if not self.ready:
+            logger.info('Models are loaded and warmed up, ready to process '
+                        'frames')
+            self.ready = True
+        return True
+
+    def create_watcher(self, delay, stop=None):
+        """ Create a watcher waking frame discovery up (see frame_watcher.py).
+
+        :param delay: delay between looking for frames when polling, in
+            seconds
+        :param stop: threading.Event interrupting polling or None
+        :return: InotifyWatcher or PollingWatcher object
+        """
+        options = self.config.get('discovery', {})
+        if self.frame_source == 'ring':
+            # Frames written into the memory mapped ring raise no events
+            options = dict(options, mode='polling')
+        return create_watcher(os.environ['SOURCE_IMG_FOLDER'], options,
+                              delay, stop)
+
+    def find_frame(self, newest=None):
+        """ Find a frame newer than the previously found one.
+
+        :param newest: path to the newest frame if it is known (see
+            frame_watcher.py), None to look for it
+        :return: Frame object or None
+        """
+        if self.frame_source == 'ring':
+            return self.find_ring_frame()
+        if self.frame_source == 'store':
+            return self.find_store_frame()
+
+        logger.debug('Looking for a new file')
+        start_time = time.time()
+        current_img_path = None
+        if newest is not None:
+            try:
+                current_img_last_modified = os.path.getmtime(newest)
+                current_img_path = newest
+                source_folder = os.path.dirname(newest)
+            except FileNotFoundError:
+                pass
+        if current_img_path is None:
+            (current_img_path, source_folder, current_img_last_modified
+            ) = get_latest_img_and_folder(os.environ['SOURCE_IMG_FOLDER'])
         if not current_img_path:
             logger.debug('No images were found. Waiting...')
-            time.sleep(delay)
-            logger.debug('Iteration finished')
-            continue
+            return None
 
-        if current_img_last_modified > last_modified:
-            last_modified = current_img_last_modified
-        else:
+        if current_img_last_modified <= self.last_modified:
             logger.debug('Got image that is older than the previous. Skipping iteration...')
-            time.sleep(delay)
-            logger.debug('Iteration finished')
-            continue
+            return None
+
+        self.last_modified = current_img_last_modified
+        return Frame(current_img_path, source_folder,
+                     current_img_last_modified, start_time)
+
+    def find_store_frame(self):
+        """ Take the latest frame of the frame store if it is a new one.
+
+        :return: Frame object or None
+        """
+        start_time = time.time()
+        latest = self.frame_store.latest()
+        if latest is None:
+            logger.debug('No frames in the frame store. Waiting...')
+            return None
 
-        logger.debug('Processing file %s', current_img_path)
-        batch_input = collect_input(current_img_path, img_config)
-        logger.debug('Extracting for file %s finished', current_img_path)
-        pklot_map = batch_predict(batch_input, models_to_ids)
-        logger.debug('Prediction for file %s finished', current_img_path)
+        sequence, name, timestamp = latest
+        if sequence <= self.last_sequence:
+            logger.debug('No new frames in the frame store. Waiting...')
+            return None
+
+        self.last_sequence = sequence
+        return Frame(self.frame_store.frame_path(name), self.frame_store.path,
+                     timestamp, start_time)
+
+    def find_ring_frame(self):
+        """ Take the latest frame of the frame ring if it is a new one.
+
+        :return: Frame object or None
+        """
+        start_time = time.time()
+        if self.setup is None:
+            return None
+        if self.frame_ring is None or self.frame_ring.replaced():
+            ring_path = os.path.join(os.environ['SOURCE_IMG_FOLDER'],
+                                     self.ring_file)
+            if not os.path.exists(ring_path):
+                logger.debug('No frame ring was found. Waiting...')
+                return None
+            if self.frame_ring is not None:
+                self.frame_ring.close()
+            self.frame_ring = FrameRing.open(ring_path)
+            self.last_sequence = 0
+            logger.info('Reading frames from frame ring %s', ring_path)
+
+        if self.frame_ring is self.rejected_ring:
+            return None
+        if self.setup.frame_size != self.ring_frame_size():
+            try:
+                self.setup = FrameSetup(self.setup.parking_map, self.config,
+                                        self.batches, self.ring_frame_size())
+            except ValueError as error:
+                logger.error('Cannot process frames of frame ring %s: %s',
+                             self.frame_ring.path, error)
+                self.rejected_ring = self.frame_ring
+                return None
+            logger.info('Frames of frame ring %s are downscaled by %s',
+                        self.frame_ring.path, self.setup.decode_scale)
 
+        if self.frame_ring.latest <= self.last_sequence:
+            logger.debug('No new frames in the frame ring. Waiting...')
+            return None
+
+        latest = self.frame_ring.read_latest()
+        if latest is None:
+            return None
+
+        sequence, data, timestamp = latest
+        self.last_sequence = sequence
+        image = np.frombuffer(data, dtype=np.uint8).reshape(
+            self.frame_ring.height, self.frame_ring.width, 3)
+        return Frame('{:010d}.png'.format(sequence), self.frame_ring.path,
+                     timestamp, start_time, image, sequence)
+
+    def ring_frame_size(self):
+        """ Size of raw frames of the frame ring.
+
+        :return: (width, height) or None if frames are not read from a frame
+                 ring, it is not opened yet or its frames were rejected
+        """
+        if (self.frame_source != 'ring' or self.frame_ring is None or
+                self.frame_ring is self.rejected_ring):
+            return None
+        return self.frame_ring.width, self.frame_ring.height
+
+    def prepare(self, frame):
+        """ Decode the frame and crop slots which should be classified.
+
+        :param frame: Frame object
+        """
+        setup = frame.setup = self.setup
+        logger.debug('Processing file %s', frame.path)
+        img = (frame.image if frame.image is not None
+               else read_frame(frame.path, setup.decode_scale))
+        if setup.motion_gate:
+            with setup.motion_gate_lock:
+                frame.rows = setup.motion_gate.select(img)
+        if setup.scheduler:
+            with setup.scheduler_lock:
+                frame.rows = setup.scheduler.select(time.time(), frame.rows)
+        if frame.rows is not None:
+            frame.heartbeat = not frame.rows.any()
+            if frame.heartbeat:
+                logger.debug('No motion or due slots on file %s, reusing '
+                             'previous results', frame.path)
+                return
+
+        if self.roi_model:
+            frame.roi_input = collect_frame_input(
+                img, setup.frame_map, self.roi_model.grid,
+                self.roi_options.get('scale', 1.0))
+            logger.debug('Preparing file %s finished', frame.path)
+            return
+
+        frame.slot_batch = setup.slot_batches.get()
+        collect_input(img, frame.slot_batch, frame.rows)
+        logger.debug('Extracting for file %s finished', frame.path)
+
+    def classify(self, frame):
+        """ Classify slots of a prepared frame.
+
+        :param frame: Frame object
+        :return: dict of slot ids mapped to (state, probability)
+        """
+        setup = frame.setup
+        parking_models = self.registry.models
+        cascades = self.registry.cascades
+        try:
+            if frame.heartbeat:
+                pass
+            elif frame.roi_input is not None:
+                probabilities = self.roi_model.predict(*frame.roi_input)
+                setup.pklot_map = {
+                    slot_id: (state.item(), str(probability))
+                    for slot_id, state, probability in zip(
+                        setup.parking_map.slot_ids,
+                        get_states(probabilities), probabilities[:, 0])}
+            elif frame.rows is None and not setup.change_detector:
+                setup.pklot_map = batch_predict(
+                    frame.slot_batch.inputs, setup.parking_map.models_to_ids,
+                    parking_models, self.executor, cascades)
+            else:
+                rows = frame.rows
+                if setup.change_detector:
+                    rows = setup.change_detector.select(
+                        frame.slot_batch.crops, rows)
+                batch_input, changed_models_to_ids = frame.slot_batch.select(rows)
+                setup.pklot_map.update(
+                    batch_predict(batch_input, changed_models_to_ids,
+                                  parking_models, self.executor, cascades))
+                if setup.scheduler:
+                    with setup.scheduler_lock:
+                        setup.scheduler.update(frame.rows, setup.pklot_map)
+                logger.debug('Classified %s of %s slots', rows.sum(), len(rows))
+        finally:
+            self.release(frame)
+        logger.debug('Prediction for file %s finished', frame.path)
+        self.classified_frames += 1
+        if (cascades and
+                self.classified_frames % self.cascade_report_frames == 0):
+            for model_name, cascade in cascades.items():
+                hit_rates = cascade.hit_rates(reset=True)
+                logger.info('Cascade of model %s: %s slots, %.1f%% decided '
+                            'by the first stage, %.1f%% by the model',
+                            model_name, hit_rates['slots'],
+                            100 * hit_rates['first_stage'],
+                            100 * hit_rates['second_stage'])
+        return setup.pklot_map
+
+    def drop(self, frame):
+        """ Drop a prepared frame without classifying it.
+
+        Slots touched by motion on the frame are processed with the next one.
+
+        :param frame: Frame object
+        """
+        logger.debug('Dropping file %s', frame.path)
+        setup = frame.setup
+        if setup.motion_gate and frame.rows is not None:
+            with setup.motion_gate_lock:
+                setup.motion_gate.invalidate(frame.rows)
+        if setup.scheduler and frame.rows is not None:
+            with setup.scheduler_lock:
+                setup.scheduler.invalidate(frame.rows)
+        self.release(frame)
+
+    @staticmethod
+    def release(frame):
+        """ Give buffers of the frame back to its setup.
+
+        :param frame: Frame object
+        """
+        if frame.slot_batch is not None:
+            frame.setup.slot_batches.put(frame.slot_batch)
+            frame.slot_batch = None
+        frame.roi_input = None
+
+    @staticmethod
+    def build_response(frame, pklot_map):
+        """ Build the result json of a frame.
+
+        :param frame: Frame object
+        :param pklot_map: dict of slot ids mapped to (state, probability)
+        :return: result json
+        """
         number_of_free_places = 0
         number_of_occupied_places = 0
         for _, state_and_prob in pklot_map.items():
@@ -96,27 +485,80 @@ def execute(config_json):
             elif state_and_prob[0] == 0:
                 number_of_free_places += 1
 
-        parking_map = {
+        parking_counts = {
             'free': number_of_free_places,
             'occupied': number_of_occupied_places
         }
-        processing_time = '{0:.2f} ms'.format((time.time() - start_time) * 1000)
+        processing_time = '{0:.2f} ms'.format(
+            (time.time() - frame.start_time) * 1000)
         metadata_map = {
-            'source_folder': os.path.basename(os.path.normpath(source_folder)),
-            'source_file': ntpath.basename(current_img_path),
+            'source_folder': os.path.basename(os.path.normpath(frame.source_folder)),
+            'source_file': ntpath.basename(frame.path),
             'processing_time': processing_time,
-            'processing_start_time': processing_start_time
+            'processing_start_time': frame.processing_start_time,
+            'heartbeat': frame.heartbeat
         }
-        json_response = {'parking_places': pklot_map,
-                         'parking': parking_map,
+        if frame.sequence is not None:
+            metadata_map['frame_sequence'] = frame.sequence
+        json_response = {'parking_places': dict(pklot_map),
+                         'parking': parking_counts,
                          'metadata': metadata_map}
+        if frame.setup is not None and frame.setup.scheduler:
+            with frame.setup.scheduler_lock:
+                json_response['parking_places_age'] = (
+                    frame.setup.scheduler.ages(time.time()))
 
         logger.debug('model output: %s', json_response)
         logger.debug('Preparing results finished')
-        single(topic, payload=json.dumps(json_response), qos=0, retain=False,
-               hostname=host, port=port, client_id=client_id,
-               keepalive=60)
+        return json_response
+
+    def publish(self, json_response):
+        """ Publish the result json into MQ topic.
+
+        :param json_response: result json
+        """
+        self.publisher.publish(self.config.get('mq_topic'),
+                               json.dumps(json_response))
         logger.debug('Posting into topic finished')
+
+
+def execute(config_json):
+    """ Execute full cycle in a loop. Single cycle ends with publishing result json.
+
+    :param config_json: model config json
+    """
+    with open(config_json, 'r') as stream:
+        config = json.load(stream)
+
+    delay = config.get('sleep_duration')
+    pipeline_options = config.get('pipeline', {})
+    if pipeline_options.get('enabled', False):
+        run_pipeline(ModelService(config, get_batches_count(pipeline_options)),
+                     pipeline_options, delay)
+        return
+
+    service = ModelService(config)
+    watcher = service.create_watcher(delay)
+    newest = None
+    loop_counter = 0
+
+    while True:
+        logger.debug('Iteration started')
+        if not service.refresh():
+            time.sleep(delay)
+            continue
+
+        frame = service.find_frame(newest)
+        if not frame:
+            newest = watcher.wait()
+            logger.debug('Iteration finished')
+            continue
+
+        newest = None
+        service.prepare(frame)
+        pklot_map = service.classify(frame)
+        json_response = service.build_response(frame, pklot_map)
+        service.publish(json_response)
         if loop_counter % 100 == 0:
             logger.info('Finished a sequence of 100 iterations: %s, model output: %s',
                         loop_counter, json_response)
@@ -124,6 +566,27 @@ def execute(config_json):
         logger.debug('Iteration finished')
 
 
+def ring_scale(annotated_size, frame_size):
+    """ Get the downscale factor of raw frames of the frame ring.
+
+    :param annotated_size: (width, height) of images parking configurations
+        are annotated on
+    :param frame_size: (width, height) of raw frames
+    :return: downscale factor
+    :raise ValueError: in case frames are not scaled by the same factor
+        along both axes
+    """
+    scale_x = annotated_size[0] / frame_size[0]
+    scale_y = annotated_size[1] / frame_size[1]
+    if abs(scale_x - scale_y) > 0.01 * scale_x:
+        raise ValueError(
+            'frames of {}x{} are not scaled uniformly from annotated images '
+            'of {}x{}, check "annotated_size" model config option'.format(
+                frame_size[0], frame_size[1], annotated_size[0],
+                annotated_size[1]))
+    return scale_x
+
+
 def get_latest_img_and_folder(img_folder):
     """ Get the latest image and its source folder.
 
@@ -153,11 +616,13 @@ def get_latest_img_and_folder(img_folder):
     return latest_img, latest_subdir, last_modified
 
 
-def get_latest_config(config_folder):
+def get_latest_config(config_folder, parking_map=None):
     """ Get the latest parking configuration.
 
     :param config_folder: path to a folder parking configuration files
-    :return: parking configuration json
+    :param parking_map: currently used ParkingMap object, returned as is
+                        if its configuration file has not changed
+    :return: ParkingMap object
     """
     json_config_list = []
     for file in os.listdir(config_folder):
@@ -168,10 +633,15 @@ def get_latest_config(config_folder):
         return None
 
     conf_path = max(json_config_list, key=os.path.getmtime)
+    source = (conf_path, os.path.getmtime(conf_path))
+    if parking_map is not None and parking_map.source == source:
+        return parking_map
+
     with open(conf_path) as f_conf:
         conf = json.load(f_conf)
 
-    return conf
+    logger.info('Compiling parking configuration %s', conf_path)
+    return ParkingMap.from_conf(conf, source=source)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,370 @@
+""" Compiled parking map.
+
+Parking configurations made via Sloth keep slot polygons as semicolon
+separated strings.  This module parses and validates them once and
+precomputes everything needed to crop individual parking spaces
+from camera frames, so the per-frame code only applies ready transforms.
+"""
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+
+# Frame region processed instead of the full frame, see
+# ParkingMap.clahe_region.
+Region = namedtuple('Region', ['x', 'y', 'width', 'height', 'pad_x', 'pad_y',
+                               'tiles'])
+
+
+class ParkingMap:
+    """ Parking configuration compiled for repeated cropping.
+    """
+    def __init__(self, slot_ids, models, points, matrices=None, sizes=None,
+                 source=None, priorities=None):
+        """
+        :param slot_ids: list of slot IDs (strings) in configuration order
+        :param models: list of model names, one per slot
+        :param points: numpy array of slot polygons, shape (N, 4, 2)
+        :param matrices: numpy array of perspective transforms, shape
+            (N, 3, 3), computed from points if not provided
+        :param sizes: numpy array of (width, height) of warped slots, shape
+            (N, 2), computed from points if not provided
+        :param source: (path, modification time) of the configuration file
+        :param priorities: numpy array of refresh priorities, one per slot
+            (see refresh_scheduler.py), 1 for all slots if not provided
+        """
+        self.slot_ids = [str(slot_id) for slot_id in slot_ids]
+        self.models = list(models)
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 4, 2)
+        if matrices is None or sizes is None:
+            matrices, sizes = _compute_transforms(self.points)
+        self.matrices = np.asarray(matrices, dtype=np.float64)
+        self.sizes = np.asarray(sizes, dtype=np.int32)
+        self.source = source
+        self.priorities = (np.ones(len(self.slot_ids), dtype=np.float32)
+                           if priorities is None else
+                           np.asarray(priorities, dtype=np.float32))
+
+        self.models_to_indices = OrderedDict()
+        for index, model_name in enumerate(self.models):
+            self.models_to_indices.setdefault(model_name, []).append(index)
+        for model_name, indices in self.models_to_indices.items():
+            self.models_to_indices[model_name] = np.array(indices,
+                                                          dtype=np.intp)
+
+        self.models_to_ids = {
+            model_name: [self.slot_ids[i] for i in indices]
+            for model_name, indices in self.models_to_indices.items()}
+
+        # Slots grouped by model, so each model input is a contiguous
+        # block of a single batch tensor.
+        self.batch_order = np.concatenate(
+            list(self.models_to_indices.values()) or
+            [np.array([], dtype=np.intp)])
+        self.models_to_slices = OrderedDict()
+        start = 0
+        for model_name, indices in self.models_to_indices.items():
+            self.models_to_slices[model_name] = slice(start,
+                                                      start + len(indices))
+            start += len(indices)
+        self.footprints = _compute_footprints(self.matrices, self.sizes)
+        self._input_matrices = {}
+        self._roi_points = {}
+        self._regions = {}
+        self._scaled = {1: self}
+
+    def __len__(self):
+        return len(self.slot_ids)
+
+    @classmethod
+    def from_conf(cls, conf, source=None):
+        """ Validate and compile a Sloth parking configuration.
+
+        :param conf: parking configuration json
+        :param source: (path, modification time) of the configuration file
+        :return: ParkingMap object
+        :raise ValueError: in case parking configuration is incorrect
+        """
+        annotations = conf[0]['annotations']
+        slot_ids = [a['id'] for a in annotations]
+        seen = set()
+        duplicates = [i for i in slot_ids if i in seen or seen.add(i)]
+        if duplicates:
+            raise ValueError(
+                'Parking configuration contains duplicate slot ID(s): {}'
+                .format(', '.join(duplicates)))
+
+        points = []
+        for polygon in annotations:
+            slot_points = get_points(polygon['xn'], polygon['yn'])
+            if slot_points.shape[0] != 4 or slot_points.shape[1] != 2:
+                raise ValueError(
+                    'Polygon shape for slot ID {} should be (4, 2), '
+                    'but actually is: {}'.format(int(polygon['id']),
+                                                 slot_points.shape))
+            points.append(slot_points)
+
+        priorities = [float(a.get('priority', 1)) for a in annotations]
+        if any(priority <= 0 for priority in priorities):
+            raise ValueError('Slot priorities should be positive')
+
+        return cls(slot_ids, [a['model'] for a in annotations],
+                   np.array(points, dtype=np.float32).reshape(-1, 4, 2),
+                   source=source, priorities=priorities)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a compiled parking map saved with `save`.
+
+        :param path: path to the .npz file
+        :return: ParkingMap object
+        """
+        with np.load(path) as data:
+            return cls(data['slot_ids'].tolist(), data['models'].tolist(),
+                       data['points'], data['matrices'], data['sizes'],
+                       source=(path, os.path.getmtime(path)),
+                       priorities=data['priorities']
+                       if 'priorities' in data else None)
+
+    def save(self, path):
+        """ Save the compiled parking map.
+
+        :param path: path to the output .npz file
+        """
+        with open(path, 'wb') as f_out:
+            np.savez(f_out,
+                     slot_ids=np.array(self.slot_ids, dtype=np.str_),
+                     models=np.array(self.models, dtype=np.str_),
+                     points=self.points,
+                     matrices=self.matrices,
+                     sizes=self.sizes,
+                     priorities=self.priorities)
+
+    def decode_scale(self, min_side, scales=(1, 2, 4, 8)):
+        """ Get the largest downscale factor for frame decoding at which
+        the smallest slot still has at least `min_side` pixels on its
+        short side.
+
+        :param min_side: minimal short side of a slot in pixels
+        :param scales: supported downscale factors
+        :return: downscale factor
+        """
+        if not len(self):
+            return 1
+
+        smallest = self.sizes.min()
+        return max(s for s in scales if s == 1 or smallest / s >= min_side)
+
+    def scaled(self, scale):
+        """ Get the parking map for frames downscaled by a given factor.
+
+        Slots keep their warped sizes, only transforms are rescaled.
+
+        :param scale: downscale factor of frames
+        :return: ParkingMap object
+        """
+        if scale not in self._scaled:
+            # Pixel u of a downscaled frame covers pixels
+            # scale * u .. scale * u + scale - 1 of the full one
+            upscale = np.array([[scale, 0, (scale - 1) / 2],
+                                [0, scale, (scale - 1) / 2],
+                                [0, 0, 1]], dtype=np.float64)
+            self._scaled[scale] = ParkingMap(
+                self.slot_ids, self.models,
+                (self.points - (scale - 1) / 2) / scale,
+                np.matmul(self.matrices, upscale), self.sizes,
+                source=self.source, priorities=self.priorities)
+        return self._scaled[scale]
+
+    def warp(self, img, index):
+        """ Crop and straighten a single parking slot.
+
+        :param img: camera frame
+        :param index: slot index in configuration order
+        :return: warped image of the slot
+        """
+        width, height = self.sizes[index]
+        return cv2.warpPerspective(img, self.matrices[index],
+                                   (int(width), int(height)))
+
+    def input_matrices(self, width, height):
+        """ Perspective transforms warping slots straight to the model input
+        size, equal to `warp` followed by a resize to (width, height).
+
+        :param width: model input width
+        :param height: model input height
+        :return: numpy array of transforms, shape (N, 3, 3)
+        """
+        key = (width, height)
+        if key not in self._input_matrices:
+            scale_x = width / self.sizes[:, 0].astype(np.float64)
+            scale_y = height / self.sizes[:, 1].astype(np.float64)
+            resize = np.zeros((len(self), 3, 3), dtype=np.float64)
+            resize[:, 0, 0] = scale_x
+            resize[:, 0, 2] = 0.5 * scale_x - 0.5
+            resize[:, 1, 1] = scale_y
+            resize[:, 1, 2] = 0.5 * scale_y - 0.5
+            resize[:, 2, 2] = 1.0
+            self._input_matrices[key] = np.matmul(resize, self.matrices)
+        return self._input_matrices[key]
+
+    def roi_points(self, grid=(2, 2)):
+        """ Frame points at the centers of grid cells of warped slots,
+        for pooling slot features from a feature map of the whole frame.
+
+        :param grid: (columns, rows) of the grid
+        :return: numpy array of (x, y) frame coordinates, shape
+            (N, rows, columns, 2), slots follow the configuration order
+        """
+        if grid not in self._roi_points:
+            columns, rows = grid
+            points = np.zeros((len(self), rows, columns, 2), dtype=np.float32)
+            for index, (matrix, (width, height)) in enumerate(
+                    zip(self.matrices, self.sizes)):
+                canvas = grid_points(width, height, grid).reshape(1, -1, 2)
+                points[index] = cv2.perspectiveTransform(
+                    canvas, np.linalg.inv(matrix)).reshape(rows, columns, 2)
+            self._roi_points[grid] = points
+        return self._roi_points[grid]
+
+    def clahe_region(self, frame_shape, tile_grid=(8, 8)):
+        """ Get the frame region covering all slots, aligned to the CLAHE
+        tile grid of the full frame.
+
+        The region has a margin of one tile, so CLAHE applied to the region
+        with `tiles` grid gives the same result inside slot footprints
+        as CLAHE applied to the full frame.  `pad_x` and `pad_y` tell how
+        much the region should be padded (with BORDER_REFLECT_101, the same
+        as OpenCV pads the full frame) to keep the tile size.
+
+        :param frame_shape: shape of the frame
+        :param tile_grid: CLAHE tile grid of the full frame
+        :return: Region object
+        """
+        key = (frame_shape[:2], tile_grid)
+        if key in self._regions:
+            return self._regions[key]
+
+        height, width = frame_shape[:2]
+        tiles_x, tiles_y = tile_grid
+        # Unless both sides divide into tiles, OpenCV pads both of them
+        # (a side which divides gets a whole extra tile)
+        tile_width, tile_height = width // tiles_x, height // tiles_y
+        if width % tiles_x or height % tiles_y:
+            tile_width += 1
+            tile_height += 1
+
+        if len(self):
+            x_min, y_min = np.floor(self.footprints[:, :2].min(axis=0))
+            x_max, y_max = np.ceil(self.footprints[:, 2:].max(axis=0))
+        else:
+            x_min, y_min, x_max, y_max = 0, 0, 0, 0
+        first_x = int(np.clip(x_min // tile_width - 1, 0, tiles_x - 1))
+        first_y = int(np.clip(y_min // tile_height - 1, 0, tiles_y - 1))
+        last_x = int(np.clip(x_max // tile_width + 2, first_x + 1, tiles_x))
+        last_y = int(np.clip(y_max // tile_height + 2, first_y + 1, tiles_y))
+
+        x = first_x * tile_width
+        y = first_y * tile_height
+        region_width = min(width, last_x * tile_width) - x
+        region_height = min(height, last_y * tile_height) - y
+        region = Region(x, y, region_width, region_height,
+                        (last_x - first_x) * tile_width - region_width,
+                        (last_y - first_y) * tile_height - region_height,
+                        (last_x - first_x, last_y - first_y))
+        self._regions[key] = region
+        return region
+
+
+def load_parking_map(path):
+    """ Load a parking map either from a Sloth json or a compiled .npz file.
+
+    :param path: path to the parking configuration
+    :return: ParkingMap object
+    """
+    if path.endswith('.npz'):
+        return ParkingMap.load(path)
+
+    with open(path) as f_conf:
+        conf = json.load(f_conf)
+    return ParkingMap.from_conf(conf, source=(path, os.path.getmtime(path)))
+
+
+def get_points(xn, yn):
+    """ Parse polygon points made via Sloth.
+
+    :param xn: semicolon separated x coordinates
+    :param yn: semicolon separated y coordinates
+    :return: numpy array of points, shape (N, 2)
+    """
+    xn = np.array(xn.split(';')).astype(np.float32)
+    yn = np.array(yn.split(';')).astype(np.float32)
+    return np.stack((xn, yn), axis=-1)
+
+
+def grid_points(width, height, grid):
+    """ Centers of grid cells of an image.
+
+    :param width: image width in pixels
+    :param height: image height in pixels
+    :param grid: (columns, rows) of the grid
+    :return: float32 numpy array of (x, y) pixel coordinates, shape
+        (rows, columns, 2)
+    """
+    columns, rows = grid
+    x = (np.arange(columns) + 0.5) * width / columns - 0.5
+    y = (np.arange(rows) + 0.5) * height / rows - 0.5
+    return np.stack(np.meshgrid(x, y), axis=-1).astype(np.float32)
+
+
+def _compute_transforms(points):
+    matrices = np.zeros((len(points), 3, 3), dtype=np.float64)
+    sizes = np.zeros((len(points), 2), dtype=np.int32)
+    for index, slot_points in enumerate(points):
+        matrices[index], sizes[index] = _four_points_transform(slot_points)
+    return matrices, sizes
+
+
+def _compute_footprints(matrices, sizes):
+    """ Bounding boxes (x_min, y_min, x_max, y_max) of frame pixels sampled
+    for each warped slot, with a pixel margin for interpolation.
+    """
+    footprints = np.zeros((len(matrices), 4), dtype=np.float64)
+    for index, (matrix, (width, height)) in enumerate(zip(matrices, sizes)):
+        corners = np.array([[[-0.5, -0.5], [width - 0.5, -0.5],
+                             [width - 0.5, height - 0.5],
+                             [-0.5, height - 0.5]]], dtype=np.float64)
+        src = cv2.perspectiveTransform(corners, np.linalg.inv(matrix))[0]
+        footprints[index, :2] = src.min(axis=0) - 1
+        footprints[index, 2:] = src.max(axis=0) + 1
+    return footprints
+
+
+def _four_points_transform(points):
+    (tl, tr, br, bl) = points
+
+    width_a = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
+    width_b = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
+    max_width = max(int(width_a), int(width_b))
+
+    height_a = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
+    height_b = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
+    max_height = max(int(height_a), int(height_b))
+
+    if max_height > max_width:
+        dst = np.array([
+            [0, 0],
+            [max_width - 1, 0],
+            [max_width - 1, max_height - 1],
+            [0, max_height - 1]], np.float32)
+    else:
+        dst = np.array([
+            [max_height - 1, 0],
+            [max_height - 1, max_width - 1],
+            [0, max_width - 1],
+            [0, 0]], np.float32)
+
+    matrix = cv2.getPerspectiveTransform(np.ascontiguousarray(points), dst)
+    return matrix, (max_width, max_height)
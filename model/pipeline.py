@@ -0,0 +1,193 @@
+""" Pipelined execution of the model service.
+
+Steps of the model service (see model_wrapper.ModelService) run as stages
+in their own threads and hand frames off to each other:
+
+1. Frame discovery looks for new frames.
+2. A pool of workers decodes frames and crops parking slots.
+3. Inference (in the calling thread) classifies slots.
+4. Publisher sends results into MQ topic.
+
+So frame N+1 is prepared while frame N is being classified.  Hand-off points
+between stages keep only the newest frame: if inference falls behind, older
+frames are dropped and the freshest one is classified next.
+"""
+import logging
+import threading
+from queue import Queue, Empty, Full
+
+logger = logging.getLogger('model')
+
+
+class LatestSlot:
+    """ Hand-off point which keeps only the newest item.
+
+    A new item replaces the pending one.  Items which are not newer than
+    any item put before are dropped right away.  Dropped items are passed
+    to `on_drop`.
+    """
+    def __init__(self, on_drop=None):
+        """
+        :param on_drop: function called with every dropped item
+        """
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._condition = threading.Condition()
+        self._item = None
+        self._key = None
+
+    def put(self, item, key):
+        """ Put an item, dropping the pending one.
+
+        :param item: item to put
+        :param key: sortable key, newer items have greater keys
+        """
+        with self._condition:
+            if self._key is not None and key <= self._key:
+                dropped = item
+            else:
+                dropped = self._item
+                self._item = item
+                self._key = key
+                self._condition.notify()
+
+        if dropped is not None:
+            self.dropped += 1
+            if self.on_drop:
+                self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """ Take the pending item.
+
+        :param timeout: maximum time to wait for an item, in seconds
+        :return: the item or None if there is no item within the timeout
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._item is not None, timeout)
+            item, self._item = self._item, None
+            return item
+
+
+def run_pipeline(service, options, delay):
+    """ Run the model service as a pipeline.  Never returns.
+
+    :param service: ModelService object, created with enough batches for
+        all frames in flight (see `get_batches_count`)
+    :param options: dict of "pipeline" model config options
+    :param delay: sleep duration between looking for new frames, in seconds
+    """
+    workers = options.get('decode_workers', 2)
+    stop = threading.Event()
+    frames = LatestSlot()
+    prepared = LatestSlot(on_drop=service.drop)
+    results = Queue(maxsize=options.get('publish_queue_size', 10))
+
+    while not service.refresh():
+        stop.wait(delay)
+
+    watcher = service.create_watcher(delay, stop)
+    threads = [threading.Thread(target=_discover,
+                                args=(service, frames, watcher, stop),
+                                name='frame-discovery')]
+    threads += [threading.Thread(target=_prepare,
+                                 args=(service, frames, prepared, stop),
+                                 name='frame-preparation-{}'.format(i))
+                for i in range(workers)]
+    threads.append(threading.Thread(target=_publish,
+                                    args=(service, results, stop),
+                                    name='publisher'))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    loop_counter = 0
+    try:
+        while True:
+            service.refresh()
+            frame = prepared.get(timeout=delay)
+            if not all(thread.is_alive() for thread in threads):
+                raise RuntimeError('One or more pipeline threads are dead')
+            if frame is None:
+                continue
+
+            if frame.setup is not service.setup:
+                service.drop(frame)
+                continue
+
+            pklot_map = service.classify(frame)
+            json_response = service.build_response(frame, pklot_map)
+            _put_latest(results, json_response)
+            if loop_counter % 100 == 0:
+                logger.info('Finished a sequence of 100 iterations: %s, '
+                            'dropped frames: %s before preparation, %s before '
+                            'inference, model output: %s',
+                            loop_counter, frames.dropped, prepared.dropped,
+                            json_response)
+            loop_counter += 1
+    finally:
+        stop.set()
+
+
+def get_batches_count(options):
+    """ Number of frames the pipeline can hold at the same time: one per
+    decode worker, one waiting for inference and one being classified.
+
+    :param options: dict of "pipeline" model config options
+    :return: number of SlotBatch buffers needed
+    """
+    return options.get('decode_workers', 2) + 2
+
+
+def _discover(service, frames, watcher, stop):
+    newest = None
+    while not stop.is_set():
+        frame = service.find_frame(newest)
+        newest = None
+        if frame:
+            frames.put(frame, frame.modified)
+        else:
+            newest = watcher.wait()
+
+
+def _prepare(service, frames, prepared, stop):
+    while not stop.is_set():
+        frame = frames.get(timeout=1.0)
+        if frame is None:
+            continue
+
+        try:
+            service.prepare(frame)
+        except Exception:
+            logger.exception('Failed to prepare file %s', frame.path)
+            # Slots selected on the frame are selected again on the next one
+            service.drop(frame)
+            continue
+
+        prepared.put(frame, frame.modified)
+
+
+def _publish(service, results, stop):
+    while not stop.is_set():
+        try:
+            json_response = results.get(timeout=1.0)
+        except Empty:
+            continue
+
+        try:
+            service.publish(json_response)
+        except Exception:
+            logger.exception('Failed to publish results')
+
+
+def _put_latest(queue, item):
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except Full:
+            try:
+                dropped = queue.get_nowait()
+                logger.warning('Publisher falls behind, dropping results of '
+                               '%s', dropped['metadata']['source_file'])
+            except Empty:
+                pass
@@ -0,0 +1,147 @@
+""" Per-slot refresh scheduling.
+
+Instead of classifying every slot on every frame, each slot gets a refresh
+interval and only slots which are due are classified, at most `budget` of
+them per frame (the most overdue ones first).  Results of other slots are
+reused and published with their age.
+
+The interval of a slot is the base one, or the one of its reservation type
+(see core_engine reservations file), shortened for volatile slots (whose
+state changed recently) down to `min_interval` and divided by the priority
+from the Sloth annotation ("priority" attribute, 1 by default).
+"""
+import json
+
+import numpy as np
+
+
+class RefreshScheduler:
+    """ Decides which slots to classify on a frame.
+
+    All arrays follow ParkingMap.batch_order.
+    """
+    def __init__(self, parking_map, interval, min_interval, max_interval,
+                 budget, volatility_decay=0.8, reservation_intervals=None):
+        """
+        :param parking_map: ParkingMap object
+        :param interval: refresh interval of a stable slot, in seconds
+        :param min_interval: refresh interval of a volatile slot, in seconds
+        :param max_interval: maximum refresh interval, in seconds
+        :param budget: maximum number of slots classified per frame
+            or None for no limit
+        :param volatility_decay: how fast volatility of a slot fades, 0..1
+            (0 means only the last classification counts)
+        :param reservation_intervals: dict of slot ids mapped to refresh
+            intervals of stable slots, overriding `interval`
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.volatility_decay = volatility_decay
+        self.slot_ids = [parking_map.slot_ids[index]
+                         for index in parking_map.batch_order]
+        reservation_intervals = reservation_intervals or {}
+        self.base_intervals = np.array(
+            [reservation_intervals.get(slot_id, interval)
+             for slot_id in self.slot_ids], dtype=np.float64)
+        self.priorities = parking_map.priorities[
+            parking_map.batch_order].astype(np.float64)
+        self.volatility = np.zeros(len(self.slot_ids), dtype=np.float64)
+        self.states = np.full(len(self.slot_ids), -1, dtype=np.int64)
+        self.refreshed = np.full(len(self.slot_ids), -np.inf,
+                                 dtype=np.float64)
+
+    @classmethod
+    def from_options(cls, parking_map, options):
+        """ Create a scheduler from "scheduler" model config options.
+
+        :param parking_map: ParkingMap object
+        :param options: dict of scheduler options
+        :return: RefreshScheduler object or None if it is disabled
+        """
+        if not options.get('enabled', False):
+            return None
+
+        reservation_intervals = {}
+        if options.get('reservations_file'):
+            with open(options['reservations_file']) as f_reservations:
+                reservations = json.load(f_reservations)
+            type_intervals = options.get('reservation_intervals', {})
+            reservation_intervals = {
+                slot_id: type_intervals[str(reservation_type)]
+                for slot_id, reservation_type in reservations.items()
+                if str(reservation_type) in type_intervals}
+
+        return cls(parking_map, options.get('interval', 10.0),
+                   options.get('min_interval', 1.0),
+                   options.get('max_interval', 60.0),
+                   options.get('budget'),
+                   options.get('volatility_decay', 0.8),
+                   reservation_intervals)
+
+    @property
+    def intervals(self):
+        """ Current refresh intervals of slots, in seconds.
+        """
+        intervals = (self.base_intervals * (1 - self.volatility) +
+                     self.min_interval * self.volatility) / self.priorities
+        return np.clip(intervals, self.min_interval, self.max_interval)
+
+    def select(self, now, urgent=None):
+        """ Find slots to classify on a frame and treat them as refreshed.
+
+        :param now: time of the frame, in seconds
+        :param urgent: boolean numpy array of slots which should be
+            classified before due ones (e.g. touched by motion) or None
+        :return: boolean numpy array, True for slots to classify
+        """
+        overdue = (now - self.refreshed) / self.intervals
+        due = overdue >= 1
+        if urgent is not None:
+            due |= urgent
+            # Urgent slots go first, then the most overdue ones
+            overdue = np.where(urgent, np.inf, overdue)
+
+        if self.budget is not None and due.sum() > self.budget:
+            order = np.argsort(-overdue, kind='stable')[:self.budget]
+            due = np.zeros(len(due), dtype=bool)
+            due[order] = True
+
+        self.refreshed[due] = now
+        return due
+
+    def invalidate(self, rows):
+        """ Make slots due again, e.g. because the frame they were selected
+        on was not classified.
+
+        :param rows: boolean numpy array of slots
+        """
+        self.refreshed[rows] = -np.inf
+
+    def update(self, rows, pklot_map):
+        """ Update volatility of classified slots.
+
+        :param rows: boolean numpy array of classified slots
+        :param pklot_map: dict of slot ids mapped to (state, probability)
+        """
+        for row in np.flatnonzero(rows):
+            state = pklot_map.get(self.slot_ids[row], (None,))[0]
+            if state is None:
+                continue
+
+            changed = self.states[row] not in (-1, state)
+            self.volatility[row] = (
+                self.volatility_decay * self.volatility[row] +
+                (1 - self.volatility_decay) * changed)
+            self.states[row] = state
+
+    def ages(self, now):
+        """ Ages of slot results.
+
+        :param now: current time, in seconds
+        :return: dict of slot ids mapped to ages in seconds (None for slots
+            which were never classified)
+        """
+        return {slot_id: (round(now - refreshed, 1)
+                          if np.isfinite(refreshed) else None)
+                for slot_id, refreshed in zip(self.slot_ids, self.refreshed)}
@@ -0,0 +1,145 @@
+""" Whole-frame inference with per-slot ROI pooling.
+
+Instead of running the model on a crop of every slot, a fully
+convolutional backbone runs once over the CLAHE-normalized frame region
+(see ParkingMap.clahe_region).  Features of each slot are sampled from the
+feature map at a small grid of points spread over the slot polygon
+(ROI-Align style, see ParkingMap.roi_points) and classified with a light
+logistic head.  The cost of a frame depends on its size, not on the number
+of slots.
+
+A ROI model folder contains the backbone (model.json and weights.h5, see
+model_helpers.get_backbone_model) and the head (roi_head.npz), see
+model_core.train_roi_and_save.
+"""
+import os
+
+import numpy as np
+
+from inference_backends import KerasBackend
+from logistic import sigmoid
+
+ROI_HEAD_FILE = 'roi_head.npz'
+ROI_GRID = (2, 2)
+# Downscale factor of the backbone feature map (MobileNetV2)
+FEATURE_STRIDE = 32
+
+
+def roi_align(features, points, stride=FEATURE_STRIDE):
+    """ Sample a feature map at given image points with bilinear
+    interpolation.
+
+    :param features: numpy array of features, shape (H, W, C)
+    :param points: numpy array of (x, y) image coordinates, shape (..., 2)
+    :param stride: downscale factor of the feature map relative to the image
+    :return: float32 numpy array of features, shape (..., C)
+    """
+    height, width = features.shape[:2]
+    # Feature cell i covers image pixels stride * i .. stride * (i + 1) - 1
+    coords = (np.asarray(points, dtype=np.float32) + 0.5) / stride - 0.5
+    x = np.clip(coords[..., 0], 0, width - 1)
+    y = np.clip(coords[..., 1], 0, height - 1)
+    x0 = np.minimum(np.floor(x).astype(np.intp), max(width - 2, 0))
+    y0 = np.minimum(np.floor(y).astype(np.intp), max(height - 2, 0))
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    dx = (x - x0)[..., np.newaxis]
+    dy = (y - y0)[..., np.newaxis]
+
+    top = features[y0, x0] * (1 - dx) + features[y0, x1] * dx
+    bottom = features[y1, x0] * (1 - dx) + features[y1, x1] * dx
+    return (top * (1 - dy) + bottom * dy).astype(np.float32, copy=False)
+
+
+class RoiHead:
+    """ Logistic regression over pooled features of a slot.
+    """
+    def __init__(self, weights, bias, grid=ROI_GRID, stride=FEATURE_STRIDE):
+        """
+        :param weights: float32 numpy array, one weight per pooled feature
+        :param bias: bias of the logistic regression
+        :param grid: (columns, rows) of points pooled per slot
+        :param stride: downscale factor of the backbone feature map
+        """
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.float32(bias)
+        self.grid = tuple(int(value) for value in grid)
+        self.stride = int(stride)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a head saved with `save`.
+
+        :param path: path to the .npz file
+        :return: RoiHead object
+        """
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], data['grid'],
+                       data['stride'])
+
+    def save(self, path):
+        """ Save the head.
+
+        :param path: path to the output .npz file
+        """
+        with open(path, 'wb') as f_out:
+            np.savez(f_out, weights=self.weights, bias=self.bias,
+                     grid=np.array(self.grid), stride=self.stride)
+
+    def predict(self, pooled):
+        """ Classify slots.
+
+        :param pooled: numpy array of pooled features, shape
+            (N, rows, columns, C)
+        :return: float32 numpy array of probabilities of being occupied,
+            shape (N, 1)
+        """
+        logits = pooled.reshape(len(pooled), -1).dot(self.weights) + self.bias
+        return sigmoid(logits)[:, np.newaxis]
+
+
+class RoiPoolingModel:
+    """ Backbone run over the whole frame region and a head classifying
+    slots from pooled features.
+    """
+    def __init__(self, backbone, head):
+        """
+        :param backbone: backend object of a fully convolutional model
+            accepting images of any size (see inference_backends.py)
+        :param head: RoiHead object
+        """
+        self.backbone = backbone
+        self.head = head
+
+    @property
+    def grid(self):
+        """ (columns, rows) of points pooled per slot.
+        """
+        return self.head.grid
+
+    @classmethod
+    def load(cls, model_path):
+        """ Load a ROI model.
+
+        Only Keras runs the backbone, TFLite interpreters are bound to a
+        fixed input size.
+
+        :param model_path: path to the ROI model folder
+        :return: RoiPoolingModel object
+        """
+        return cls(KerasBackend.load(model_path),
+                   RoiHead.load(os.path.join(model_path, ROI_HEAD_FILE)))
+
+    def predict(self, image, points):
+        """ Classify slots of a frame.
+
+        :param image: float32 numpy array of the normalized frame region,
+            shape (H, W, 3)
+        :param points: numpy array of (x, y) region coordinates of pooled
+            points, shape (N, rows, columns, 2)
+        :return: float32 numpy array of probabilities of being occupied,
+            shape (N, 1)
+        """
+        features = self.backbone.predict(image[np.newaxis])[0]
+        return self.head.predict(roi_align(features, points,
+                                           self.head.stride))
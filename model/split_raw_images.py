@@ -2,6 +2,7 @@
 
 usage: split_raw_images.py [-h] --input-folder INPUT_FOLDER --output-folder
                            OUTPUT_FOLDER --conf CONF
+                           [--save-compiled SAVE_COMPILED]
 
 optional arguments:
   -h, --help            show this help message and exit
@@ -9,14 +10,17 @@ optional arguments:
                         input folder with raw images
   --output-folder OUTPUT_FOLDER, -o OUTPUT_FOLDER
                         output folder with cropped slot images
-  --conf CONF, -c CONF  parking configuration json
+  --conf CONF, -c CONF  parking configuration json or compiled parking map
+                        (.npz)
+  --save-compiled SAVE_COMPILED, -s SAVE_COMPILED
+                        path to save the compiled parking map (.npz)
 """
 
 import argparse
-import json
 import os
 
-from crop_helpers import verify_conf, create_output_folder, extract_and_save
+from crop_helpers import create_output_folder, extract_and_save
+from parking_map import load_parking_map
 
 
 def main():
@@ -29,18 +33,23 @@ def main():
                         help='output folder with cropped slot images',
                         required=True)
     parser.add_argument('--conf', '-c', dest='conf',
-                        help='parking configuration json', required=True)
+                        help='parking configuration json or compiled '
+                             'parking map (.npz)', required=True)
+    parser.add_argument('--save-compiled', '-s', dest='save_compiled',
+                        help='path to save the compiled parking map (.npz)',
+                        required=False)
     args = parser.parse_args()
-    with open(args.conf) as f_conf:
-        conf = json.load(f_conf)
 
-    verify_conf(conf)
-    create_output_folder(args.output_folder, conf)
+    parking_map = load_parking_map(args.conf)
+    if args.save_compiled:
+        parking_map.save(args.save_compiled)
+
+    create_output_folder(args.output_folder, parking_map)
     for filename in os.listdir(args.input_folder):
         if filename.endswith('.jpg'):
             extract_and_save(os.path.join(args.input_folder, filename),
                              args.output_folder,
-                             conf)
+                             parking_map)
 
 
 if __name__ == '__main__':
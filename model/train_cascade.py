@@ -0,0 +1,63 @@
+""" Script to train the first stage of a two-stage cascade for a model.
+
+usage: train_cascade.py [-h] --input-folder INPUT_FOLDER --model-folder
+                        MODEL_FOLDER [--low LOW] [--high HIGH]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --input-folder INPUT_FOLDER, -i INPUT_FOLDER
+                        input folder with a dataset for the model
+                        (`training` and `validation` subfolders)
+  --model-folder MODEL_FOLDER, -m MODEL_FOLDER
+                        model folder, the cascade is saved there
+  --low LOW, -l LOW     slots with a lower first stage probability of being
+                        occupied are free (0.1 by default)
+  --high HIGH, -u HIGH  slots with a higher first stage probability of being
+                        occupied are occupied (0.9 by default)
+"""
+
+import argparse
+import os
+
+from model_core import train_cascade_and_save, evaluate_cascade
+
+BANDS = ((0.02, 0.98), (0.05, 0.95), (0.1, 0.9), (0.2, 0.8), (0.3, 0.7))
+
+
+def main():
+    """ Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-folder', '-i', dest='input_folder',
+                        help='input folder with a dataset for the model '
+                             '(`training` and `validation` subfolders)',
+                        required=True)
+    parser.add_argument('--model-folder', '-m', dest='model_folder',
+                        help='model folder, the cascade is saved there',
+                        required=True)
+    parser.add_argument('--low', '-l', dest='low', type=float, default=0.1,
+                        help='slots with a lower first stage probability of '
+                             'being occupied are free (0.1 by default)')
+    parser.add_argument('--high', '-u', dest='high', type=float,
+                        default=0.9,
+                        help='slots with a higher first stage probability of '
+                             'being occupied are occupied (0.9 by default)')
+    args = parser.parse_args()
+
+    cascade = train_cascade_and_save(
+        os.path.join(args.input_folder, 'training'), args.model_folder,
+        args.low, args.high)
+    bands = sorted(set(BANDS) | {(args.low, args.high)})
+    for result in evaluate_cascade(
+            args.model_folder, cascade,
+            os.path.join(args.input_folder, 'validation'), bands):
+        print('Band {low:.2f}..{high:.2f}: first stage decides '
+              '{first_stage:.1%} of slots with accuracy '
+              '{first_stage_accuracy:.4f}, second stage {second_stage:.1%}; '
+              'accuracy {cascade_accuracy:.4f} (model alone '
+              '{model_accuracy:.4f})'.format(
+                  second_stage=1 - result['first_stage'], **result))
+
+
+if __name__ == '__main__':
+    main()
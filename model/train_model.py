@@ -1,7 +1,8 @@
 """ Script to train the model.
 
 usage: train_model.py [-h] --input-folder INPUT_FOLDER --output-folder
-                      OUTPUT_FOLDER
+                      OUTPUT_FOLDER [--model-folder MODEL_FOLDER] [--distill]
+                      [--max-accuracy-gap MAX_ACCURACY_GAP]
 
 optional arguments:
   -h, --help            show this help message and exit
@@ -11,12 +12,17 @@ optional arguments:
                         output folder for the model
   --model-folder MODEL_FOLDER, -m MODEL_FOLDER
                         existing model folder
+  --distill, -d         distill the existing model into a compact one
+  --max-accuracy-gap MAX_ACCURACY_GAP, -g MAX_ACCURACY_GAP
+                        maximum accuracy loss of a distilled model compared
+                        to the existing one (0.01 by default)
 """
 
 import argparse
 import os
 
-from model_core import train_and_save, retrain_and_save, test_model
+from model_core import (train_and_save, retrain_and_save, distill_and_save,
+                        test_model)
 
 
 def main():
@@ -30,10 +36,35 @@ def main():
                         help='output folder for the model', required=True)
     parser.add_argument('--model-folder', '-m', dest='model_folder',
                         help='existing model folder', required=False)
+    parser.add_argument('--distill', '-d', dest='distill',
+                        action='store_true',
+                        help='distill the existing model into a compact one')
+    parser.add_argument('--max-accuracy-gap', '-g', dest='max_accuracy_gap',
+                        type=float, default=0.01,
+                        help='maximum accuracy loss of a distilled model '
+                             'compared to the existing one (0.01 by default)')
     args = parser.parse_args()
+    if args.distill and not args.model_folder:
+        parser.error('--distill requires --model-folder')
 
     os.makedirs(args.output_folder, exist_ok=True)
-    if args.model_folder:
+    if args.distill:
+        report = distill_and_save(args.model_folder,
+                                  os.path.join(args.input_folder, 'training'),
+                                  os.path.join(args.input_folder,
+                                               'validation'),
+                                  args.output_folder, args.max_accuracy_gap)
+        print('Teacher: accuracy {accuracy:.4f}, {crops_per_second:.1f} '
+              'crops/s'.format(**report['teacher']))
+        for student in report['students']:
+            print('Student alpha {alpha}, {side}x{side}: accuracy '
+                  '{accuracy:.4f}, agreement with teacher {agreement:.4f}, '
+                  '{crops_per_second:.1f} crops/s, {parameters} parameters'
+                  .format(**student))
+        if report['exported'] is None:
+            print('No student is within the accuracy gap, nothing exported')
+            return
+    elif args.model_folder:
         retrain_and_save(args.model_folder,
                          os.path.join(args.input_folder, 'training'),
                          os.path.join(args.input_folder, 'validation'),
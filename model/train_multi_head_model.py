@@ -0,0 +1,76 @@
+""" Script to train a model with a shared backbone and a head per model.
+
+usage: train_multi_head_model.py [-h] --output-folder OUTPUT_FOLDER
+                                 [--input-folder INPUT_FOLDER]
+                                 [--model-folders MODEL_FOLDERS [...]]
+                                 [--heads HEADS [...]] [--epochs EPOCHS]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --output-folder OUTPUT_FOLDER, -o OUTPUT_FOLDER
+                        output folder for the model
+  --input-folder INPUT_FOLDER, -i INPUT_FOLDER
+                        input folder with a dataset per head (model name),
+                        each with `training` and `validation` subfolders
+  --model-folders MODEL_FOLDERS [...], -m MODEL_FOLDERS [...]
+                        existing model folders to convert, heads are named
+                        after the folders, the backbone is taken from the
+                        first one
+  --heads HEADS [...]   head names, if there are no existing models
+  --epochs EPOCHS, -e EPOCHS
+                        maximum number of epochs, 0 to only convert a single
+                        existing model (50 by default), heads of several
+                        existing models must be fine-tuned on the shared
+                        backbone
+"""
+
+import argparse
+import os
+
+from model_core import train_multi_head_and_save, EPOCHS
+
+
+def main():
+    """ Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-folder', '-o', dest='output_folder',
+                        help='output folder for the model', required=True)
+    parser.add_argument('--input-folder', '-i', dest='input_folder',
+                        help='input folder with a dataset per head (model '
+                             'name), each with `training` and `validation` '
+                             'subfolders', required=False)
+    parser.add_argument('--model-folders', '-m', dest='model_folders',
+                        nargs='+', default=[],
+                        help='existing model folders to convert, heads are '
+                             'named after the folders, the backbone is taken '
+                             'from the first one', required=False)
+    parser.add_argument('--heads', dest='heads', nargs='+', default=[],
+                        help='head names, if there are no existing models',
+                        required=False)
+    parser.add_argument('--epochs', '-e', dest='epochs', type=int,
+                        default=EPOCHS,
+                        help='maximum number of epochs, 0 to only convert '
+                             'a single existing model ({} by default)'
+                             .format(EPOCHS))
+    args = parser.parse_args()
+
+    source_model_paths = {
+        os.path.basename(os.path.normpath(path)): path
+        for path in args.model_folders}
+    heads = list(source_model_paths) or args.heads
+    if not heads:
+        parser.error('either --model-folders or --heads is required')
+    if not args.epochs and len(source_model_paths) > 1:
+        parser.error('heads of several existing models must be fine-tuned on '
+                     'the shared backbone, --epochs can not be 0')
+    if args.epochs and not args.input_folder:
+        parser.error('--input-folder is required for training')
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    train_multi_head_and_save(args.input_folder, heads, args.output_folder,
+                              source_model_paths, args.epochs)
+
+
+if __name__ == '__main__':
+    main()
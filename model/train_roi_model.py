@@ -0,0 +1,55 @@
+""" Script to train a model for whole-frame inference with per-slot
+ROI pooling.
+
+usage: train_roi_model.py [-h] --input-folder INPUT_FOLDER --output-folder
+                          OUTPUT_FOLDER [--model-folder MODEL_FOLDER]
+                          [--grid COLUMNS ROWS]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --input-folder INPUT_FOLDER, -i INPUT_FOLDER
+                        input folder with a dataset (`training` and
+                        `validation` subfolders)
+  --output-folder OUTPUT_FOLDER, -o OUTPUT_FOLDER
+                        output folder for the model
+  --model-folder MODEL_FOLDER, -m MODEL_FOLDER
+                        existing model folder to take the backbone from
+  --grid COLUMNS ROWS, -g COLUMNS ROWS
+                        points pooled per slot (2 2 by default)
+"""
+
+import argparse
+import os
+
+from model_core import train_roi_and_save
+from roi_pooling import ROI_GRID
+
+
+def main():
+    """ Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-folder', '-i', dest='input_folder',
+                        help='input folder with a dataset (`training` and '
+                             '`validation` subfolders)', required=True)
+    parser.add_argument('--output-folder', '-o', dest='output_folder',
+                        help='output folder for the model', required=True)
+    parser.add_argument('--model-folder', '-m', dest='model_folder',
+                        help='existing model folder to take the backbone '
+                             'from', required=False)
+    parser.add_argument('--grid', '-g', dest='grid', type=int, nargs=2,
+                        metavar=('COLUMNS', 'ROWS'), default=ROI_GRID,
+                        help='points pooled per slot ({} {} by default)'
+                             .format(*ROI_GRID))
+    args = parser.parse_args()
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    accuracy = train_roi_and_save(
+        os.path.join(args.input_folder, 'training'),
+        os.path.join(args.input_folder, 'validation'),
+        args.output_folder, args.model_folder, tuple(args.grid))
+    print('Validation accuracy {:.4f}'.format(accuracy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import json
+import unittest
+from queue import Queue
+from types import SimpleNamespace
+
+from core_engine.core_engine_launcher import CoreEngine
+from core_engine.events import EnteredThroughGate
+
+options = {
+    'video_plugin_topics': ['/plugins/video'],
+    'gate_plugin_topic': '/plugins/gate',
+    'event_ttl': 180,
+    'windowing': {
+        'strategy': 'most_freq',
+        'window_size': 3,
+        'defined_min': 0.3,
+        'defined_max': 0.7
+    }
+}
+
+
+class FakeRulesManager:
+    def __init__(self):
+        self.published = []
+
+    def calculate_and_send_state(self, events, parking_state):
+        self.published.append({
+            place_id: place.state
+            for place_id, place in parking_state.state.items()})
+
+
+def video_message(sigmoids):
+    return SimpleNamespace(topic='/plugins/video', payload=json.dumps({
+        'parking_places': {place_id: [int(sigmoid > 0.5), str(sigmoid)]
+                           for place_id, sigmoid in sigmoids.items()},
+        'parking': {}, 'metadata': {}}))
+
+
+def messages_burst():
+    return [video_message({'1': 0.1, '2': 0.9}),
+            SimpleNamespace(topic='/plugins/gate',
+                            payload=json.dumps({'entered': 0})),
+            video_message({'1': 0.9, '2': 0.9}),
+            SimpleNamespace(topic='/plugins/video', payload='not json'),
+            video_message({'1': 0.8, '2': 0.1}),
+            video_message({'1': 0.9, '2': 0.2})]
+
+
+class CoreEngineTest(unittest.TestCase):
+    def test_batch_publishes_once(self):
+        single = CoreEngine(options, FakeRulesManager())
+        for message in messages_burst():
+            single.handle(message)
+
+        batched = CoreEngine(options, FakeRulesManager())
+        queue = Queue()
+        burst = messages_burst()
+        for message in burst:
+            queue.put(message)
+        self.assertEqual(len(burst), batched.handle_batch(
+            queue.get(), queue, max_size=100, max_latency=10))
+
+        self.assertEqual(5, len(single.rules_manager.published))
+        self.assertEqual(single.rules_manager.published[-1:],
+                         batched.rules_manager.published)
+        self.assertEqual(1, batched.events.count(EnteredThroughGate))
+        self.assertTrue(queue.empty())
+
+    def test_batch_size_limit(self):
+        engine = CoreEngine(options, FakeRulesManager())
+        queue = Queue()
+        for message in messages_burst():
+            queue.put(message)
+        self.assertEqual(2, engine.handle_batch(queue.get(), queue,
+                                                max_size=2, max_latency=10))
+        self.assertEqual(1, len(engine.rules_manager.published))
+        self.assertEqual(4, queue.qsize())
+
+    def test_expired_events_are_published(self):
+        engine = CoreEngine(options, FakeRulesManager())
+        for message in messages_burst()[:2]:
+            engine.handle(message)
+        published = engine.rules_manager.published
+        self.assertEqual(2, len(published))
+
+        engine.expire_and_publish()
+        self.assertEqual(2, len(published))
+
+        engine.events.oldest().time -= options['event_ttl'] + 1
+        engine.expire_and_publish()
+        self.assertIsNone(engine.events.oldest())
+        self.assertEqual(3, len(published))
+
+
+if __name__ == '__main__':
+    unittest.main()
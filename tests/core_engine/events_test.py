@@ -0,0 +1,74 @@
+import unittest
+
+from core_engine.events import (EnteredParkingPlace, EnteredThroughGate,
+                                EventLog, ExitedParkingPlace,
+                                ExitedThroughGate, remove_old_events)
+
+EVENT_TYPES = [EnteredThroughGate, ExitedThroughGate, EnteredParkingPlace,
+               ExitedParkingPlace]
+
+
+def remove_last_event(events):
+    """ List based removal the event log replaces (newest event first).
+    """
+    latest = events[-1]
+    pair_event_index = None
+    if isinstance(latest, (EnteredThroughGate, ExitedParkingPlace)):
+        for i, event in reversed(list(enumerate(events))):
+            if isinstance(event, (ExitedThroughGate, EnteredParkingPlace)):
+                pair_event_index = i
+                break
+
+    del events[-1]
+    if pair_event_index:
+        del events[pair_event_index]
+
+
+class EventLogTest(unittest.TestCase):
+    def test_matches_list_removal(self):
+        # Fixed sequence of appends (event type index) and removals (None)
+        script = [0, 0, 1, 2, None, 3, 2, 2, None, None, 0, 1, 3, None, 2,
+                  0, None, None, 1, None, 2, None, None, 3, 0, None, None,
+                  None, None, 0, 2, None, None]
+        events = EventLog()
+        expected = []
+        for step in script:
+            if step is None:
+                if expected:
+                    events.remove_oldest()
+                    remove_last_event(expected)
+            else:
+                event = EVENT_TYPES[step]()
+                events.append(event)
+                expected.insert(0, event)
+
+            self.assertEqual(expected, list(events))
+            self.assertEqual(len(expected), len(events))
+            for event_type in EVENT_TYPES:
+                self.assertEqual(
+                    sum(type(event) is event_type for event in expected),
+                    events.count(event_type))
+
+    def test_pair_is_kept_if_newest(self):
+        events = EventLog()
+        gate = EnteredThroughGate()
+        place = EnteredParkingPlace('1')
+        events.append(gate)
+        events.append(place)
+        events.remove_oldest()
+        self.assertEqual([place], list(events))
+
+    def test_remove_old_events(self):
+        events = EventLog()
+        for index in range(4):
+            event = ExitedThroughGate()
+            event.time -= 100 - index
+            events.append(event)
+        events.append(EnteredThroughGate())
+        self.assertEqual(2, remove_old_events(events, 98.5))
+        self.assertEqual(3, len(events))
+        self.assertEqual(2, events.count(ExitedThroughGate))
+
+
+if __name__ == '__main__':
+    unittest.main()
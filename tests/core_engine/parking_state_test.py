@@ -0,0 +1,59 @@
+import unittest
+
+from core_engine.parking_state import ParkingState, PLACE_STATUS
+
+window_options = {
+    "strategy": "most_freq",
+    "window_size": 3,
+    "defined_min": 0.3,
+    "defined_max": 0.7
+}
+
+
+def message(places):
+    return {'parking_places': places, 'parking': {}, 'metadata': {}}
+
+
+class ParkingStateTest(unittest.TestCase):
+    def assertCounters(self, parking_state):
+        states = [place.state for place in parking_state.state.values()]
+        free = states.count(PLACE_STATUS['FREE'])
+        self.assertEqual(free, parking_state.free)
+        self.assertEqual(len(states) - free, parking_state.occupied)
+        self.assertEqual(
+            sum(1 for place_id in parking_state.reservations
+                if place_id in parking_state.state and
+                parking_state.state[place_id].state == PLACE_STATUS['FREE']),
+            parking_state.reserved_free)
+
+    def test_incremental_updates(self):
+        parking_state = ParkingState(
+            message({'1': [0, '0.1'], '2': [1, '0.9'], '3': [0, '0.2']}),
+            {'3': 3}, window_options)
+        self.assertEqual((2, 1, 1), (parking_state.free,
+                                     parking_state.occupied,
+                                     parking_state.reserved_free))
+        self.assertEqual(2, parking_state.general_purpose_places)
+
+        diff = parking_state.set_parking_new_state(
+            message({'1': [1, '0.9'], '2': [1, '0.9'], '3': [1, '0.9'],
+                     '4': [1, '0.8']}))
+        self.assertEqual({'1': PLACE_STATUS['FREE'],
+                          '3': PLACE_STATUS['FREE']}, diff)
+        self.assertEqual(PLACE_STATUS['OCCUPIED'],
+                         parking_state.state['1'].state)
+        self.assertEqual(1.0, parking_state.state['1'].sigmoid_value)
+        self.assertEqual(3, parking_state.state['3'].reservation_state)
+        self.assertCounters(parking_state)
+
+        for _ in range(3):
+            parking_state.set_parking_new_state(
+                message({'1': [0, '0.1'], '3': [0, '0.1'], '4': [0, '0.5']}))
+            self.assertCounters(parking_state)
+        self.assertEqual(PLACE_STATUS['FREE'], parking_state.state['1'].state)
+        self.assertEqual(0.5, parking_state.state['4'].sigmoid_value)
+        self.assertEqual(1, parking_state.reserved_free)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from core_engine.timers import Timers
+
+
+class TimersTest(unittest.TestCase):
+    def test_periodic_tasks(self):
+        runs = []
+        timers = Timers()
+        self.assertIsNone(timers.timeout(0))
+        timers.every(10, lambda: runs.append('refresh'), 0)
+        timers.every(3, lambda: runs.append('check'), 1)
+
+        timers.run_due(0)
+        self.assertEqual(['refresh'], runs)
+        self.assertEqual(1, timers.timeout(0))
+
+        timers.run_due(3.5)
+        self.assertEqual(['refresh', 'check'], runs)
+        self.assertEqual(0.5, timers.timeout(3.5))
+        timers.run_due(4)
+        self.assertEqual(['refresh', 'check', 'check'], runs)
+        self.assertEqual(3, timers.timeout(4))
+
+    def test_late_task_runs_once(self):
+        runs = []
+        timers = Timers()
+        timers.every(1, lambda: runs.append('check'), 0)
+        timers.run_due(5.5)
+        self.assertEqual(['check'], runs)
+        self.assertEqual(1, timers.timeout(5.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
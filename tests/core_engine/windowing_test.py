@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 import core_engine.windowing as windowing
 
 window_options = {
@@ -10,6 +12,46 @@ window_options = {
 }
 
 
+class BaselineWindow:
+    """ List based window of a single place the windowing engine replaces.
+    """
+    def __init__(self, options):
+        self.strategy = options['strategy']
+        self.window_size = options['window_size']
+        self.defined_min = options['defined_min']
+        self.defined_max = options['defined_max']
+        self.sigmoid_list = []
+        self.medians = []
+        self.batch_class_max = np.array([]).astype(int)
+
+    def _push(self, values, value):
+        if len(values) < self.window_size:
+            return np.append(values, value)
+        return np.insert(values[1:], len(values) - 1, value)
+
+    def _classify(self, value):
+        if value < self.defined_min:
+            return 1
+        if value > self.defined_max:
+            return 2
+        return 0
+
+    def apply(self, sigmoid):
+        if self.strategy == 'none':
+            return self._classify(sigmoid)
+
+        self.sigmoid_list = self._push(self.sigmoid_list, float(sigmoid))
+        self.medians = self._push(self.medians,
+                                  np.median(self.sigmoid_list))
+        batch_class = [self._classify(x) for x in self.medians]
+        if self.strategy == 'most_freq':
+            return np.argmax(np.bincount(batch_class))
+
+        self.batch_class_max = self._push(self.batch_class_max,
+                                          np.max(batch_class))
+        return np.argmax(np.bincount(self.batch_class_max))
+
+
 class MostFreqOfMaxStrategyTest(unittest.TestCase):
     def test_max(self):
         input_data = [0.1, 0.2, 0.1, 0.9, 0.6,
@@ -65,3 +107,30 @@ class NoneStrategyTest(unittest.TestCase):
                     2, 2, 0, 2, 0,
                     2, 2, 1, 2, 0]
         self.assertEqual(expected, res)
+
+
+class WindowingEngineTest(unittest.TestCase):
+    def test_matches_baseline_windows(self):
+        input_data = [0.1, 0.2, 0.1, 0.9, 0.6,
+                      0.98, 0.8, 0.75, 0.8, 0.9,
+                      0.9, 0.8, 0.6, 0.9, 0.5,
+                      0.9, 0.8, 0.1, 0.9, 0.4]
+        place_ids = ['1', '2', '3']
+
+        for strategy in ('most_freq', 'most_freq_of_max', 'none'):
+            options = dict(window_options, strategy=strategy)
+            managers = [BaselineWindow(options) for _ in place_ids]
+            engine = windowing.WindowingEngine(options, capacity=1)
+            for step in range(len(input_data)):
+                # Places get samples shifted and the last one skips some
+                ids = place_ids if step % 3 else place_ids[:2]
+                sigmoids = [input_data[(step + index) % len(input_data)]
+                            for index in range(len(ids))]
+                expected = [managers[index].apply(sigmoid)
+                            for index, sigmoid in enumerate(sigmoids)]
+                res = engine.apply(engine.rows(ids), sigmoids)
+                self.assertEqual(expected, res.tolist())
+
+    def test_wrong_strategy(self):
+        with self.assertRaises(ValueError):
+            windowing.WindowingEngine(dict(window_options, strategy='mean'))
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cascade import Cascade, cascade_features, load_cascades, CASCADE_FILE
+
+
+def synthetic_slots(labels, seed=0):
+    """ Free slots are flat and dark, occupied ones are bright with edges.
+    """
+    rng = np.random.RandomState(seed)
+    batch = rng.normal(-1.0, 0.1, (len(labels), 32, 32, 3))
+    for index, label in enumerate(labels):
+        if label:
+            batch[index, 8:24, 4:28] = 1.5
+            batch[index, 8:24:4] = -1.5
+    return batch.astype(np.float32)
+
+
+class CascadeTest(unittest.TestCase):
+    def test_features(self):
+        features = cascade_features(synthetic_slots([0, 1]))
+        self.assertEqual((2, 17), features.shape)
+        # Histograms sum up to one
+        np.testing.assert_allclose([1, 1], features[:, 6:14].sum(axis=1),
+                                   atol=1e-6)
+        # Occupied slots have more edges
+        self.assertGreater(features[1, 16], features[0, 16])
+
+    def test_fit_split_and_hit_rates(self):
+        labels = np.arange(40) % 2
+        cascade = Cascade.fit(cascade_features(synthetic_slots(labels)),
+                              labels, 0.2, 0.8)
+        probabilities, confident = cascade.split(synthetic_slots(labels, 1))
+        self.assertTrue(confident.all())
+        np.testing.assert_array_equal(labels, probabilities > 0.5)
+
+        cascade.low, cascade.high = 0, 1
+        cascade.split(synthetic_slots(labels[:10]))
+        self.assertEqual({'slots': 50, 'first_stage': 0.8,
+                          'second_stage': 0.2},
+                         cascade.hit_rates(reset=True))
+        self.assertEqual(0, cascade.hit_rates()['slots'])
+
+    def test_save_and_load(self):
+        labels = np.arange(10) % 2
+        cascade = Cascade.fit(cascade_features(synthetic_slots(labels)),
+                              labels)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(os.path.join(tmp_dir, 'main'))
+            cascade.save(os.path.join(tmp_dir, 'main', CASCADE_FILE))
+            cascades = load_cascades(tmp_dir, ['main', 'behind_trees'],
+                                     {'low': 0.3, 'high': None})
+
+        self.assertEqual(['main'], list(cascades))
+        self.assertEqual((0.3, 0.9),
+                         (cascades['main'].low, cascades['main'].high))
+        batch = synthetic_slots(labels, 1)
+        np.testing.assert_array_equal(cascade.predict(batch),
+                                      cascades['main'].predict(batch))
+
+
+if __name__ == '__main__':
+    unittest.main()
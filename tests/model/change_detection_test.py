@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from change_detection import SlotChangeDetector, FrameMotionGate
+from parking_map import ParkingMap
+
+
+class SlotChangeDetectorTest(unittest.TestCase):
+    def test_select(self):
+        detector = SlotChangeDetector(threshold=6.0, refresh_frames=100)
+        crops = np.full((4, 128, 128, 3), 100, dtype=np.uint8)
+
+        self.assertEqual([True] * 4, detector.select(crops).tolist())
+
+        crops[1] = 200
+        crops[2, :8, :8] = 255
+        self.assertEqual([False, True, False, False],
+                         detector.select(crops).tolist())
+
+    def test_refresh_is_staggered(self):
+        detector = SlotChangeDetector(threshold=6.0, refresh_frames=4)
+        crops = np.zeros((8, 32, 32, 3), dtype=np.uint8)
+        detector.select(crops)
+
+        refreshed = np.zeros(8, dtype=int)
+        for _ in range(4):
+            selected = detector.select(crops)
+            self.assertEqual(2, selected.sum())
+            refreshed += selected
+        self.assertEqual([1] * 8, refreshed.tolist())
+
+
+class FrameMotionGateTest(unittest.TestCase):
+    def test_select(self):
+        parking_map = ParkingMap.from_conf([{'annotations': [
+            {'id': '1', 'model': 'main',
+             'xn': '10;60;60;10', 'yn': '10;10;110;110'},
+            {'id': '2', 'model': 'main',
+             'xn': '300;380;380;300', 'yn': '200;200;300;300'}]}])
+        gate = FrameMotionGate(parking_map, width=64, cell_size=4,
+                               threshold=10.0, refresh_frames=100)
+        frame = np.full((360, 640, 3), 80, dtype=np.uint8)
+
+        self.assertEqual([True, True], gate.select(frame).tolist())
+        self.assertEqual([False, False], gate.select(frame).tolist())
+
+        frame[220:280, 320:360] = 250
+        self.assertEqual([False, True], gate.select(frame).tolist())
+        self.assertEqual([False, False], gate.select(frame).tolist())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Model Engine modules import each other as top-level modules
+# (the same way they are laid out inside the Docker container).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir, 'model'))
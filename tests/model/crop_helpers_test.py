@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from crop_helpers import (SlotBatch, collect_input, create_output_folder,
+                          extract_and_save, _apply_clahe, CLAHE_TILE_GRID,
+                          WIDTH, HEIGHT, MEANS, STDS)
+from parking_map import ParkingMap, load_parking_map
+
+SLOTH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, os.pardir, 'sloth')
+CONF_PATH = os.path.join(SLOTH_PATH, 'pklot_config.json')
+IMG_PATH = os.path.join(SLOTH_PATH, 'parking_map.jpg')
+
+
+def synthetic_frame(height=2160, width=3840):
+    """ Smooth frame with some structure, so interpolation differences
+    between cropping methods stay small.
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.stack([128 + 100 * np.sin(x / 97.0) * np.cos(y / 61.0),
+                      128 + 100 * np.sin((x + y) / 143.0),
+                      128 + 100 * np.cos(x / 53.0 - y / 89.0)], axis=-1)
+    return frame.astype(np.uint8)
+
+
+class SlotBatchTest(unittest.TestCase):
+    def test_extract_matches_warp_and_resize(self):
+        parking_map = load_parking_map(CONF_PATH)
+        img = synthetic_frame()
+        slot_batch = SlotBatch(parking_map)
+        inputs = slot_batch.extract(img)
+
+        self.assertEqual(set(parking_map.models_to_ids), set(inputs))
+        for model_name, indices in parking_map.models_to_indices.items():
+            tensor = inputs[model_name]
+            self.assertEqual(np.float32, tensor.dtype)
+            self.assertEqual((len(indices), HEIGHT, WIDTH, 3), tensor.shape)
+
+            expected = np.array([
+                (cv2.resize(parking_map.warp(img, i), (WIDTH, HEIGHT)) / 255
+                 - MEANS) / STDS for i in indices])
+            self.assertLess(np.abs(expected - tensor).mean(), 0.02)
+
+
+class CollectInputTest(unittest.TestCase):
+    def test_matches_extract_and_save(self):
+        with open(CONF_PATH) as f_conf:
+            conf = json.load(f_conf)
+        # Slots covering only a part of the frame
+        parking_map = ParkingMap.from_conf(
+            [{'annotations': conf[0]['annotations'][40:60]}])
+        img = cv2.imread(IMG_PATH)
+        region = parking_map.clahe_region(img.shape)
+        self.assertLess(region.width * region.height,
+                        img.shape[0] * img.shape[1])
+
+        slot_batch = SlotBatch(parking_map)
+        collect_input(img, slot_batch)
+
+        with tempfile.TemporaryDirectory() as output_folder:
+            create_output_folder(output_folder, parking_map)
+            extract_and_save(IMG_PATH, output_folder, parking_map,
+                             keep_file_name=False)
+            for row, index in enumerate(parking_map.batch_order):
+                expected = cv2.imread(os.path.join(
+                    output_folder, parking_map.models[index],
+                    '{}.png'.format(parking_map.slot_ids[index])))
+                expected = cv2.resize(expected, (WIDTH, HEIGHT))
+                diff = np.abs(expected.astype(np.int16) -
+                              slot_batch.crops[row])
+                self.assertLess(diff.mean(), 4.0)
+
+    def test_region_clahe_matches_full_frame(self):
+        with open(CONF_PATH) as f_conf:
+            conf = json.load(f_conf)
+        parking_map = ParkingMap.from_conf(
+            [{'annotations': conf[0]['annotations'][40:60]}])
+        img = synthetic_frame()
+        # Reduced decode sizes: sides not dividing into tiles are padded
+        for width, height in ((960, 540), (480, 270), (1920, 1083)):
+            frame = cv2.resize(img, (width, height),
+                               interpolation=cv2.INTER_AREA)
+            frame_map = parking_map.scaled(3840 / width)
+            region = frame_map.clahe_region(frame.shape, CLAHE_TILE_GRID)
+            expected = _apply_clahe(frame)[
+                region.y:region.y + region.height,
+                region.x:region.x + region.width]
+            result = _apply_clahe(frame, region)
+
+            inside = np.zeros(result.shape[:2], dtype=bool)
+            for x_min, y_min, x_max, y_max in frame_map.footprints:
+                inside[max(int(y_min) - region.y, 0):
+                       int(np.ceil(y_max)) - region.y,
+                       max(int(x_min) - region.x, 0):
+                       int(np.ceil(x_max)) - region.x] = True
+            diff = np.abs(expected.astype(np.int16) - result)[inside]
+            self.assertLess(diff.mean(), 0.01)
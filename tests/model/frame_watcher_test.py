@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from frame_watcher import InotifyWatcher, PollingWatcher, create_watcher
+
+
+def write_file(path):
+    with open(path, 'wb') as f_out:
+        f_out.write(b'frame')
+
+
+class InotifyWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        os.mkdir(os.path.join(self.root, 'run1'))
+        self.watcher = InotifyWatcher(self.root, 0.05)
+
+    def tearDown(self):
+        self.watcher.close()
+        self.tmp_dir.cleanup()
+
+    def test_burst_wakes_with_newest_frame(self):
+        self.assertIsNone(self.watcher.wait())
+        for index in range(3):
+            write_file(os.path.join(self.root, 'run1',
+                                    'out_{}.jpg'.format(index)))
+        write_file(os.path.join(self.root, 'run1', 'notes.txt'))
+        self.assertEqual(os.path.join(self.root, 'run1', 'out_2.jpg'),
+                         self.watcher.wait())
+        self.assertIsNone(self.watcher.wait())
+
+    def test_renamed_frame_in_new_folder(self):
+        folder = os.path.join(self.root, 'frames')
+        os.mkdir(folder)
+        self.assertIsNone(self.watcher.wait())
+        write_file(os.path.join(folder, '.tmp_1.jpg'))
+        os.rename(os.path.join(folder, '.tmp_1.jpg'),
+                  os.path.join(folder, '1.jpg'))
+        self.assertEqual(os.path.join(folder, '1.jpg'), self.watcher.wait())
+
+    def test_wakes_up_before_timeout(self):
+        self.watcher.timeout = 5
+        path = os.path.join(self.root, 'run1', 'out_1.jpg')
+        threading.Timer(0.05, write_file, args=(path,)).start()
+        start = time.time()
+        self.assertEqual(path, self.watcher.wait())
+        self.assertLess(time.time() - start, 2)
+
+
+class CreateWatcherTest(unittest.TestCase):
+    def test_polling_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            watcher = create_watcher(os.path.join(tmp_dir, 'missing'),
+                                     {'mode': 'inotify'}, 0.01)
+            self.assertIsInstance(watcher, PollingWatcher)
+            self.assertIsNone(watcher.wait())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import threading
+import unittest
+
+import numpy as np
+
+from inference_backends import (TFLiteBackend, load_backend, quantize,
+                                dequantize)
+
+
+class FakeInterpreter:
+    """ Mimics a TFLite interpreter of a model with int8 input and output,
+    which outputs the mean of each input image.
+    """
+    def __init__(self):
+        self.shape = np.array([1, 4, 4, 3])
+        self.tensors = {}
+        self.allocations = 0
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': self.shape, 'dtype': np.int8,
+                 'quantization': (0.05, 3)}]
+
+    def get_output_details(self):
+        return [{'index': 1, 'shape': np.array([self.shape[0], 1]),
+                 'dtype': np.int8, 'quantization': (0.1, -2)}]
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = np.array(shape)
+
+    def allocate_tensors(self):
+        self.allocations += 1
+
+    def set_tensor(self, index, value):
+        assert value.dtype == np.int8
+        assert tuple(value.shape) == tuple(self.shape)
+        self.tensors[index] = value
+
+    def invoke(self):
+        real = (self.tensors[0].astype(np.float32) - 3) * 0.05
+        means = real.mean(axis=(1, 2, 3))[:, np.newaxis]
+        self.tensors[1] = quantize(means, np.int8, (0.1, -2))
+
+    def get_tensor(self, index):
+        return self.tensors[index]
+
+
+class QuantizationTest(unittest.TestCase):
+    def test_round_trip(self):
+        batch = np.linspace(-2, 2, 50, dtype=np.float32)
+        quantized = quantize(batch, np.int8, (0.05, 3))
+        self.assertEqual(np.int8, quantized.dtype)
+        np.testing.assert_allclose(batch, dequantize(quantized, (0.05, 3)),
+                                   atol=0.025 + 1e-6)
+
+    def test_saturates(self):
+        quantized = quantize(np.array([-100.0, 100.0]), np.int8, (0.1, 0))
+        self.assertEqual([-128, 127], quantized.tolist())
+
+    def test_float_is_passed_through(self):
+        batch = np.ones((2, 3), dtype=np.float32)
+        self.assertIs(batch, quantize(batch, np.float32, (0.0, 0)))
+        self.assertIs(batch, dequantize(batch, (0.0, 0)))
+
+
+class TFLiteBackendTest(unittest.TestCase):
+    def test_predict(self):
+        interpreters = []
+
+        def create_interpreter():
+            interpreters.append(FakeInterpreter())
+            return interpreters[-1]
+
+        backend = TFLiteBackend(create_interpreter)
+        self.assertEqual((4, 4, 3), backend.input_shape)
+        batch = np.zeros((5, 4, 4, 3), dtype=np.float32)
+        batch[1] = 1.0
+        batch[2] = -1.0
+
+        outputs = backend.predict(batch)
+        self.assertEqual(np.float32, outputs.dtype)
+        np.testing.assert_allclose([[0.0], [1.0], [-1.0], [0.0], [0.0]],
+                                   outputs, atol=0.1)
+
+        backend.predict(batch)
+        backend.predict(batch[:1])
+        self.assertEqual(2, len(interpreters))
+        self.assertEqual(1, interpreters[1].allocations)
+
+    def test_interpreters_are_shared_by_threads(self):
+        interpreters = []
+
+        def create_interpreter():
+            interpreters.append(FakeInterpreter())
+            return interpreters[-1]
+
+        backend = TFLiteBackend(create_interpreter)
+        batch = np.zeros((4, 4, 4, 3), dtype=np.float32)
+        backend.predict(batch)
+        thread = threading.Thread(target=backend.predict, args=(batch,))
+        thread.start()
+        thread.join()
+        self.assertEqual(2, len(interpreters))
+        self.assertEqual(1, interpreters[1].allocations)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_backend('trained_models/main', {'backend': 'onnx'})
@@ -0,0 +1,152 @@
+import threading
+import unittest
+
+import numpy as np
+
+from model_core import (BucketedModel, InferenceExecutor, ModelHead,
+                        batch_predict, train_and_save, KERAS_AVAILABLE)
+
+
+class RecordingModel:
+    """ Outputs the mean of each input image and records batch sizes.
+    """
+    input_shape = (2, 2, 3)
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch.mean(axis=(1, 2, 3))[:, np.newaxis]
+
+
+class SharedRecordingModel(RecordingModel):
+    """ Outputs a column per head: the mean and one minus the mean.
+    """
+    def predict(self, batch):
+        means = super().predict(batch)
+        return np.concatenate([means, 1 - means], axis=1)
+
+
+class BucketedModelTest(unittest.TestCase):
+    def test_warmup(self):
+        model = RecordingModel()
+        BucketedModel(model, buckets=(8, 1, 4)).warmup()
+        self.assertEqual([1, 4, 8], model.batch_sizes)
+
+    def test_warmup_buffers_are_shared_by_threads(self):
+        buffers = []
+
+        def predict(batch):
+            buffers.append(batch)
+            return batch[:, :1, 0, 0]
+
+        model = RecordingModel()
+        model.predict = predict
+        bucketed = BucketedModel(model, buckets=(4,))
+        bucketed.warmup()
+        thread = threading.Thread(
+            target=bucketed.predict,
+            args=(np.zeros((3, 2, 2, 3), dtype=np.float32),))
+        thread.start()
+        thread.join()
+        self.assertEqual(2, len(buffers))
+        self.assertIs(buffers[0], buffers[1])
+
+    def test_predict_pads_and_splits(self):
+        model = RecordingModel()
+        bucketed = BucketedModel(model, buckets=(1, 4, 8))
+        for size in (1, 3, 4, 19):
+            batch = np.arange(size, dtype=np.float32)[:, None, None, None]
+            batch = np.broadcast_to(batch, (size, 2, 2, 3)).copy()
+            outputs = bucketed.predict(batch)
+            self.assertEqual(list(range(size)), outputs[:, 0].tolist())
+
+        self.assertEqual([1, 4, 4, 8, 8, 4], model.batch_sizes)
+
+    def test_predict_resizes(self):
+        model = RecordingModel()
+        batch = np.full((3, 8, 8, 3), 0.5, dtype=np.float32)
+        outputs = BucketedModel(model, buckets=(4,)).predict(batch)
+        self.assertEqual([0.5] * 3, outputs[:, 0].tolist())
+
+
+class InferenceExecutorTest(unittest.TestCase):
+    def test_batch_predict(self):
+        executor = InferenceExecutor(workers=3, min_split=4)
+        parking_models = {'main': RecordingModel(),
+                          'behind_trees': RecordingModel()}
+        batch_input = {
+            'main': np.full((13, 2, 2, 3), 0.75, dtype=np.float32),
+            'behind_trees': np.full((2, 2, 2, 3), 0.25, dtype=np.float32)}
+        models_to_ids = {'main': [str(i) for i in range(13)],
+                         'behind_trees': ['13', '14']}
+
+        self.assertEqual(
+            batch_predict(batch_input, models_to_ids, parking_models),
+            batch_predict(batch_input, models_to_ids, parking_models,
+                          executor))
+        self.assertEqual([4, 4, 5, 13],
+                         sorted(parking_models['main'].batch_sizes))
+        self.assertEqual([2, 2], parking_models['behind_trees'].batch_sizes)
+
+
+class MeanCascade:
+    """ First stage deciding images with the mean outside of 0.3..0.7.
+    """
+    def split(self, batch):
+        probabilities = batch.mean(axis=(1, 2, 3))
+        return probabilities, (probabilities < 0.3) | (probabilities > 0.7)
+
+
+class CascadeTest(unittest.TestCase):
+    def test_batch_predict_skips_confident_slots(self):
+        parking_models = {'main': RecordingModel(),
+                          'behind_trees': RecordingModel()}
+        batch_input = {
+            'main': np.array([0.1, 0.5, 0.9, 0.6], dtype=np.float32)[
+                :, None, None, None] * np.ones((1, 2, 2, 3), np.float32),
+            'behind_trees': np.full((2, 2, 2, 3), 0.95, dtype=np.float32)}
+        models_to_ids = {'main': ['0', '1', '2', '3'],
+                         'behind_trees': ['4', '5']}
+
+        res = batch_predict(batch_input, models_to_ids, parking_models,
+                            cascades={'main': MeanCascade(),
+                                      'behind_trees': MeanCascade()})
+
+        self.assertEqual([2], parking_models['main'].batch_sizes)
+        self.assertEqual([], parking_models['behind_trees'].batch_sizes)
+        self.assertEqual(['0', '1', '2', '3', '4', '5'], sorted(res))
+        self.assertEqual(0, res['0'][0])
+        self.assertEqual(1, res['2'][0])
+        self.assertEqual(1, res['4'][0])
+        self.assertEqual(0, res['1'][0])
+        self.assertEqual(1, res['3'][0])
+        self.assertAlmostEqual(0.5, float(res['1'][1]))
+        self.assertAlmostEqual(0.6, float(res['3'][1]), places=6)
+
+
+class ModelHeadTest(unittest.TestCase):
+    def test_batch_predict_runs_shared_model_once(self):
+        shared = SharedRecordingModel()
+        parking_models = {'main': ModelHead(shared, 0),
+                          'behind_trees': ModelHead(shared, 1)}
+        batch_input = {
+            'main': np.full((3, 2, 2, 3), 0.75, dtype=np.float32),
+            'behind_trees': np.full((2, 2, 2, 3), 0.75, dtype=np.float32)}
+        models_to_ids = {'main': ['0', '1', '2'], 'behind_trees': ['3', '4']}
+
+        res = batch_predict(batch_input, models_to_ids, parking_models)
+        self.assertEqual([5], shared.batch_sizes)
+        self.assertEqual((1, '0.75'), res['2'])
+        self.assertEqual((0, '0.25'), res['3'])
+
+
+class KerasImportTest(unittest.TestCase):
+    @unittest.skipIf(KERAS_AVAILABLE, 'Keras is installed')
+    def test_training_reports_import_error(self):
+        with self.assertRaises(ImportError) as context:
+            train_and_save('training', 'validation', 'model')
+        self.assertIn('Keras', str(context.exception))
+        self.assertIsInstance(context.exception.__cause__, ImportError)
+
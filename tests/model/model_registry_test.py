@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cascade import Cascade, CASCADE_FILE
+from model_core import save_heads
+from model_registry import ModelRegistry
+
+
+class FakeBackend:
+    loads = []
+    input_shape = (2, 2, 3)
+
+    def __init__(self, model_path, content):
+        self.model_path = model_path
+        self.content = content
+
+    @staticmethod
+    def configure(**_options):
+        pass
+
+    @staticmethod
+    def model_files(model_path, **_options):
+        return [os.path.join(model_path, 'model.bin')]
+
+    @classmethod
+    def load(cls, model_path, **_options):
+        cls.loads.append(os.path.basename(model_path))
+        with open(os.path.join(model_path, 'model.bin')) as f_model:
+            return cls(model_path, f_model.read())
+
+    def predict(self, batch):
+        return np.zeros((len(batch), 1), dtype=np.float32)
+
+
+class ModelRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.models_path = tempfile.mkdtemp()
+        for name in ('main', 'behind_trees', 'unused'):
+            os.makedirs(os.path.join(self.models_path, name))
+            self.write_model(name, name)
+        FakeBackend.loads = []
+        self.registry = ModelRegistry(self.models_path)
+        self.registry.backend = FakeBackend
+
+    def tearDown(self):
+        self.registry.wait()
+        shutil.rmtree(self.models_path)
+
+    def write_model(self, name, content, mtime=None):
+        path = os.path.join(self.models_path, name, 'model.bin')
+        with open(path, 'w') as f_model:
+            f_model.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def refresh(self, model_names):
+        self.registry.refresh(model_names)
+        self.registry.wait()
+
+    def test_loads_only_used_models(self):
+        self.refresh(['main', 'behind_trees'])
+        self.assertEqual({'main', 'behind_trees'}, set(self.registry.models))
+        self.assertEqual(['behind_trees', 'main'], sorted(FakeBackend.loads))
+
+        self.refresh(['main'])
+        self.assertEqual({'main'}, set(self.registry.models))
+        self.assertEqual(2, len(FakeBackend.loads))
+
+    def test_reloads_only_changed_models(self):
+        self.refresh(['main', 'behind_trees'])
+        models = self.registry.models
+        main = models['main']
+
+        self.write_model('main', 'main', mtime=1000)
+        self.refresh(['main', 'behind_trees'])
+        self.assertIs(models, self.registry.models)
+
+        self.write_model('behind_trees', 'behind_trees v2', mtime=2000)
+        self.refresh(['main', 'behind_trees'])
+        self.assertIsNot(models, self.registry.models)
+        self.assertIs(main, self.registry.models['main'])
+        self.assertEqual('behind_trees v2',
+                         self.registry.models['behind_trees'].model.content)
+        self.assertEqual(3, len(FakeBackend.loads))
+
+    def test_keeps_old_model_if_reloading_fails(self):
+        self.refresh(['main'])
+        main = self.registry.models['main']
+
+        os.remove(os.path.join(self.models_path, 'main', 'model.bin'))
+        self.refresh(['main'])
+        self.assertIs(main, self.registry.models['main'])
+
+    def write_cascade(self, name, low, mtime):
+        path = os.path.join(self.models_path, name, CASCADE_FILE)
+        Cascade(np.zeros(17), 0, np.zeros(17), np.ones(17), low).save(path)
+        os.utime(path, (mtime, mtime))
+
+    def test_reloads_cascades_with_models(self):
+        self.registry = ModelRegistry(self.models_path, None,
+                                      {'enabled': True})
+        self.registry.backend = FakeBackend
+        self.write_cascade('main', 0.1, 1000)
+        self.refresh(['main', 'behind_trees'])
+        self.assertEqual(['main'], list(self.registry.cascades))
+        main = self.registry.cascades['main']
+
+        self.refresh(['main', 'behind_trees'])
+        self.assertIs(main, self.registry.cascades['main'])
+
+        # Retrained and new cascades are loaded with their models
+        self.write_cascade('main', 0.2, 2000)
+        self.write_cascade('behind_trees', 0.3, 2000)
+        self.refresh(['main', 'behind_trees'])
+        self.assertEqual(4, len(FakeBackend.loads))
+        self.assertEqual(0.2, self.registry.cascades['main'].low)
+        self.assertEqual(0.3, self.registry.cascades['behind_trees'].low)
+
+        self.refresh(['main'])
+        self.assertEqual(['main'], list(self.registry.cascades))
+
+    def test_shared_model(self):
+        os.makedirs(os.path.join(self.models_path, 'shared'))
+        self.write_model('shared', 'shared')
+        save_heads(os.path.join(self.models_path, 'shared'),
+                   ['main', 'behind_trees'])
+        self.write_cascade('main', 0.1, 1000)
+        registry = ModelRegistry(self.models_path, {'shared_model': 'shared'},
+                                 {'enabled': True})
+        registry.backend = FakeBackend
+
+        registry.refresh(['behind_trees', 'main'])
+        registry.wait()
+        self.assertEqual(['shared'], FakeBackend.loads)
+        self.assertEqual(['main'], list(registry.cascades))
+        self.assertIs(registry.models['main'].shared,
+                      registry.models['behind_trees'].shared)
+        self.assertEqual(1, registry.models['behind_trees'].index)
+
+        # Editing heads reloads the shared model
+        save_heads(os.path.join(self.models_path, 'shared'),
+                   ['behind_trees', 'main'])
+        os.utime(os.path.join(self.models_path, 'shared', 'heads.json'),
+                 (1000, 1000))
+        registry.refresh(['behind_trees', 'main'])
+        registry.wait()
+        self.assertEqual(['shared', 'shared'], FakeBackend.loads)
+        self.assertEqual(0, registry.models['behind_trees'].index)
+
+        with self.assertRaises(ValueError):
+            registry.refresh(['main', 'entrance'])
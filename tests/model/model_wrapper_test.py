@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from crop_helpers import SlotBatch, collect_input
+from model_wrapper import ModelService
+from parking_map import load_parking_map
+from utils.frame_ring import FrameRing
+
+from crop_helpers_test import CONF_PATH, synthetic_frame
+
+
+class RingFrameTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        config_folder = os.path.join(self.tmp_dir.name, 'configs')
+        os.makedirs(config_folder)
+        shutil.copy(CONF_PATH, config_folder)
+        self.images_folder = os.path.join(self.tmp_dir.name, 'images')
+        os.makedirs(self.images_folder)
+        patchers = [
+            mock.patch.dict(os.environ, {
+                'MODELS_PATH': self.tmp_dir.name,
+                'SOURCE_IMG_FOLDER': self.images_folder,
+                'CAMERA_IMG_CONFIG_FOLDER': config_folder}),
+            mock.patch('model_wrapper.ModelRegistry'),
+            mock.patch('model_wrapper.MqttPublisher')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = ModelService({
+            'frame_source': 'ring', 'camera_img_config_refresh_duration': 60})
+
+    def tearDown(self):
+        if self.service.frame_ring is not None:
+            self.service.frame_ring.close()
+        self.tmp_dir.cleanup()
+
+    def write_ring(self, frame):
+        height, width = frame.shape[:2]
+        ring = FrameRing.create(
+            os.path.join(self.images_folder, 'frame_ring.bin'), width,
+            height, 2)
+        ring.write(frame.tobytes(), 100.0)
+        ring.close()
+
+    def test_prepare_downscaled_ring_frame(self):
+        img = synthetic_frame()
+        self.write_ring(cv2.resize(img, (1920, 1080),
+                                   interpolation=cv2.INTER_AREA))
+        self.assertTrue(self.service.refresh())
+
+        frame = self.service.find_ring_frame()
+        self.assertEqual(2, self.service.setup.decode_scale)
+        self.service.prepare(frame)
+
+        parking_map = load_parking_map(CONF_PATH)
+        expected = collect_input(img, SlotBatch(parking_map))
+        inputs = frame.slot_batch.inputs
+        for model_name, tensor in expected.items():
+            self.assertLess(np.abs(tensor - inputs[model_name]).mean(), 0.05)
+
+    def test_reject_ring_of_other_aspect_ratio(self):
+        self.write_ring(np.zeros((1200, 1920, 3), dtype=np.uint8))
+        self.assertTrue(self.service.refresh())
+        self.assertIsNone(self.service.find_ring_frame())
+        self.assertIsNone(self.service.find_ring_frame())
+        self.assertIsNone(self.service.setup.frame_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from parking_map import ParkingMap, load_parking_map
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, os.pardir, 'sloth', 'pklot_config.json')
+
+
+def sloth_conf(polygons):
+    return [{'annotations': [
+        {'class': 'polygon', 'id': slot_id, 'model': model,
+         'xn': ';'.join(str(x) for x, _ in points),
+         'yn': ';'.join(str(y) for _, y in points)}
+        for slot_id, model, points in polygons]}]
+
+
+class ParkingMapTest(unittest.TestCase):
+    def test_from_conf(self):
+        conf = sloth_conf([
+            ('1', 'main', [(10, 10), (60, 10), (60, 110), (10, 110)]),
+            ('2', 'behind_trees', [(70, 10), (180, 10), (180, 50), (70, 50)]),
+            ('3', 'main', [(10, 120), (60, 120), (60, 200), (10, 200)])])
+        parking_map = ParkingMap.from_conf(conf)
+
+        self.assertEqual(['1', '2', '3'], parking_map.slot_ids)
+        self.assertEqual({'main': ['1', '3'], 'behind_trees': ['2']},
+                         parking_map.models_to_ids)
+        self.assertEqual([0, 2],
+                         parking_map.models_to_indices['main'].tolist())
+        self.assertEqual([50, 100], parking_map.sizes[0].tolist())
+        self.assertEqual([110, 40], parking_map.sizes[1].tolist())
+
+        corners = cv2.perspectiveTransform(parking_map.points[:1],
+                                           parking_map.matrices[0])
+        np.testing.assert_allclose([[0, 0], [49, 0], [49, 99], [0, 99]],
+                                   corners[0], atol=1e-3)
+
+    def test_priorities(self):
+        conf = sloth_conf([
+            ('1', 'main', [(10, 10), (60, 10), (60, 110), (10, 110)]),
+            ('2', 'main', [(70, 10), (180, 10), (180, 50), (70, 50)])])
+        conf[0]['annotations'][1]['priority'] = 2
+        parking_map = ParkingMap.from_conf(conf)
+        self.assertEqual([1, 2], parking_map.priorities.tolist())
+        self.assertEqual([1, 2], parking_map.scaled(2).priorities.tolist())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'pklot_config.npz')
+            parking_map.save(path)
+            self.assertEqual([1, 2],
+                             load_parking_map(path).priorities.tolist())
+
+        conf[0]['annotations'][1]['priority'] = 0
+        with self.assertRaises(ValueError):
+            ParkingMap.from_conf(conf)
+
+    def test_invalid_conf(self):
+        with self.assertRaises(ValueError):
+            ParkingMap.from_conf(sloth_conf([
+                ('1', 'main', [(0, 0), (1, 0), (1, 1), (0, 1)]),
+                ('1', 'main', [(0, 0), (1, 0), (1, 1), (0, 1)])]))
+
+        with self.assertRaises(ValueError):
+            ParkingMap.from_conf(sloth_conf([
+                ('1', 'main', [(0, 0), (1, 0), (1, 1)])]))
+
+    def test_save_and_load(self):
+        parking_map = load_parking_map(CONF_PATH)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'pklot_config.npz')
+            parking_map.save(path)
+            loaded = load_parking_map(path)
+
+        self.assertEqual(parking_map.slot_ids, loaded.slot_ids)
+        self.assertEqual(parking_map.models, loaded.models)
+        np.testing.assert_array_equal(parking_map.matrices, loaded.matrices)
+        np.testing.assert_array_equal(parking_map.sizes, loaded.sizes)
+
+
+class ScaledParkingMapTest(unittest.TestCase):
+    def test_decode_scale(self):
+        parking_map = ParkingMap.from_conf(sloth_conf([
+            ('1', 'main', [(0, 0), (600, 0), (600, 300), (0, 300)]),
+            ('2', 'main', [(0, 400), (1000, 400), (1000, 1000), (0, 1000)])]))
+        self.assertEqual(2, parking_map.decode_scale(128))
+        self.assertEqual(4, parking_map.decode_scale(64))
+        self.assertEqual(8, parking_map.decode_scale(16))
+        self.assertEqual(1, parking_map.decode_scale(400))
+
+    def test_scaled_transforms(self):
+        parking_map = load_parking_map(CONF_PATH)
+        scaled = parking_map.scaled(4)
+        self.assertIs(scaled, parking_map.scaled(4))
+        np.testing.assert_array_equal(parking_map.sizes, scaled.sizes)
+
+        corners = cv2.perspectiveTransform(
+            scaled.points.astype(np.float64), scaled.matrices[0])
+        expected = cv2.perspectiveTransform(
+            parking_map.points.astype(np.float64), parking_map.matrices[0])
+        np.testing.assert_allclose(expected, corners, atol=1e-3)
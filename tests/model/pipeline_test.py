@@ -0,0 +1,119 @@
+import threading
+import unittest
+
+from frame_watcher import PollingWatcher
+from pipeline import LatestSlot, run_pipeline
+
+
+class LatestSlotTest(unittest.TestCase):
+    def test_keeps_newest(self):
+        dropped = []
+        slot = LatestSlot(on_drop=dropped.append)
+        slot.put('frame 1', 1)
+        slot.put('frame 2', 2)
+        self.assertEqual('frame 2', slot.get(timeout=0))
+        self.assertIsNone(slot.get(timeout=0))
+
+        slot.put('frame 0', 0)
+        self.assertIsNone(slot.get(timeout=0))
+        self.assertEqual(['frame 1', 'frame 0'], dropped)
+        self.assertEqual(2, slot.dropped)
+
+    def test_get_waits_for_item(self):
+        slot = LatestSlot()
+        threading.Timer(0.05, slot.put, args=('frame 1', 1)).start()
+        self.assertEqual('frame 1', slot.get(timeout=5))
+
+
+class Frame:
+    def __init__(self, number, setup):
+        self.modified = number
+        self.path = 'out_{}.jpg'.format(number)
+        self.setup = setup
+
+
+class StopPipeline(Exception):
+    pass
+
+
+class FakeService:
+    """ Produces frames 1..frames_count and stops the pipeline after
+    classifying the last one.
+    """
+    def __init__(self, frames_count):
+        self.frames_count = frames_count
+        self.setup = object()
+        self.found = 0
+        self.classified = []
+        self.dropped = []
+        self.published = []
+
+    def refresh(self):
+        return True
+
+    def create_watcher(self, delay, stop=None):
+        return PollingWatcher(delay, stop)
+
+    def find_frame(self, newest=None):
+        if self.found == self.frames_count:
+            return None
+        self.found += 1
+        return Frame(self.found, self.setup)
+
+    def prepare(self, frame):
+        pass
+
+    def classify(self, frame):
+        self.classified.append(frame.modified)
+        if frame.modified == self.frames_count:
+            raise StopPipeline
+        return {}
+
+    def drop(self, frame):
+        self.dropped.append(frame.modified)
+
+    def release(self, frame):
+        pass
+
+    def build_response(self, frame, pklot_map):
+        return {'metadata': {'source_file': frame.path}}
+
+    def publish(self, json_response):
+        self.published.append(json_response['metadata']['source_file'])
+
+
+class RunPipelineTest(unittest.TestCase):
+    def test_frames_are_classified_in_order(self):
+        service = FakeService(20)
+        with self.assertRaises(StopPipeline):
+            run_pipeline(service, {'decode_workers': 3}, 0.01)
+
+        self.assertEqual(20, service.classified[-1])
+        self.assertEqual(sorted(service.classified), service.classified)
+
+    def test_failed_frames_are_dropped(self):
+        service = FakeService(5)
+        find_frame = service.find_frame
+        # The next frame is found once the previous one is being prepared,
+        # so no frame is skipped before preparation
+        prepared = threading.Event()
+        prepared.set()
+
+        def find_next_frame(newest=None):
+            if not prepared.is_set():
+                return None
+            prepared.clear()
+            return find_frame(newest)
+
+        def prepare(frame):
+            prepared.set()
+            if frame.modified == 2:
+                raise ValueError('corrupted frame')
+
+        service.find_frame = find_next_frame
+        service.prepare = prepare
+        with self.assertRaises(StopPipeline):
+            run_pipeline(service, {'decode_workers': 1}, 0.01)
+
+        self.assertIn(2, service.dropped)
+        self.assertNotIn(2, service.classified)
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from model_core import batch_predict
+from parking_map import ParkingMap
+from refresh_scheduler import RefreshScheduler
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+
+
+class MeanModel:
+    """ Outputs the mean of each input image as the occupied probability.
+    """
+    def predict(self, batch):
+        return batch.mean(axis=(1, 2, 3))[:, np.newaxis]
+
+
+def parking_map(priorities=None):
+    return ParkingMap(['1', '2', '3', '4'], ['main', 'other', 'main', 'other'],
+                      [SQUARE] * 4, priorities=priorities)
+
+
+class RefreshSchedulerTest(unittest.TestCase):
+    def test_intervals(self):
+        # Batch order: slots 1, 3 (main), then 2, 4 (other)
+        scheduler = RefreshScheduler(parking_map([1, 2, 1, 1]), 10, 1, 30,
+                                     None, reservation_intervals={'3': 20})
+        np.testing.assert_allclose([10, 20, 5, 10], scheduler.intervals)
+
+        scheduler.volatility[0] = 1
+        scheduler.volatility[1] = 0.5
+        np.testing.assert_allclose([1, 10.5, 5, 10], scheduler.intervals)
+
+    def test_select_due_slots_within_budget(self):
+        scheduler = RefreshScheduler(parking_map(), 10, 1, 30, 3)
+        self.assertEqual([True, True, True, False],
+                         scheduler.select(0).tolist())
+        self.assertEqual([False, False, False, True],
+                         scheduler.select(1).tolist())
+        self.assertFalse(scheduler.select(5).any())
+
+        urgent = np.array([False, False, False, True])
+        self.assertEqual([False, False, False, True],
+                         scheduler.select(6, urgent).tolist())
+
+        # The most overdue slots go first
+        self.assertEqual([True, True, True, False],
+                         scheduler.select(15).tolist())
+
+        scheduler.invalidate(np.array([False, True, False, False]))
+        self.assertEqual([False, True, False, False],
+                         scheduler.select(15.5).tolist())
+
+    def test_update_and_ages(self):
+        scheduler = RefreshScheduler(parking_map(), 10, 1, 30, None,
+                                     volatility_decay=0.5)
+        rows = scheduler.select(0)
+        scheduler.update(rows, {'1': (0, '0.1'), '2': (1, '0.9'),
+                                '3': (0, '0.2'), '4': (0, '0.3')})
+        scheduler.update(rows, {'1': (1, '0.8'), '2': (1, '0.9'),
+                                '3': (0, '0.2'), '4': (0, '0.3')})
+        np.testing.assert_allclose([0.5, 0, 0, 0], scheduler.volatility)
+
+        scheduler.invalidate(np.array([False, False, True, False]))
+        self.assertEqual({'1': 2.5, '3': 2.5, '2': None, '4': 2.5},
+                         scheduler.ages(2.5))
+
+    def test_update_with_batch_predict(self):
+        scheduler = RefreshScheduler(parking_map(), 10, 1, 30, None,
+                                     volatility_decay=0.5)
+        parking_models = {'main': MeanModel(), 'other': MeanModel()}
+        models_to_ids = {'main': ['1', '3'], 'other': ['2', '4']}
+        rows = scheduler.select(0)
+        for main_probability in (0.2, 0.8):
+            batch_input = {
+                'main': np.full((2, 2, 2, 3), main_probability, np.float32),
+                'other': np.full((2, 2, 2, 3), 0.3, np.float32)}
+            scheduler.update(rows, batch_predict(batch_input, models_to_ids,
+                                                 parking_models))
+
+        # Batch order: slots 1, 3 (main), then 2, 4 (other)
+        np.testing.assert_allclose([0.5, 0.5, 0, 0], scheduler.volatility)
+
+    def test_from_options(self):
+        self.assertIsNone(RefreshScheduler.from_options(parking_map(), {}))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'reservation.json')
+            with open(path, 'w') as f_out:
+                json.dump({'1': 3, '2': 4}, f_out)
+            scheduler = RefreshScheduler.from_options(parking_map(), {
+                'enabled': True, 'reservations_file': path,
+                'reservation_intervals': {'3': 40}})
+
+        np.testing.assert_allclose([40, 10, 10, 10], scheduler.intervals)
+
+
+if __name__ == '__main__':
+    unittest.main()
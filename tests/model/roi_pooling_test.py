@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from crop_helpers import collect_frame_input
+from logistic import train_logistic
+from parking_map import ParkingMap, grid_points
+from roi_pooling import RoiHead, RoiPoolingModel, roi_align
+
+POINTS = [[(10, 10), (60, 10), (60, 110), (10, 110)],
+          [(200, 20), (260, 30), (255, 150), (195, 140)]]
+
+
+class StrideModel:
+    """ Fully convolutional stand-in: averages cells of the first channel.
+    """
+    def __init__(self, stride):
+        self.stride = stride
+
+    def predict(self, batch):
+        num, height, width, _ = batch.shape
+        size = self.stride
+        cells = batch[:, :height // size * size, :width // size * size, :1]
+        return cells.reshape(num, height // size, size, width // size, size,
+                             1).mean(axis=(2, 4))
+
+
+class RoiAlignTest(unittest.TestCase):
+    def test_bilinear_sampling(self):
+        y, x = np.mgrid[0:5, 0:6].astype(np.float32)
+        features = np.stack([x, y], axis=-1)
+        points = np.array([[1.5, 1.5], [9.5, 5.5], [-10, 100]],
+                          dtype=np.float32)
+        sampled = roi_align(features, points, stride=4)
+        # Feature cell centers are at image pixels 1.5, 5.5, 9.5, ...
+        np.testing.assert_allclose([[0, 0], [2, 1], [0, 4]], sampled,
+                                   atol=1e-6)
+
+    def test_roi_points_follow_slot_geometry(self):
+        parking_map = ParkingMap(['1', '2'], ['main', 'main'], POINTS)
+        points = parking_map.roi_points((3, 2))
+        self.assertEqual((2, 2, 3, 2), points.shape)
+        for index, slot_points in enumerate(points):
+            warped = cv2.perspectiveTransform(slot_points.reshape(1, -1, 2),
+                                              parking_map.matrices[index])
+            width, height = parking_map.sizes[index]
+            np.testing.assert_allclose(
+                grid_points(width, height, (3, 2)).reshape(1, -1, 2),
+                warped, atol=1e-3)
+
+
+class RoiModelTest(unittest.TestCase):
+    def test_train_head(self):
+        rng = np.random.RandomState(0)
+        labels = rng.randint(0, 2, 200)
+        pooled = rng.rand(200, 2, 2, 4).astype(np.float32)
+        pooled[:, :, :, 0] += 3 * labels[:, np.newaxis, np.newaxis]
+        head = RoiHead(*train_logistic(pooled, labels))
+        states = head.predict(pooled)[:, 0] > 0.5
+        self.assertGreater(np.mean(states == labels), 0.95)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'roi_head.npz')
+            head.save(path)
+            loaded = RoiHead.load(path)
+        self.assertEqual(head.grid, loaded.grid)
+        np.testing.assert_array_equal(head.predict(pooled),
+                                      loaded.predict(pooled))
+
+    def test_predict_frame(self):
+        parking_map = ParkingMap(['1', '2'], ['main', 'main'], POINTS)
+        img = np.zeros((240, 400, 3), dtype=np.uint8)
+        cv2.fillConvexPoly(img, np.array(POINTS[1], dtype=np.int32),
+                           (255, 255, 255))
+        model = RoiPoolingModel(StrideModel(8),
+                                RoiHead(np.full(4, 10.0), -5, (2, 2), 8))
+        for scale in (1.0, 0.5):
+            image, points = collect_frame_input(img, parking_map, (2, 2),
+                                                scale)
+            self.assertTrue((points >= 0).all())
+            self.assertTrue((points[..., 0] < image.shape[1]).all())
+            self.assertTrue((points[..., 1] < image.shape[0]).all())
+            probabilities = model.predict(image, points)
+            self.assertEqual((2, 1), probabilities.shape)
+            self.assertLess(probabilities[0, 0], 0.5)
+            self.assertGreater(probabilities[1, 0], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from utils.frame_ring import FrameRing, write_png
+
+
+class FrameRingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'frame_ring.bin')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read(self):
+        ring = FrameRing.create(self.path, 4, 2, 3)
+        self.assertEqual(0, ring.latest)
+        self.assertIsNone(ring.read_latest())
+
+        frames = [bytes(bytearray([index] * ring.frame_size))
+                  for index in range(5)]
+        for index, frame in enumerate(frames):
+            self.assertEqual(index + 1, ring.write(frame, 100.0 + index))
+
+        reader = FrameRing.open(self.path)
+        self.assertEqual((4, 2, 3), (reader.width, reader.height,
+                                     reader.slots))
+        self.assertEqual(5, reader.latest)
+        self.assertEqual((5, frames[4], 104.0), reader.read_latest())
+        self.assertEqual((frames[2], 102.0), reader.read(3))
+        # Overwritten and not written yet
+        self.assertIsNone(reader.read(2))
+        self.assertIsNone(reader.read(6))
+        reader.close()
+        ring.close()
+
+    def test_replaced(self):
+        ring = FrameRing.create(self.path, 2, 2, 2)
+        reader = FrameRing.open(self.path)
+        self.assertFalse(reader.replaced())
+        FrameRing.create(self.path, 2, 2, 2).close()
+        self.assertTrue(reader.replaced())
+        reader.close()
+        ring.close()
+
+    def test_too_many_slots(self):
+        with self.assertRaises(ValueError):
+            FrameRing.create(self.path, 2, 2, 1000)
+
+    def test_write_png(self):
+        frame = np.random.RandomState(0).randint(0, 256, (3, 5, 3)).astype(
+            np.uint8)
+        path = os.path.join(self.tmp_dir.name, 'frame.png')
+        write_png(path, frame.tobytes(), 5, 3)
+        np.testing.assert_array_equal(frame, cv2.imread(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
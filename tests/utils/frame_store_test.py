@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from utils.frame_store import FrameStore
+
+
+class FrameStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'frames')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_publish(self):
+        store = FrameStore.create(self.path, 3)
+        reader = FrameStore(self.path)
+        self.assertIsNone(reader.latest())
+
+        for index in range(5):
+            self.assertEqual((index + 1, '{:010d}.jpg'.format(index + 1)),
+                             store.publish(b'frame' + bytes([index]), 'jpg',
+                                           100.5 + index))
+
+        sequence, name, timestamp = reader.latest()
+        self.assertEqual((5, '0000000005.jpg', 104.5),
+                         (sequence, name, timestamp))
+        with open(reader.frame_path(name), 'rb') as f_frame:
+            self.assertEqual(b'frame\x04', f_frame.read())
+        # Only the last 3 frames and the pointer are kept
+        self.assertEqual(['0000000003.jpg', '0000000004.jpg',
+                          '0000000005.jpg', 'latest'],
+                         sorted(os.listdir(self.path)))
+
+    def test_sequence_continues(self):
+        store = FrameStore.create(self.path, 4)
+        for _ in range(3):
+            store.publish(b'frame', 'jpg', 0.0)
+        with open(os.path.join(self.path, '.tmp_0000000004.jpg'), 'wb'):
+            pass
+
+        store = FrameStore.create(self.path, 2)
+        self.assertEqual((4, '0000000004.jpg'),
+                         store.publish(b'frame', 'jpg', 0.0))
+        self.assertEqual(['0000000003.jpg', '0000000004.jpg', 'latest'],
+                         sorted(os.listdir(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+""" Ring buffer of raw video frames in a shared memory mapped file.
+
+The video stream processor writes decoded frames (BGR, 8 bits per channel)
+into a fixed number of slots, the model reads the latest one and the
+history manager reads the frames it archives, all without encoding frames
+to image files and decoding them back.  Put the file on tmpfs (e.g.
+/dev/shm) to keep it in memory.
+
+Layout: file header, a header per slot, then frame slots.  Frames are
+numbered with sequence numbers starting from 1, frame N goes to slot
+N % slots.  The slot sequence number is cleared while the frame is written
+and set after, so readers detect frames overwritten while they copy them.
+
+Works with Python 2 (video stream processor) and has no dependencies.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b'SPFR'
+# magic, width, height, slots, latest sequence
+HEADER = struct.Struct('<4sIIIQ')
+# sequence, timestamp
+SLOT_HEADER = struct.Struct('<Qd')
+LATEST_OFFSET = 16
+DATA_OFFSET = 4096
+
+
+class FrameRing(object):
+    """ Memory mapped ring of raw frames.
+    """
+    def __init__(self, path, mapping, width, height, slots):
+        """ Use `create` or `open` instead.
+        """
+        self.path = path
+        self.mapping = mapping
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.frame_size = width * height * 3
+        self.inode = os.stat(path).st_ino
+
+    @classmethod
+    def create(cls, path, width, height, slots):
+        """ Create a new ring, replacing the existing file if any.
+
+        :param path: path to the ring file
+        :param width: frame width in pixels
+        :param height: frame height in pixels
+        :param slots: number of frames the ring keeps
+        :return: FrameRing object
+        :raise ValueError: in case there are too many slots
+        """
+        if HEADER.size + slots * SLOT_HEADER.size > DATA_OFFSET:
+            raise ValueError('A frame ring can have at most {} slots'.format(
+                (DATA_OFFSET - HEADER.size) // SLOT_HEADER.size))
+
+        size = DATA_OFFSET + slots * width * height * 3
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f_out:
+            f_out.truncate(size)
+            f_out.write(HEADER.pack(MAGIC, width, height, slots, 0))
+        # Readers keep using the old file until they notice the new one
+        os.rename(tmp_path, path)
+        with open(path, 'r+b') as f_ring:
+            mapping = mmap.mmap(f_ring.fileno(), size)
+        return cls(path, mapping, width, height, slots)
+
+    @classmethod
+    def open(cls, path):
+        """ Open an existing ring.
+
+        :param path: path to the ring file
+        :return: FrameRing object
+        :raise ValueError: in case the file is not a frame ring
+        """
+        with open(path, 'r+b') as f_ring:
+            mapping = mmap.mmap(f_ring.fileno(), 0)
+        magic, width, height, slots, _ = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC:
+            mapping.close()
+            raise ValueError('{} is not a frame ring'.format(path))
+        return cls(path, mapping, width, height, slots)
+
+    def close(self):
+        """ Unmap the file.
+        """
+        self.mapping.close()
+
+    def replaced(self):
+        """ Check whether the ring file was recreated (e.g. by a restarted
+        writer) since it was opened.
+
+        :return: True if the ring should be opened again
+        """
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    @property
+    def latest(self):
+        """ Sequence number of the latest frame, 0 if there are no frames.
+        """
+        return struct.unpack_from('<Q', self.mapping, LATEST_OFFSET)[0]
+
+    def write(self, frame, timestamp):
+        """ Write the next frame.
+
+        :param frame: bytes of the BGR frame, width * height * 3 bytes
+        :param timestamp: capture time of the frame, in seconds
+        :return: sequence number of the frame
+        """
+        sequence = self.latest + 1
+        slot = sequence % self.slots
+        header_offset = HEADER.size + slot * SLOT_HEADER.size
+        SLOT_HEADER.pack_into(self.mapping, header_offset, 0, 0.0)
+        offset = DATA_OFFSET + slot * self.frame_size
+        self.mapping[offset:offset + self.frame_size] = frame
+        SLOT_HEADER.pack_into(self.mapping, header_offset, sequence,
+                              timestamp)
+        struct.pack_into('<Q', self.mapping, LATEST_OFFSET, sequence)
+        return sequence
+
+    def read(self, sequence):
+        """ Read a frame if it is still in the ring.
+
+        :param sequence: sequence number of the frame
+        :return: (bytes of the BGR frame, timestamp) or None if the frame
+                 was overwritten or not written yet
+        """
+        if sequence <= 0:
+            return None
+
+        slot = sequence % self.slots
+        header_offset = HEADER.size + slot * SLOT_HEADER.size
+        slot_sequence, timestamp = SLOT_HEADER.unpack_from(self.mapping,
+                                                           header_offset)
+        if slot_sequence != sequence:
+            return None
+
+        offset = DATA_OFFSET + slot * self.frame_size
+        frame = self.mapping[offset:offset + self.frame_size]
+        if SLOT_HEADER.unpack_from(self.mapping,
+                                   header_offset)[0] != sequence:
+            return None
+        return frame, timestamp
+
+    def read_latest(self, attempts=3):
+        """ Read the latest frame.
+
+        :param attempts: how many times to try if the frame is overwritten
+                         while it is copied
+        :return: (sequence number, bytes of the BGR frame, timestamp)
+                 or None if there are no frames
+        """
+        for _ in range(attempts):
+            sequence = self.latest
+            if not sequence:
+                return None
+
+            frame = self.read(sequence)
+            if frame is not None:
+                return (sequence,) + frame
+        return None
+
+
+def write_png(path, frame, width, height):
+    """ Save a raw frame as a PNG file, without image libraries.
+
+    Compression is fast rather than strong, frames are saved rarely
+    (only the archived ones).
+
+    :param path: path to the output file
+    :param frame: bytes of the BGR frame
+    :param width: frame width in pixels
+    :param height: frame height in pixels
+    """
+    rgb = bytearray(frame)
+    rgb[0::3], rgb[2::3] = frame[2::3], frame[0::3]
+    stride = width * 3
+    # Each row starts with a filter type byte, 0 is no filter
+    rows = b''.join(b'\x00' + bytes(rgb[row * stride:(row + 1) * stride])
+                    for row in range(height))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    with open(path, 'wb') as f_out:
+        f_out.write(b'\x89PNG\r\n\x1a\n')
+        f_out.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                               8, 2, 0, 0, 0)))
+        f_out.write(chunk(b'IDAT', zlib.compress(rows, 1)))
+        f_out.write(chunk(b'IEND', b''))
@@ -0,0 +1,112 @@
+""" Store of encoded frames with a "latest frame" pointer.
+
+The video stream processor publishes image files into a folder of the
+shared images folder (put it on tmpfs to keep frames in memory), the model
+finds the newest one and the history manager archives some of them.
+
+Frames are numbered with sequence numbers and saved as <sequence>.<format>.
+A frame is written to a temporary file and renamed into place, so readers
+never see a partially written image, then the "latest" pointer file is
+replaced the same way.  Finding the newest frame is a read of the pointer,
+whatever the number of frames is.  Only the last `slots` frames are kept,
+publishing a frame removes the one which falls out of the ring.
+
+Works with Python 2 (video stream processor) and has no dependencies.
+"""
+import os
+
+LATEST_FILE = 'latest'
+TMP_PREFIX = '.tmp_'
+
+
+class FrameStore(object):
+    """ Folder of the last frames.
+    """
+    def __init__(self, path, slots=None):
+        """
+        :param path: path to the store folder
+        :param slots: number of frames to keep, needed only to publish frames
+        """
+        self.path = path
+        self.slots = slots
+        self.sequence = 0
+
+    @classmethod
+    def create(cls, path, slots):
+        """ Prepare a store to publish frames into, creating the folder if
+        needed.  Sequence numbers continue from frames of a previous run,
+        frames which do not fit into the ring are removed.
+
+        :param path: path to the store folder
+        :param slots: number of frames to keep
+        :return: FrameStore object
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        store = cls(path, slots)
+        latest = store.latest()
+        store.sequence = latest[0] if latest else 0
+        for name in os.listdir(path):
+            sequence = name.split('.')[0]
+            if name.startswith(TMP_PREFIX) or (
+                    sequence.isdigit() and
+                    int(sequence) <= store.sequence - slots):
+                os.remove(os.path.join(path, name))
+        return store
+
+    def frame_path(self, name):
+        """ Path to a frame of the store.
+
+        :param name: file name of the frame
+        :return: path to the frame file
+        """
+        return os.path.join(self.path, name)
+
+    def publish(self, image, image_format, timestamp):
+        """ Save the next frame and make it the latest one.
+
+        :param image: bytes of the encoded image
+        :param image_format: image format, used as the file extension
+        :param timestamp: capture time of the frame, in seconds
+        :return: (sequence number, file name of the frame)
+        """
+        self.sequence += 1
+        name = '{:010d}.{}'.format(self.sequence, image_format)
+        self._write(name, image)
+        self._write(LATEST_FILE, '{} {} {!r}'.format(
+            self.sequence, name, timestamp).encode('ascii'))
+
+        expired = self.sequence - self.slots
+        if expired > 0:
+            try:
+                os.remove(self.frame_path('{:010d}.{}'.format(expired,
+                                                              image_format)))
+            except OSError:
+                pass
+        return self.sequence, name
+
+    def latest(self):
+        """ Find the latest frame.
+
+        :return: (sequence number, file name of the frame, timestamp)
+                 or None if there are no frames
+        """
+        try:
+            with open(self.frame_path(LATEST_FILE), 'rb') as f_latest:
+                sequence, name, timestamp = f_latest.read().decode(
+                    'ascii').split()
+        except (IOError, OSError, ValueError):
+            return None
+        return int(sequence), name, float(timestamp)
+
+    def _write(self, name, data):
+        """ Write a file atomically: to a temporary file, then rename it.
+
+        :param name: file name
+        :param data: bytes to write
+        """
+        tmp_path = self.frame_path(TMP_PREFIX + name)
+        with open(tmp_path, 'wb') as f_out:
+            f_out.write(data)
+        os.rename(tmp_path, self.frame_path(name))
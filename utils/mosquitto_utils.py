@@ -71,3 +71,91 @@ def start_messages_consumption(client_id, topic, out_queue, event_queue,
     worker.setDaemon(True)
     worker.start()
     return worker
+
+
+class MqttPublisher:
+    """ Publisher holding a persistent Mosquitto connection.
+
+    Network traffic is handled by a background thread of the client, which
+    also reconnects after connection losses.  `publish` only queues
+    a message and never waits for the broker.
+
+    With QoS 0 messages published while there is no connection are dropped.
+    With QoS 1 they are kept (up to `max_queued` of them) and sent after
+    reconnection, while at most `max_inflight` messages wait for
+    acknowledgement at a time.
+    """
+    def __init__(self, client_id, host='localhost', port=1883, qos=0,
+                 max_inflight=20, max_queued=1000, keepalive=60):
+        """
+        :param client_id: client id (string)
+        :param host: Mosquitto host
+        :param port: Mosquitto port
+        :param qos: QoS level of published messages (0 or 1)
+        :param max_inflight: maximum number of QoS 1 messages waiting for
+            acknowledgement
+        :param max_queued: maximum number of QoS 1 messages kept while
+            waiting for the connection or the in-flight window
+        :param keepalive: keepalive interval, in seconds
+        """
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.qos = qos
+        self.keepalive = keepalive
+        self.dropped = 0
+        self._client = mqtt.Client(client_id=client_id, clean_session=True,
+                                   userdata={'client_id': client_id})
+        self._client.on_connect = self.__on_connect
+        self._client.on_disconnect = self.__on_disconnect
+        self._client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self._client.max_inflight_messages_set(max_inflight)
+        self._client.max_queued_messages_set(max_queued)
+
+    @staticmethod
+    def __on_connect(_client, userdata, _flags, code):
+        if code != 0:
+            logger.info('Connection failed. Not valid return code %s', code)
+        else:
+            logger.info('Connected. Publishing as %s', userdata['client_id'])
+
+    @staticmethod
+    def __on_disconnect(_client, userdata, code):
+        logger.info('Disconnection with return code %s, for publisher %s',
+                    code, userdata['client_id'])
+
+    def start(self):
+        """ Start connecting and the network thread.
+
+        :return: the publisher itself
+        """
+        self._client.connect_async(self.host, self.port, self.keepalive)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        """ Disconnect and stop the network thread.
+        """
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def publish(self, topic, payload, retain=False):
+        """ Queue a message for publishing.
+
+        :param topic: topic name
+        :param payload: message payload (string or bytes)
+        :param retain: whether the broker should retain the message
+        :return: True if the message was queued and False if it was dropped
+        """
+        code = self._client.publish(topic, payload=payload, qos=self.qos,
+                                    retain=retain).rc
+        # QoS 1 messages are kept until reconnection
+        queued = (code == mqtt.MQTT_ERR_SUCCESS or
+                  (code == mqtt.MQTT_ERR_NO_CONN and self.qos > 0))
+        if not queued:
+            self.dropped += 1
+            logger.warning('Dropped a message for topic %s: %s, dropped '
+                           'messages so far: %s', topic,
+                           mqtt.error_string(code), self.dropped)
+            return False
+        return True
@@ -2,19 +2,38 @@
 FFmpeg launcher/wrapper.
 
 Runs FFmpeg command to consume a video stream and break it to images.
+
+With "output" set to "store" in the configuration, FFmpeg outputs images
+to a pipe and they are published into a frame store (see
+utils/frame_store.py), so readers find the latest complete image at once.
+
+With "output" set to "ring" in the configuration, FFmpeg outputs raw frames
+to a pipe instead and they are written into a shared frame ring (see
+utils/frame_ring.py), so no image is encoded or decoded on the way to the
+model.
 """
 
 import datetime
 import json
 import logging
 import os
+import struct
 import subprocess
 import sys
+import time
 
+from utils.frame_ring import FrameRing
+from utils.frame_store import FrameStore
 from utils.logging_utils import create_logger
 
 logger = create_logger('ffmpeg_launcher')
 
+# FFmpeg encoders of image formats supported by the frame store
+STORE_CODECS = {
+    'jpg': 'mjpeg',
+    'png': 'png'
+}
+
 
 def init_logger():
     """ Initialize a logger.
@@ -64,10 +83,32 @@ def init_configuration():
         raise RuntimeError('Output dir is not specified. Define '
                            'IMAGES_OUTPUT_DIR environment variable')
 
-    json_config['output_sub_dir'] = datetime.datetime.now().isoformat()
-    os.mkdir('{}/{}'.format(json_config['output_dir'], json_config['output_sub_dir']))
-    logger.info('Images output dir - %s/%s',
-                json_config['output_dir'], json_config['output_sub_dir'])
+    json_config.setdefault('output', 'images')
+    if json_config['output'] == 'ring':
+        json_config.setdefault('ring_file', 'frame_ring.bin')
+        json_config.setdefault('ring_slots', 16)
+        json_config.setdefault('width', 1920)
+        json_config.setdefault('height', 1080)
+        logger.info('Frames output ring - %s/%s, %s frames of %sx%s',
+                    json_config['output_dir'], json_config['ring_file'],
+                    json_config['ring_slots'], json_config['width'],
+                    json_config['height'])
+        return json_config
+
+    if json_config['output'] == 'store':
+        json_config.setdefault('store_dir', 'frames')
+        json_config.setdefault('store_slots', 32)
+        if json_config['image_format'] not in STORE_CODECS:
+            raise RuntimeError('Frame store supports only {} images'.format(
+                ', '.join(sorted(STORE_CODECS))))
+        logger.info('Frames output store - %s/%s, %s frames',
+                    json_config['output_dir'], json_config['store_dir'],
+                    json_config['store_slots'])
+    else:
+        json_config['output_sub_dir'] = datetime.datetime.now().isoformat()
+        os.mkdir('{}/{}'.format(json_config['output_dir'], json_config['output_sub_dir']))
+        logger.info('Images output dir - %s/%s',
+                    json_config['output_dir'], json_config['output_sub_dir'])
 
     json_config['quality'] = ('-qscale:v {}'.format(json_config['quality'])
                               if 'quality' in json_config else '')
@@ -92,12 +133,154 @@ def run_ffmpeg(config):
     subprocess.call(cli, shell=True)
 
 
+def run_ffmpeg_to_ring(config):
+    """ Start extracting raw frames from a stream into the frame ring.
+
+    :param config: dict of configuration values
+    """
+    width, height = config['width'], config['height']
+    ring = FrameRing.create(
+        os.path.join(config['output_dir'], config['ring_file']),
+        width, height, config['ring_slots'])
+    cli = ('ffmpeg -loglevel info {ffmpeg_configurations} -i "{video_url}" '
+           '-map 0:0 -r {frame_rate} -s {width}x{height} -f rawvideo '
+           '-pix_fmt bgr24 pipe:1'.format(
+               ffmpeg_configurations=config.get('ffmpeg_configurations', ''),
+               video_url=config['video_url'], frame_rate=config['frame_rate'],
+               width=width, height=height))
+
+    process = subprocess.Popen(cli, shell=True, stdout=subprocess.PIPE,
+                               bufsize=ring.frame_size)
+    try:
+        while True:
+            frame = process.stdout.read(ring.frame_size)
+            if len(frame) < ring.frame_size:
+                break
+            ring.write(frame, time.time())
+    finally:
+        process.stdout.close()
+        process.wait()
+        ring.close()
+
+
+class ImageReader(object):
+    """ Splits a stream of concatenated JPEG or PNG images.
+    """
+    def __init__(self, stream, image_format):
+        """
+        :param stream: file object of the stream
+        :param image_format: "jpg" or "png"
+        """
+        self.stream = stream
+        self.image_end = (self._jpeg_end if image_format == 'jpg'
+                          else self._png_end)
+        self.buffer = bytearray()
+
+    def read(self):
+        """ Read the next image.
+
+        :return: bytes of the image or None at the end of the stream
+        """
+        try:
+            end = self.image_end()
+        except EOFError:
+            return None
+
+        image = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return image
+
+    def _fill(self, size):
+        """ Read from the stream until the buffer has at least `size` bytes.
+
+        :param size: number of bytes
+        """
+        while len(self.buffer) < size:
+            # Takes whatever is available instead of waiting for a full chunk
+            chunk = os.read(self.stream.fileno(), 1 << 16)
+            if not chunk:
+                raise EOFError()
+            self.buffer += chunk
+
+    def _jpeg_end(self):
+        """ Find the end of the JPEG image at the start of the buffer.
+
+        :return: offset of the end of the image
+        """
+        # Segments with lengths up to the start of scan, then entropy-coded
+        # data, where 0xFF bytes are escaped, up to the end of image marker
+        position = 2
+        while True:
+            self._fill(position + 4)
+            marker = self.buffer[position + 1]
+            position += 2 + struct.unpack_from('>H', self.buffer,
+                                               position + 2)[0]
+            if marker == 0xDA:
+                break
+
+        while True:
+            end = self.buffer.find(b'\xff\xd9', position)
+            if end >= 0:
+                return end + 2
+            position = max(position, len(self.buffer) - 1)
+            self._fill(len(self.buffer) + 1)
+
+    def _png_end(self):
+        """ Find the end of the PNG image at the start of the buffer.
+
+        :return: offset of the end of the image
+        """
+        # Signature, then chunks up to IEND: length, type, data and CRC
+        position = 8
+        while True:
+            self._fill(position + 8)
+            length, kind = struct.unpack_from('>I4s', self.buffer, position)
+            position += 12 + length
+            if kind == b'IEND':
+                self._fill(position)
+                return position
+
+
+def run_ffmpeg_to_store(config):
+    """ Start extracting images from a stream into the frame store.
+
+    :param config: dict of configuration values
+    """
+    store = FrameStore.create(
+        os.path.join(config['output_dir'], config['store_dir']),
+        config['store_slots'])
+    cli = ('ffmpeg -loglevel info {ffmpeg_configurations} -i "{video_url}" '
+           '-map 0:0 -r {frame_rate} {quality} -f image2pipe -c:v {codec} '
+           'pipe:1'.format(
+               ffmpeg_configurations=config.get('ffmpeg_configurations', ''),
+               video_url=config['video_url'], frame_rate=config['frame_rate'],
+               quality=config['quality'],
+               codec=STORE_CODECS[config['image_format']]))
+
+    process = subprocess.Popen(cli, shell=True, stdout=subprocess.PIPE)
+    reader = ImageReader(process.stdout, config['image_format'])
+    try:
+        while True:
+            image = reader.read()
+            if image is None:
+                break
+            store.publish(image, config['image_format'], time.time())
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
 def main():
     """ Entry point.
     """
     init_logger()
     config = init_configuration()
-    run_ffmpeg(config)
+    if config['output'] == 'ring':
+        run_ffmpeg_to_ring(config)
+    elif config['output'] == 'store':
+        run_ffmpeg_to_store(config)
+    else:
+        run_ffmpeg(config)
 
 
 if __name__ == '__main__':